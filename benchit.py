@@ -0,0 +1,144 @@
+#!/usr/bin/python
+"""
+Benchmarks for SCSI-3 Persistent Group Reservations testing
+
+Description:
+ Measures how fast commands can be sent to a target using the
+ different ways the test suite has of sending them.
+
+Usage:
+ benchit.py [options] MODE DEVICE [DEVICE ...]
+
+ worker   -- compare commands/second for the long-lived per-device
+             worker against starting one process per command
+             (non-destructive: TEST UNIT READY, INQUIRY, READ KEYS)
+ contend  -- race conflicting PR OUT commands from one process per
+             device, checking the outcome from every device
+             (destructive: clears any PR state)
+ fleet    -- time PR commands as the number of registrants grows
+             from one to the number of devices
+             (destructive: clears any PR state)
+ ops      -- run each PR operation in a tight loop from each device,
+             reporting ops/sec and latency percentiles, optionally
+             also as JSON (destructive: clears any PR state)
+
+ These benchmarks need root access.
+"""
+
+
+__version__ = "Version 0.6"
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import json
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "tests"))
+
+from support.contention import races, runContention
+from support.fleet import Fleet, measureScaling, formatScaling
+from support.opbench import benchOps, runOpBench, formatOpBench
+from support.initiator import Initiator
+from support.reservation import ProutTypes
+from support.transport import SgPersistTransport
+from support.worker import Worker, WorkerTransport
+
+
+################################################################
+
+def rate(count, fn):
+    """Call fn count times, returning calls per second"""
+    start = time.time()
+    for i in xrange(count):
+        fn()
+    elapsed = time.time() - start
+    return count / elapsed
+
+def benchWorker(devs, opts):
+    """Compare the worker with spawning a command per request"""
+    dev = devs[0]
+    count = opts.count
+    spawn = SgPersistTransport(dev)
+    worker = Worker(dev)
+    wtrans = WorkerTransport(dev, worker=worker)
+    def queued():
+        for i in xrange(count):
+            worker.submit("tur")
+        worker.collect()
+    print "%-28s %12s %12s" % ("command", "spawn/sec", "worker/sec")
+    for (name, sfn, wfn) in [("TEST UNIT READY", spawn.tur, wtrans.tur),
+                             ("INQUIRY", spawn.inquirySn, wtrans.inquirySn),
+                             ("READ KEYS", spawn.readKeys, wtrans.readKeys)]:
+        print "%-28s %12.1f %12.1f" % (name, rate(count, sfn),
+                                       rate(count, wfn))
+    print "%-28s %12s %12.1f" % ("TEST UNIT READY (queued)", "-",
+                                 rate(1, queued) * count)
+    worker.close()
+
+def benchContend(devs, opts):
+    """Race PR OUT commands from every device"""
+    if len(devs) < 2:
+        raise SystemExit("contend needs at least two devices")
+    inits = [Initiator(devs[i], "0x%x" % (0xc0de00 + i))
+             for i in range(len(devs))]
+    race = races[opts.race](ProutTypes[opts.prout_type])
+    print runContention(inits, race, opts.count).format()
+
+def benchFleet(devs, opts):
+    """Time PR commands against the number of registrants"""
+    print formatScaling(measureScaling(Fleet(devs), samples=opts.count))
+
+def benchOpsMode(devs, opts):
+    """Loop each PR operation, from each device"""
+    ops = None
+    if opts.ops:
+        ops = opts.ops.split(",")
+    results = runOpBench(Fleet(devs), duration=opts.duration, ops=ops,
+                         rtype=ProutTypes[opts.prout_type])
+    print formatOpBench(results)
+    if opts.json:
+        f = open(opts.json, "w")
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.close()
+
+modes = {
+    "worker" : benchWorker,
+    "contend" : benchContend,
+    "fleet" : benchFleet,
+    "ops" : benchOpsMode,
+    }
+
+def main():
+    parser = OptionParser(usage="%prog [options] MODE DEVICE [DEVICE ...]")
+    parser.add_option("-n", "--count", type="int", default=200,
+                      help="number of commands (or rounds) per "
+                      "measurement [%default]")
+    parser.add_option("-r", "--race", default="reserve",
+                      choices=sorted(races.keys()),
+                      help="contend: which race to run [%default]")
+    parser.add_option("-t", "--prout-type", default="WriteExclusive",
+                      choices=sorted(ProutTypes.keys()),
+                      help="contend, ops: reservation type [%default]")
+    parser.add_option("-d", "--duration", type="float", default=2.0,
+                      help="ops: seconds per operation and device "
+                      "[%default]")
+    parser.add_option("-O", "--ops", default=None,
+                      help="ops: comma-separated operations to run (%s)"
+                      % ", ".join(sorted(benchOps.keys())))
+    parser.add_option("-j", "--json", default=None, metavar="FILE",
+                      help="ops: also write the results to FILE as JSON")
+    (opts, args) = parser.parse_args()
+    if len(args) < 2 or args[0] not in modes:
+        parser.error("need a MODE (%s) and a DEVICE" %
+                     ", ".join(sorted(modes.keys())))
+    if os.geteuid() != 0:
+        print >>sys.stderr, "Fatal: must be root to run this script\n"
+        sys.exit(1)
+    modes[args[0]](args[1:], opts)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+"""
+Sharded test runner for SCSI-3 Persistent Group Reservations testing
+
+Description:
+ Runs the test modules in parallel, each on its own LUN from a pool,
+ and merges the results into one report. The modules still run one
+ at a time on each LUN, since they share the PR state there.
+
+Usage:
+ shardit.py [options] [MODULE ...]
+
+ The pool is given with "-p", or by PGR_LUN_POOL, as LUNs separated
+ by ";", each a list of devices (one per initiator, as for
+ PGR_DEVICES), e.g.:
+
+    shardit.py -p "/dev/sdc,/dev/sdd,/dev/sde; /dev/sdf,/dev/sdg,/dev/sdh"
+
+ By default the Registration and Reservation modules are run.
+"""
+
+
+__version__ = "Version 0.6"
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "tests"))
+
+from support import config
+from support.shard import SuiteModules, parsePool, runShards, \
+     formatShardReport
+
+
+def main():
+    parser = OptionParser(usage="%prog [options] [MODULE ...]")
+    parser.add_option("-p", "--pool", default=config.lun_pool,
+                      help="the LUN pool [PGR_LUN_POOL, or PGR_DEVICES]")
+    parser.add_option("-v", "--verbose", action="store_true", default=False,
+                      help="also show each module's output")
+    (opts, args) = parser.parse_args()
+    pool = parsePool(opts.pool or " ".join(config.devices))
+    if not pool:
+        parser.error("need a pool of LUNs")
+    modules = args or SuiteModules
+    start = time.time()
+    summaries = runShards(pool, modules)
+    if opts.verbose:
+        for s in summaries:
+            print "==== %s ====\n%s" % (s["module"], s["output"])
+    print formatShardReport(summaries, time.time() - start)
+    for s in summaries:
+        if s["failures"] or s["errors"]:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
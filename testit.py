@@ -39,5 +39,10 @@ import os
 import unittest
 import nose
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "tests"))
+
+from support.timingplugin import CmdTiming
+
 if __name__ == '__main__':
-    nose.main()
+    nose.main(addplugins=[CmdTiming()])
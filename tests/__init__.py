@@ -14,4 +14,28 @@ __all__ = [
     "testReserveWERO",
     "testReserveEAAR",
     "testReserveWEAR",
+    "testMatrix",
+    "testSgIo",
+    "testProbe",
+    "testWorker",
+    "testPrIn",
+    "testParallel",
+    "testContention",
+    "testFleet",
+    "testOpBench",
+    "testTiming",
+    "testVisibility",
+    "testFixture",
+    "testPreflight",
+    "testShard",
+    "testEmulator",
+    "testTranscript",
+    "testUa",
+    "testRetry",
+    "testDeadline",
+    "testSweep",
+    "testLoad",
+    "testIoLoad",
+    "testFencing",
+    "testPattern",
     ]
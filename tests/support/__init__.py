@@ -14,6 +14,7 @@ __all__ = [
     'initB',
     'initC',
     'set_up_module',
+    'makeTransport',
     ]
 
 
@@ -0,0 +1,39 @@
+#!/usr/bin/python
+"""
+clock -- monotonic timestamps for PGR testing
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import ctypes
+import ctypes.util
+import time
+
+
+__all__ = [
+    'monotonicNs',
+    ]
+
+
+CLOCK_MONOTONIC = 1
+
+class Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+try:
+    _librt = ctypes.CDLL(ctypes.util.find_library("rt") or
+                         ctypes.util.find_library("c"), use_errno=True)
+    _clock_gettime = _librt.clock_gettime
+    _clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+except (OSError, AttributeError):
+    _clock_gettime = None
+
+
+def monotonicNs():
+    """Return a monotonic timestamp, in nanoseconds"""
+    if _clock_gettime is None:
+        return int(time.time() * 1000000000)
+    ts = Timespec()
+    _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts))
+    return ts.tv_sec * 1000000000 + ts.tv_nsec
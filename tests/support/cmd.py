@@ -4,9 +4,16 @@ cmd -- Command module for PGR testing
 """
 
 
+import os
+import sys
+import signal
 import subprocess
 import logging
 
+import timing
+from clock import monotonicNs
+from deadline import watchdog, deviceOf
+
 
 __author__ = "Lee Duncan <leeman.duncan@gmail.com>"
 
@@ -23,25 +30,42 @@ log = logging.getLogger('nose.user')
 ################################################################
 
 class RunResult:
-    def __init__(self, lines=None, result=None):
+    def __init__(self, lines=None, result=None, elapsed_ns=0, output=None):
         self.lines = lines
         self.result = result
-    
+        self.elapsed_ns = elapsed_ns
+        # what it printed, even if it failed (when lines is None)
+        self.output = output
+
 def runCmdWithOutput(cmd):
     """Run the supplied command array, returning array result"""
     log.debug("Running command: %s" % cmd)
+    start = monotonicNs()
+    # in a process group of its own, so that if it hangs, killing the
+    # group ends its output, even if it has children holding it open
     subproc = subprocess.Popen(cmd,
                                stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT)
+                               stderr=subprocess.STDOUT,
+                               preexec_fn=os.setpgrp)
+    watch = watchdog.start(deviceOf(cmd), " ".join(cmd),
+                           lambda: os.killpg(subproc.pid, signal.SIGKILL))
     lines = []
-    for line in subproc.stdout.xreadlines():
-        log.debug("Adding output=/%s/" % line.rstrip())
-        lines.append(line.rstrip())
-    xit_val = subproc.wait()
+    try:
+        for line in subproc.stdout.xreadlines():
+            log.debug("Adding output=/%s/" % line.rstrip())
+            lines.append(line.rstrip())
+        xit_val = subproc.wait()
+    finally:
+        watchdog.finish(watch)
+    end = monotonicNs()
+    output = lines
     if xit_val:
         log.debug("Error: process returned: %d" % xit_val)
         lines = None
-    return RunResult(lines, xit_val)
+    if timing.enabled:
+        timing.record("cmd", os.path.basename(cmd[0]), cmd[-1], None,
+                      start, end, xit_val)
+    return RunResult(lines, xit_val, end - start, output)
 
 def verifyCmdExists(cmd):
     """Verify that the command exists"""
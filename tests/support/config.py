@@ -0,0 +1,158 @@
+#!/usr/bin/python
+"""
+config -- run-time configuration for PGR testing
+
+Settings are taken from the environment, so that they can be given
+on the nosetests command line, e.g.:
+
+    PGR_TRANSPORT=sg_persist nosetests -v tests.testRegister
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+
+
+__all__ = [
+    'getSetting',
+    'devices',
+    'lun_pool',
+    'transport',
+    'io_engine',
+    'contention_rounds',
+    'fleet_samples',
+    'cmd_timing',
+    'visibility_deadline',
+    'preflight_cache',
+    'oracle',
+    'record',
+    'replay',
+    'replay_timing',
+    'retry_policy',
+    'cmd_deadline',
+    'access_sweep',
+    'sweep_random',
+    'sweep_lbas',
+    'sweep_seed',
+    'load_depth',
+    'load_interval',
+    'load_writes',
+    'load_engine',
+    'fence_reps',
+    'fence_window',
+    'verify_writes',
+    ]
+
+
+def getSetting(name, default=None):
+    """Get a PGR_* setting from the environment"""
+    return os.environ.get("PGR_" + name.upper(), default)
+
+
+# The devices to test: each must be the same LUN, seen through its
+# own I_T nexus (e.g. one iSCSI session per device). The first three
+# are initA, initB, and initC; the fleet tests use all of them.
+devices = getSetting("devices", "/dev/sdc /dev/sdd /dev/sde").replace(
+    ",", " ").split()
+
+# A pool of LUNs for shardit.py to run modules on in parallel: LUNs
+# separated by ";", each a list of devices as for PGR_DEVICES
+lun_pool = getSetting("lun_pool", "")
+
+# How SCSI commands get to the devices: "sgio" (native SG_IO ioctl),
+# "worker" (SG_IO, from a long-lived process per device),
+# "sg_persist" (run the sg3_utils commands), or "emulator" (an
+# in-process emulated target, needing no devices)
+transport = getSetting("transport", "sgio")
+
+# How read/write access probes are done: "direct" (in-process, using
+# O_DIRECT), "worker" (O_DIRECT, from a long-lived process per
+# device), "dd" (run the dd command), or "emulator" (the default
+# with the emulator transport)
+if transport == "emulator":
+    io_engine = getSetting("io_engine", "emulator")
+else:
+    io_engine = getSetting("io_engine", "direct")
+
+# How many rounds each contention (race) test runs
+contention_rounds = int(getSetting("contention_rounds", "20"))
+
+# How many times each command is timed per fleet size
+fleet_samples = int(getSetting("fleet_samples", "10"))
+
+# Set to 1 to record and report how long each command takes
+cmd_timing = getSetting("cmd_timing", "0") not in ("0", "")
+
+# How long (in seconds) a PR state change may take to be seen from
+# every initiator
+visibility_deadline = float(getSetting("visibility_deadline", "5"))
+
+# A file to remember passed preflight checks in, across runs (none by
+# default)
+preflight_cache = getSetting("preflight_cache", "")
+
+# Set to 1 to also send every command to an emulated target, and
+# report where the device's behavior differs from it
+oracle = getSetting("oracle", "0") not in ("0", "")
+
+# A transcript file to append every command sent (and its outcome)
+# to, or to answer every command from instead of the devices (none by
+# default)
+record = getSetting("record", "")
+replay = getSetting("replay", "")
+
+# Set to 1 to have replayed commands take as long as they did when
+# recorded
+replay_timing = getSetting("replay_timing", "0") not in ("0", "")
+
+# Changes to how failed commands are retried (see retry.py), e.g.
+# "busy=10:1:500", or "none" for no retries
+retry_policy = getSetting("retry_policy", "")
+
+# How long (in seconds) any one command may take before it is taken
+# to have hung (0 for no limit)
+cmd_deadline = float(getSetting("cmd_deadline", "30"))
+
+# Set to 1 to have each read and write probe sweep regions across the
+# whole LUN (see sweep.py), instead of touching just one block
+access_sweep = getSetting("access_sweep", "0") not in ("0", "")
+
+# How many regions, at random offsets, an access sweep adds; the
+# seed to choose them from (random, and reported, by default); and
+# any more to add, as "lba[:nblocks],..." (negative LBAs counting back
+# from the end of the LUN)
+sweep_random = int(getSetting("sweep_random", "8"))
+sweep_seed = getSetting("sweep_seed", "")
+sweep_lbas = getSetting("sweep_lbas", "")
+
+# How many reads and writes the I/O load (see load.py) keeps in flight
+# per initiator, how often (in seconds) it reports, and what percent
+# of them are writes
+load_depth = int(getSetting("load_depth", "8"))
+load_interval = float(getSetting("load_interval", "1"))
+load_writes = int(getSetting("load_writes", "50"))
+
+# How the I/O load is generated: "aio" (native asynchronous I/O),
+# "threads" (a pool of threads doing probes), or "auto" (aio, if it
+# can be used)
+load_engine = getSetting("load_engine", "auto")
+
+# How many times testFencing fences the victim per reservation type,
+# and how long (in seconds) the victim may keep writing after that
+fence_reps = int(getSetting("fence_reps", "10"))
+fence_window = float(getSetting("fence_window", "2"))
+
+# Set to 1 to have each write probe write a self-describing pattern
+# (see pattern.py), and check by reading it back that it reached the
+# media if, and only if, the write was allowed
+verify_writes = getSetting("verify_writes", "0") not in ("0", "")
+
+# Only these I/O engines can write patterns and read them back, and
+# neither a transcript's probes nor a worker's carry the data
+PATTERN_IO_ENGINES = ("direct", "emulator")
+if verify_writes and (io_engine not in PATTERN_IO_ENGINES or
+                      record or replay):
+    raise ValueError("PGR_VERIFY_WRITES needs PGR_IO_ENGINE set to %s, "
+                     "and cannot be used with PGR_RECORD or PGR_REPLAY" %
+                     " or ".join(PATTERN_IO_ENGINES))
@@ -0,0 +1,397 @@
+#!/usr/bin/python
+"""
+contention -- race conflicting PR OUT commands from several initiators
+
+Each contending initiator runs in its own process (or thread, for
+the emulator, whose target lives in this process). For every round,
+the coordinator (the calling process) sets up the PR state, and then
+all contenders are released at once by a shared barrier, each firing
+one PR OUT command. Once they are all done, the coordinator reads the
+resulting state from every nexus, and checks that:
+
+ - every nexus sees the same state
+ - the state agrees with which commands succeeded (the "winners")
+ - the losers got RESERVATION CONFLICT
+
+The outcome of each attempt (winner, conflict, or other error) and its
+latency are recorded per initiator.
+
+A contender that fails (e.g. cannot open its device, or gets an
+exception) says so through the results queue, and one that hangs is
+given up on after roundTimeout(): either way the barrier is aborted,
+and the run ends with the failure as a problem, rather than waiting
+for ever.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import Queue
+import multiprocessing
+import multiprocessing.dummy
+import logging
+
+import config
+from clock import monotonicNs
+from initiator import Initiator
+from parallel import callEach
+from reservation import AllRegistrantsTypes, keyToStr
+from sense import ExitCat
+from stats import summarize, formatSummary
+from ua import tracker
+
+
+__all__ = [
+    'Barrier',
+    'ReserveRace',
+    'PreemptRace',
+    'RegisterRace',
+    'ContentionReport',
+    'runContention',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+MAX_PROBLEMS = 20
+
+# how long, beyond the command deadline (allowing for a retry), the
+# contenders may take to get to the barrier, e.g. starting up
+START_SLACK = 10.0
+
+
+def roundTimeout():
+    """How long (in seconds) to wait for the contenders, or None to
+    wait for ever (if commands have no deadline)"""
+    if config.cmd_deadline <= 0:
+        return None
+    return 2 * config.cmd_deadline + START_SLACK
+
+
+class Barrier:
+    """A barrier shared between processes: wait() returns only once
+    all parties have called it, or the barrier has been aborted"""
+    def __init__(self, parties):
+        self.parties = parties
+        self.cond = multiprocessing.Condition()
+        self.count = multiprocessing.Value('i', 0, lock=False)
+        self.generation = multiprocessing.Value('i', 0, lock=False)
+        self.broken = multiprocessing.Value('i', 0, lock=False)
+
+    def wait(self, timeout=None):
+        """Wait for all parties, returning True, or False if the barrier
+        is aborted first (as it is if timeout seconds pass)"""
+        self.cond.acquire()
+        try:
+            if self.broken.value:
+                return False
+            gen = self.generation.value
+            self.count.value += 1
+            if self.count.value == self.parties:
+                self.count.value = 0
+                self.generation.value += 1
+                self.cond.notify_all()
+                return True
+            if timeout is not None:
+                deadline = monotonicNs() + int(timeout * 1e9)
+            while gen == self.generation.value and not self.broken.value:
+                if timeout is None:
+                    self.cond.wait()
+                    continue
+                left = (deadline - monotonicNs()) / 1e9
+                if left <= 0:
+                    self.broken.value = 1
+                    self.cond.notify_all()
+                    break
+                self.cond.wait(left)
+            return gen != self.generation.value
+        finally:
+            self.cond.release()
+
+    def abort(self):
+        """Release everyone waiting, now and from now on, with False"""
+        self.cond.acquire()
+        try:
+            self.broken.value = 1
+            self.cond.notify_all()
+        finally:
+            self.cond.release()
+
+
+################################################################
+# Scenarios: each says how to set up a round, what each contender
+# fires, and what the outcome must look like
+
+class Race:
+    """Base class for contention scenarios"""
+    name = None
+
+    def __init__(self, prout_type):
+        self.prout_type = prout_type
+
+    def reset(self, inits):
+        """Set up the PR state for a round (from the coordinator)"""
+        if inits[0].clear() != 0:
+            # not registered, so could not clear
+            inits[0].register()
+            inits[0].clear()
+        callEach(inits, "clearUa")
+        callEach(inits, "register")
+        callEach(inits, "clearUa")
+
+    def fire(self, init, idx, keys):
+        """Fire this contender's command, returning its result"""
+        raise NotImplementedError
+
+    def check(self, keys, results, snap):
+        """Return a list of problems with the outcome of a round"""
+        raise NotImplementedError
+
+
+class ReserveRace(Race):
+    """All registrants try to RESERVE at once: exactly one should win
+    (or, for All Registrants types, all should)"""
+    name = "reserve"
+
+    def fire(self, init, idx, keys):
+        return init.reserve(self.prout_type)
+
+    def check(self, keys, results, snap):
+        problems = []
+        winners = [i for i in range(len(results)) if results[i] == 0]
+        if int(self.prout_type) in AllRegistrantsTypes:
+            if len(winners) != len(results):
+                problems.append("not all registrants could reserve")
+            if snap.key != keyToStr(0):
+                problems.append("reservation key is %s" % snap.key)
+            return problems
+        if len(winners) != 1:
+            problems.append("%d winners" % len(winners))
+        elif snap.key != keys[winners[0]]:
+            problems.append("winner %s but holder %s" %
+                            (keys[winners[0]], snap.key))
+        for i in range(len(results)):
+            if i not in winners and results[i] != ExitCat["ResConflict"]:
+                problems.append("loser %s got %d" % (keys[i], results[i]))
+        return problems
+
+
+class PreemptRace(Race):
+    """Each registrant preempts the next one at once: those that win
+    remove their victims, those that lose were removed first"""
+    name = "preempt"
+
+    def reset(self, inits):
+        Race.reset(self, inits)
+        inits[0].reserve(self.prout_type)
+
+    def fire(self, init, idx, keys):
+        return init.preempt(keys[(idx + 1) % len(keys)], self.prout_type)
+
+    def check(self, keys, results, snap):
+        problems = []
+        winners = [i for i in range(len(results)) if results[i] == 0]
+        if not winners:
+            problems.append("no winners")
+        for i in range(len(results)):
+            victim = keys[(i + 1) % len(keys)]
+            if i in winners and snap.isRegistered(victim):
+                problems.append("%s preempted %s, which is still registered"
+                                % (keys[i], victim))
+            if i not in winners:
+                # a loser already preempted may be told so first
+                if results[i] not in (ExitCat["ResConflict"],
+                                      ExitCat["UnitAttention"]):
+                    problems.append("loser %s got %d" % (keys[i], results[i]))
+                elif snap.isRegistered(keys[i]):
+                    problems.append("loser %s is still registered" % keys[i])
+        if snap.key is not None and snap.key != keyToStr(0) and \
+               not snap.isRegistered(snap.key):
+            problems.append("holder %s is not registered" % snap.key)
+        return problems
+
+
+class RegisterRace(Race):
+    """All initiators REGISTER at once: all should succeed"""
+    name = "register"
+
+    def reset(self, inits):
+        Race.reset(self, inits)
+        callEach(inits, "unregister")
+        callEach(inits, "clearUa")
+
+    def fire(self, init, idx, keys):
+        return init.register()
+
+    def check(self, keys, results, snap):
+        problems = []
+        for i in range(len(results)):
+            if results[i] != 0:
+                problems.append("%s could not register: %d" %
+                                (keys[i], results[i]))
+            if not snap.isRegistered(keys[i]):
+                problems.append("%s is not registered" % keys[i])
+        return problems
+
+
+races = {
+    "reserve" : ReserveRace,
+    "preempt" : PreemptRace,
+    "register" : RegisterRace}
+
+
+################################################################
+
+class ContentionReport:
+    """The outcome of a contention run"""
+    def __init__(self, race, keys):
+        self.race = race
+        self.keys = keys
+        self.rounds = 0
+        self.wins = [0] * len(keys)
+        self.conflicts = [0] * len(keys)
+        self.errors = [0] * len(keys)
+        self.latencies = [[] for k in keys]
+        self.inconsistent = 0
+        self.bad_rounds = 0
+        self.problems = []
+
+    def addRound(self, results, latencies, snaps, problems):
+        """Record the outcome of one round"""
+        self.rounds += 1
+        for i in range(len(results)):
+            if results[i] == 0:
+                self.wins[i] += 1
+            elif results[i] == ExitCat["ResConflict"]:
+                self.conflicts[i] += 1
+            else:
+                self.errors[i] += 1
+            if latencies[i] is not None:
+                self.latencies[i].append(latencies[i])
+        if None in snaps:
+            problems = problems + ["could not read state from every nexus"]
+        else:
+            states = set([(s.generation, tuple(sorted(s.registrants)),
+                           s.key, s.rtype) for s in snaps])
+            if len(states) != 1:
+                self.inconsistent += 1
+                problems = problems + ["nexuses disagree: %s" % states]
+        if problems:
+            self.bad_rounds += 1
+            if len(self.problems) < MAX_PROBLEMS:
+                self.problems.append("round %d: %s" %
+                                     (self.rounds, "; ".join(problems)))
+
+    def format(self):
+        """Format the report for display"""
+        lines = ["%s race: %d rounds, %d bad, %d inconsistent" %
+                 (self.race.name, self.rounds, self.bad_rounds,
+                  self.inconsistent)]
+        for i in range(len(self.keys)):
+            lines.append("  %-18s wins=%-6d conflicts=%-6d errors=%-6d %s" %
+                         (self.keys[i], self.wins[i], self.conflicts[i],
+                          self.errors[i],
+                          formatSummary(summarize(self.latencies[i]))))
+        lines.extend(["  " + p for p in self.problems])
+        return "\n".join(lines)
+
+
+def contender(idx, dev, key, race, keys, rounds, barrier, queue):
+    """The body of each contending process, putting (idx, result,
+    latency, error) on the queue for each round"""
+    try:
+        init = Initiator(dev, key)
+    except Exception, e:
+        queue.put((idx, None, None, "%s: %s" % (dev, e)))
+        barrier.abort()
+        return
+    for r in xrange(rounds):
+        if not barrier.wait():
+            return
+        start = monotonicNs()
+        try:
+            ret = (idx, race.fire(init, idx, keys), monotonicNs() - start,
+                   None)
+        except Exception, e:
+            log.debug("contender %s failed: %s" % (dev, e))
+            ret = (idx, None, None, "%s: %s: %s" % (dev, race.name, e))
+        queue.put(ret)
+        if not barrier.wait():
+            return
+
+def collectRound(queue, count, timeout):
+    """Collect the contenders' results for a round, returning (results,
+    latencies, failures), with any missing result taken to be an
+    error"""
+    results = [ExitCat["Other"]] * count
+    latencies = [None] * count
+    failures = []
+    got = set()
+    for i in range(count):
+        try:
+            (idx, result, latency, error) = queue.get(timeout=timeout)
+        except Queue.Empty:
+            break
+        got.add(idx)
+        if error is not None:
+            failures.append("contender failed: %s" % error)
+        else:
+            results[idx] = result
+            latencies[idx] = latency
+    for idx in range(count):
+        if idx not in got:
+            failures.append("contender %d did not report" % idx)
+    return (results, latencies, failures)
+
+def runContention(inits, race, rounds, observers=()):
+    """Race the initiators (which must have keys) against each other
+    for a number of rounds, checking the outcome from every nexus
+    (including the observers), and returning a ContentionReport"""
+    keys = [i.key for i in inits]
+    barrier = Barrier(len(inits) + 1)
+    if config.transport == "emulator":
+        mp = multiprocessing.dummy
+    else:
+        mp = multiprocessing
+    queue = mp.Queue()
+    procs = []
+    for idx in range(len(inits)):
+        p = mp.Process(target=contender,
+                       args=(idx, inits[idx].dev, keys[idx],
+                             race, keys, rounds, barrier, queue))
+        p.daemon = True
+        p.start()
+        procs.append(p)
+    report = ContentionReport(race, keys)
+    all_inits = list(inits) + list(observers)
+    timeout = roundTimeout()
+    for r in xrange(rounds):
+        race.reset(inits)
+        # ready, set, go; then all done
+        finished = barrier.wait(timeout) and barrier.wait(timeout)
+        # the commands were sent by other Initiators (maybe in other
+        # processes), so we cannot know which Unit Attentions they left
+        tracker.expect([i.dev for i in all_inits])
+        wait = timeout
+        if not finished:
+            # whatever failure there was has been reported by now
+            wait = 1.0
+        (results, latencies, failures) = collectRound(queue, len(inits),
+                                                      wait)
+        problems = list(failures)
+        if not finished:
+            problems.append("contenders did not finish the round")
+        snaps = callEach(all_inits, "snapshot")
+        if snaps[0] is not None and not problems:
+            problems = race.check(keys, results, snaps[0])
+        report.addRound(results, latencies, snaps, problems)
+        log.debug("round %d: results=%s" % (r, results))
+        if failures or not finished:
+            barrier.abort()
+            break
+    for p in procs:
+        p.join(timeout)
+    return report
@@ -0,0 +1,258 @@
+#!/usr/bin/python
+"""
+deadline -- catch commands that hang
+
+Every command sent (by SG_IO, direct I/O, a worker, or a child
+process such as sg_persist or dd) is watched. If one is still running
+PGR_CMD_DEADLINE seconds after it started (e.g. while an iSCSI session
+is being recovered), the watchdog:
+
+ - gathers diagnostics: the device, the command, how long it has been
+   running, and what sysfs says about the device and its iSCSI
+   session and connection
+ - cancels the command, if it can: child processes (including
+   workers) are killed. An SG_IO request is aborted by the kernel at
+   its own timeout, which is set no later than the deadline; an
+   ioctl (or direct I/O) still blocked after that cannot be
+   interrupted, so it is reported at once, and waited for.
+
+When the command does return, CommandHung is raised, which fails the
+test. All hangs are also summarized at the end of the run.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import glob
+import atexit
+import logging
+import threading
+
+import config
+from clock import monotonicNs
+
+
+__all__ = [
+    'CommandHung',
+    'Watch',
+    'Watchdog',
+    'watchdog',
+    'deviceOf',
+    'sessionState',
+    'formatDiagnostics',
+    'hangs',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+SYSFS = "/sys"
+
+# device attributes worth reporting
+DEVICE_ATTRS = ["state", "timeout", "iocounterbits", "iorequest_cnt",
+                "iodone_cnt", "ioerr_cnt"]
+SESSION_ATTRS = ["state", "targetname", "tpgt", "recovery_tmo",
+                 "abort_tmo", "lu_reset_tmo"]
+CONNECTION_ATTRS = ["state", "persistent_address", "persistent_port"]
+
+# diagnostics for every hang seen
+hangs = []
+
+
+class CommandHung(AssertionError):
+    """A command ran past its deadline"""
+    pass
+
+
+def readAttrs(path, attrs):
+    """Read the sysfs attributes there are of those given"""
+    found = {}
+    for attr in attrs:
+        try:
+            f = open(os.path.join(path, attr))
+            try:
+                found[attr] = f.read().strip()
+            finally:
+                f.close()
+        except IOError:
+            pass
+    return found
+
+def sessionState(dev, sysfs=SYSFS):
+    """Return what sysfs says about a device, and the iSCSI session
+    and connection(s) it is reached through, as a dict"""
+    state = {}
+    name = os.path.basename(os.path.realpath(dev))
+    for cls in ("block", "scsi_generic"):
+        sysdev = os.path.join(sysfs, "class", cls, name, "device")
+        if os.path.exists(sysdev):
+            break
+    else:
+        return state
+    state["device"] = readAttrs(sysdev, DEVICE_ATTRS)
+    # the session is one of the device's ancestors
+    session = [p for p in os.path.realpath(sysdev).split(os.sep)
+               if p.startswith("session")]
+    if not session:
+        return state
+    session = session[-1]
+    state["session"] = readAttrs(os.path.join(sysfs, "class",
+                                              "iscsi_session", session),
+                                 SESSION_ATTRS)
+    state["session"]["name"] = session
+    state["connections"] = []
+    for conn in sorted(glob.glob(os.path.join(
+        sysfs, "class", "iscsi_connection",
+        "connection%s:*" % session[len("session"):]))):
+        attrs = readAttrs(conn, CONNECTION_ATTRS)
+        attrs["name"] = os.path.basename(conn)
+        state["connections"].append(attrs)
+    return state
+
+def deviceOf(cmd):
+    """Guess which device a command line is for"""
+    for arg in reversed(cmd):
+        (name, sep, value) = arg.partition("=")
+        if sep and name in ("if", "of"):
+            arg = value
+        if arg.startswith("/dev/"):
+            return arg
+    return None
+
+def formatDiagnostics(diag):
+    lines = ["%s on %s hung: still running after %.3fs (deadline %.3fs)" %
+             (diag["what"], diag["dev"], diag["elapsed"], diag["deadline"])]
+    state = diag["state"]
+    if "device" in state:
+        lines.append("  device: %s" % state["device"])
+    if "session" in state:
+        lines.append("  iSCSI %s" % state["session"])
+        for conn in state["connections"]:
+            lines.append("  iSCSI %s" % conn)
+    elif diag["dev"]:
+        lines.append("  (no iSCSI session found in sysfs)")
+    return "\n".join(lines)
+
+
+class Watch:
+    """One command being watched"""
+    def __init__(self, dev, what, kill):
+        self.dev = dev
+        self.what = what
+        self.kill = kill
+        self.start = monotonicNs()
+        self.diag = None
+
+
+class Watchdog:
+    """Watches running commands, from a thread of its own, acting on
+    any that pass the deadline (PGR_CMD_DEADLINE, unless given)"""
+    def __init__(self, deadline=None, sysfs=SYSFS):
+        self.deadline = deadline
+        self.sysfs = sysfs
+        self.lock = threading.Lock()
+        self.watches = set()
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def getDeadline(self):
+        if self.deadline is None:
+            return config.cmd_deadline
+        return self.deadline
+
+    def start(self, dev, what, kill=None):
+        """Start watching a command, which kill() (if given) cancels"""
+        w = Watch(dev, what, kill)
+        self.lock.acquire()
+        try:
+            self.watches.add(w)
+            if self.thread is None:
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.monitor)
+                self.thread.setDaemon(True)
+                self.thread.start()
+        finally:
+            self.lock.release()
+        return w
+
+    def finish(self, w):
+        """Stop watching a command, raising CommandHung if it hung"""
+        self.lock.acquire()
+        try:
+            self.watches.discard(w)
+        finally:
+            self.lock.release()
+        if w.diag is not None:
+            w.diag["elapsed"] = (monotonicNs() - w.start) / 1e9
+            raise CommandHung(formatDiagnostics(w.diag))
+
+    def check(self):
+        """Act on any commands past the deadline"""
+        deadline = self.getDeadline()
+        if deadline <= 0:
+            return
+        now = monotonicNs()
+        self.lock.acquire()
+        try:
+            late = [w for w in self.watches if w.diag is None and
+                    now - w.start > deadline * 1e9]
+            for w in late:
+                w.diag = {"dev" : w.dev, "what" : w.what,
+                          "deadline" : deadline,
+                          "elapsed" : (now - w.start) / 1e9,
+                          "state" : {}}
+        finally:
+            self.lock.release()
+        for w in late:
+            if w.dev:
+                w.diag["state"] = sessionState(w.dev, self.sysfs)
+            hangs.append(w.diag)
+            log.error(formatDiagnostics(w.diag))
+            if w.kill is not None:
+                try:
+                    w.kill()
+                except OSError, e:
+                    log.debug("Cannot cancel %s: %s" % (w.what, e))
+
+    def interval(self):
+        """How long to wait between checks"""
+        deadline = self.getDeadline()
+        if deadline <= 0:
+            deadline = 10.0
+        return min(1.0, deadline / 10)
+
+    def monitor(self):
+        while not self.stopping.wait(self.interval()):
+            self.check()
+
+    def stop(self):
+        """Stop the monitor thread (a later start() restarts it)"""
+        self.lock.acquire()
+        try:
+            thread = self.thread
+            self.thread = None
+            self.stopping.set()
+        finally:
+            self.lock.release()
+        if thread is not None:
+            thread.join()
+
+
+# the watchdog all commands use
+watchdog = Watchdog()
+
+
+def reportAtExit():
+    if hangs:
+        sys.stderr.write("%d command(s) hung:\n" % len(hangs))
+        for diag in hangs:
+            sys.stderr.write(formatDiagnostics(diag) + "\n")
+
+atexit.register(reportAtExit)
+# stop the thread while the modules it uses are still there
+atexit.register(watchdog.stop)
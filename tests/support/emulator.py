@@ -0,0 +1,642 @@
+#!/usr/bin/python
+"""
+emulator -- an in-memory SPC-4 persistent reservation target
+
+PrTarget models one LUN's persistent reservation state: the
+registrations per I_T nexus, the PRgeneration, the reservation (any
+of the six types), the APTPL flag, pending Unit Attentions per nexus,
+and which nexuses may READ and WRITE. Each device name stands for one
+I_T nexus to the LUN.
+
+It is used through the normal Initiator interface:
+
+ - EmulatorTransport is an SgIoTransport whose SG_IO "ioctl" is
+   answered by the target, so the CDBs, parameter data, sense data,
+   and PERSISTENT RESERVE IN data all take the same path as on a real
+   device
+ - EmulatorIoEngine does the read and write probes against the
+   target's blocks
+
+Set PGR_TRANSPORT=emulator to run the suite against it, without root
+access or a target. All devices share one target per process.
+
+It can also be used as a reference: with PGR_ORACLE=1, every command
+sent to a real device is also sent to an emulated one, and any
+difference in outcome is logged and kept in "divergences" (so start
+from a target with no registrations).
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import errno
+import ctypes
+import struct
+import logging
+import threading
+
+from clock import monotonicNs
+from probe import BLOCK_SIZE, PROBE_LBA, ProbeResult
+from prin import decodeReadKeys, decodeReadReservation, \
+     decodeReadFullStatus
+from sense import ScsiStatus, SenseKeys
+from sgio import SG_IO, SG_DXFER_TO_DEV, SG_DXFER_FROM_DEV, PrInSa, \
+     PrOutSa
+from transport import PR_IN_ALLOC_LEN, Transport, SgIoTransport
+
+
+__all__ = [
+    'PrTarget',
+    'EmulatorIoctl',
+    'EmulatorTransport',
+    'EmulatorIoEngine',
+    'OracleTransport',
+    'getTarget',
+    'resetTargets',
+    'divergences',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+# additional sense codes (ASC, ASCQ)
+Asc = {
+    "PowerOnReset" : (0x29, 0x00),
+    "ReservationsPreempted" : (0x2a, 0x03),
+    "ReservationsReleased" : (0x2a, 0x04),
+    "RegistrationsPreempted" : (0x2a, 0x05),
+    "ParamListLengthError" : (0x1a, 0x00),
+    "InvalidOpcode" : (0x20, 0x00),
+    "InvalidFieldInCdb" : (0x24, 0x00),
+    "InvalidFieldInParams" : (0x26, 0x00),
+    "InvalidRelease" : (0x26, 0x04)}
+
+WE, EA, WERO, EARO, WEAR, EAAR = 1, 3, 5, 6, 7, 8
+ValidTypes = (WE, EA, WERO, EARO, WEAR, EAAR)
+AllRegistrants = (WEAR, EAAR)
+
+PROUT_PARAM_LEN = 24
+REL_TGT_PORT = 1
+
+# blocks in an emulated LUN (only those written are stored)
+CAPACITY = 1 << 20
+
+OP_TUR = 0x00
+OP_INQUIRY = 0x12
+OP_PR_IN = 0x5e
+OP_PR_OUT = 0x5f
+
+
+class CheckCondition(Exception):
+    """Fail the command with CHECK CONDITION"""
+    def __init__(self, key, asc):
+        Exception.__init__(self, key, asc)
+        self.key = key
+        self.asc = asc
+
+
+class Conflict(Exception):
+    """Fail the command with RESERVATION CONFLICT"""
+    pass
+
+
+def fixedSense(key, asc):
+    """Build fixed format sense data"""
+    return struct.pack(">BxBxxxxBxxxxBB4x", 0x70, key, 10, asc[0], asc[1])
+
+
+def transportId(nexus):
+    """An iSCSI TransportID naming the nexus"""
+    name = "iqn.2016-01.net.emulator:%s\0" % os.path.basename(nexus)
+    name += "\0" * (-len(name) % 4)
+    return struct.pack(">BxH", 0x05, len(name)) + name
+
+
+class PrTarget:
+    """The persistent reservation state of one emulated LUN"""
+    def __init__(self, serial="EMU0001", block_size=BLOCK_SIZE,
+                 capacity=CAPACITY):
+        self.serial = serial
+        self.block_size = block_size
+        self.capacity = capacity
+        self.lock = threading.RLock()
+        self.nexuses = set()            # every nexus seen
+        self.generation = 0
+        self.keys = {}                  # registered nexus -> key
+        self.order = []                 # registered nexuses, in order
+        self.holder = None
+        self.rtype = None
+        self.aptpl = False
+        self.uas = {}                   # nexus -> [asc, ...]
+        self.blocks = {}                # lba -> data, unless all zeros
+        self.commands = 0
+
+    ########################################
+    # state helpers
+
+    def isRegistered(self, nexus):
+        return nexus in self.keys
+
+    def isHolder(self, nexus):
+        """Is nexus a reservation holder (for All Registrants types,
+        every registrant is)"""
+        if self.rtype in AllRegistrants:
+            return self.isRegistered(nexus)
+        return self.rtype is not None and self.holder == nexus
+
+    def holderKey(self):
+        """The key READ RESERVATION shows"""
+        if self.rtype in AllRegistrants:
+            return 0
+        return self.keys[self.holder]
+
+    def addUa(self, nexuses, asc):
+        for n in nexuses:
+            self.uas.setdefault(n, []).append(asc)
+
+    def checkUa(self, nexus):
+        """Report (and clear) the oldest pending Unit Attention"""
+        pending = self.uas.get(nexus)
+        if pending:
+            raise CheckCondition(SenseKeys["UnitAttention"], pending.pop(0))
+
+    def checkRegistered(self, nexus, rk):
+        if not self.isRegistered(nexus) or self.keys[nexus] != rk:
+            raise Conflict()
+
+    def checkType(self, rtype, scope):
+        if rtype not in ValidTypes or scope != 0:
+            raise CheckCondition(SenseKeys["IllegalRequest"],
+                                 Asc["InvalidFieldInCdb"])
+
+    def others(self, nexus):
+        return [n for n in self.order if n != nexus]
+
+    def addRegistration(self, nexus, key):
+        self.keys[nexus] = key
+        self.order.append(nexus)
+
+    def removeRegistration(self, nexus):
+        """Remove a registration, releasing the reservation if it was
+        held by it"""
+        del self.keys[nexus]
+        self.order.remove(nexus)
+        if self.rtype is None:
+            return
+        if self.rtype in AllRegistrants:
+            if not self.order:
+                self.release()
+        elif self.holder == nexus:
+            rtype = self.rtype
+            self.release()
+            if rtype in (WERO, EARO):
+                self.addUa(self.order, Asc["ReservationsReleased"])
+
+    def release(self):
+        self.holder = None
+        self.rtype = None
+
+    ########################################
+    # PERSISTENT RESERVE OUT
+
+    def register(self, nexus, rk, sark, aptpl, ignore=False):
+        if not self.isRegistered(nexus):
+            if not ignore and rk != 0:
+                raise Conflict()
+            if sark == 0:
+                return
+            self.addRegistration(nexus, sark)
+        else:
+            if not ignore and rk != self.keys[nexus]:
+                raise Conflict()
+            if sark == 0:
+                self.removeRegistration(nexus)
+            else:
+                self.keys[nexus] = sark
+        self.aptpl = aptpl
+        self.generation += 1
+
+    def reserve(self, nexus, rk, rtype, scope):
+        self.checkRegistered(nexus, rk)
+        self.checkType(rtype, scope)
+        if self.rtype is not None:
+            if self.isHolder(nexus) and self.rtype == rtype:
+                return
+            raise Conflict()
+        self.rtype = rtype
+        self.holder = nexus
+
+    def releaseBy(self, nexus, rk, rtype, scope):
+        self.checkRegistered(nexus, rk)
+        if self.rtype is None or not self.isHolder(nexus):
+            # nothing of ours to release
+            return
+        if rtype != self.rtype or scope != 0:
+            raise CheckCondition(SenseKeys["IllegalRequest"],
+                                 Asc["InvalidRelease"])
+        self.release()
+        if rtype not in (WE, EA):
+            self.addUa(self.others(nexus), Asc["ReservationsReleased"])
+
+    def clear(self, nexus, rk):
+        self.checkRegistered(nexus, rk)
+        others = self.others(nexus)
+        self.keys = {}
+        self.order = []
+        self.release()
+        self.generation += 1
+        self.addUa(others, Asc["ReservationsPreempted"])
+
+    def preempt(self, nexus, rk, sark, rtype, scope):
+        self.checkRegistered(nexus, rk)
+        if self.rtype is None or \
+               (self.rtype in AllRegistrants and sark != 0) or \
+               (self.rtype not in AllRegistrants and
+                self.holderKey() != sark):
+            # only remove the registrations with the key
+            if sark == 0:
+                raise CheckCondition(SenseKeys["IllegalRequest"],
+                                     Asc["InvalidFieldInParams"])
+            victims = [n for n in self.order
+                       if self.keys[n] == sark and n != nexus]
+            if not victims:
+                raise Conflict()
+            for n in victims:
+                self.removeRegistration(n)
+        else:
+            # preempt the reservation too
+            self.checkType(rtype, scope)
+            if self.rtype in AllRegistrants:
+                victims = self.others(nexus)
+            else:
+                victims = [n for n in self.order
+                           if self.keys[n] == sark and n != nexus]
+            old_type = self.rtype
+            for n in victims:
+                del self.keys[n]
+                self.order.remove(n)
+            self.rtype = rtype
+            self.holder = nexus
+            if old_type != rtype:
+                self.addUa(self.others(nexus), Asc["ReservationsReleased"])
+        self.generation += 1
+        self.addUa(victims, Asc["RegistrationsPreempted"])
+
+    def prOut(self, nexus, sa, rtype, scope, params):
+        if params is None or len(params) < PROUT_PARAM_LEN:
+            raise CheckCondition(SenseKeys["IllegalRequest"],
+                                 Asc["ParamListLengthError"])
+        (rk, sark, flags) = struct.unpack_from(">QQ4xB", params, 0)
+        aptpl = bool(flags & 0x1)
+        if sa == PrOutSa["Register"]:
+            self.register(nexus, rk, sark, aptpl)
+        elif sa == PrOutSa["RegisterAndIgnore"]:
+            self.register(nexus, rk, sark, aptpl, ignore=True)
+        elif sa == PrOutSa["Reserve"]:
+            self.reserve(nexus, rk, rtype, scope)
+        elif sa == PrOutSa["Release"]:
+            self.releaseBy(nexus, rk, rtype, scope)
+        elif sa == PrOutSa["Clear"]:
+            self.clear(nexus, rk)
+        elif sa in (PrOutSa["Preempt"], PrOutSa["PreemptAndAbort"]):
+            self.preempt(nexus, rk, sark, rtype, scope)
+        else:
+            raise CheckCondition(SenseKeys["IllegalRequest"],
+                                 Asc["InvalidFieldInCdb"])
+
+    ########################################
+    # PERSISTENT RESERVE IN
+
+    def prIn(self, sa):
+        if sa == PrInSa["ReadKeys"]:
+            keys = [self.keys[n] for n in self.order]
+            return struct.pack(">II%dQ" % len(keys), self.generation,
+                               8 * len(keys), *keys)
+        if sa == PrInSa["ReadReservation"]:
+            if self.rtype is None:
+                return struct.pack(">II", self.generation, 0)
+            return struct.pack(">IIQ4xBBxx", self.generation, 16,
+                               self.holderKey(), 0, self.rtype)
+        if sa == PrInSa["ReportCapabilities"]:
+            # PTPL_C; TMV and PTPL_A; all six types
+            return struct.pack(">HBBBBxx", 8, 0x01,
+                               0x80 | (self.aptpl and 1 or 0), 0xea, 0x01)
+        if sa == PrInSa["ReadFullStatus"]:
+            descs = []
+            for n in self.order:
+                holder = self.isHolder(n)
+                tid = transportId(n)
+                descs.append(struct.pack(">Q4xBB4xHI", self.keys[n],
+                                         holder and 1 or 0,
+                                         holder and self.rtype or 0,
+                                         REL_TGT_PORT, len(tid)) + tid)
+            data = "".join(descs)
+            return struct.pack(">II", self.generation, len(data)) + data
+        raise CheckCondition(SenseKeys["IllegalRequest"],
+                             Asc["InvalidFieldInCdb"])
+
+    ########################################
+    # commands
+
+    def execute(self, nexus, cdb, data_out=None):
+        """Execute a CDB from a nexus, returning (status, sense, data)"""
+        cdb = bytearray(cdb)
+        self.lock.acquire()
+        try:
+            self.commands += 1
+            self.nexuses.add(nexus)
+            try:
+                return (ScsiStatus["Good"], None,
+                        self.dispatch(nexus, cdb, data_out))
+            except Conflict:
+                return (ScsiStatus["ReservationConflict"], None, None)
+            except CheckCondition, e:
+                return (ScsiStatus["CheckCondition"],
+                        fixedSense(e.key, e.asc), None)
+        finally:
+            self.lock.release()
+
+    def dispatch(self, nexus, cdb, data_out):
+        op = cdb[0]
+        if op == OP_INQUIRY:
+            # INQUIRY does not report Unit Attentions
+            if cdb[1] & 0x1 and cdb[2] == 0x80:
+                return struct.pack(">BBH", 0, 0x80, len(self.serial)) + \
+                       self.serial
+            return struct.pack(">BBBBB3x8s16s4s", 0, 0, 6, 2, 31,
+                               "EMULATOR", "PR TARGET", "0001")
+        self.checkUa(nexus)
+        if op == OP_TUR:
+            return None
+        if op == OP_PR_IN:
+            data = self.prIn(cdb[1] & 0x1f)
+            alloc_len = struct.unpack_from(">H", bytes(cdb), 7)[0]
+            return data[:alloc_len]
+        if op == OP_PR_OUT:
+            self.prOut(nexus, cdb[1] & 0x1f, cdb[2] & 0xf, cdb[2] >> 4,
+                       data_out)
+            return None
+        raise CheckCondition(SenseKeys["IllegalRequest"],
+                             Asc["InvalidOpcode"])
+
+    ########################################
+    # media access
+
+    def mayAccess(self, nexus, write):
+        """Is the nexus allowed to read (or write) the media now?"""
+        if self.rtype is None or self.isHolder(nexus):
+            return True
+        if self.rtype == WE:
+            return not write
+        if self.rtype == EA:
+            return False
+        if self.rtype in (WERO, WEAR):
+            return self.isRegistered(nexus) or not write
+        return self.isRegistered(nexus)
+
+    def access(self, nexus, write, lba, nblocks, data=None):
+        """READ (or WRITE) blocks, returning (allowed, data read)"""
+        self.lock.acquire()
+        try:
+            self.commands += 1
+            self.nexuses.add(nexus)
+            # the disk driver retries Unit Attentions for I/O
+            self.uas.pop(nexus, None)
+            if not self.mayAccess(nexus, write):
+                return (False, None)
+            bs = self.block_size
+            if write:
+                zeros = "\0" * bs
+                for i in range(nblocks):
+                    block = data[i * bs:(i + 1) * bs]
+                    if block == zeros:
+                        self.blocks.pop(lba + i, None)
+                    else:
+                        self.blocks[lba + i] = block
+                return (True, None)
+            return (True, "".join([self.blocks.get(lba + i, "\0" * bs)
+                                   for i in range(nblocks)]))
+        finally:
+            self.lock.release()
+
+    def powerCycle(self):
+        """Lose the PR state (unless APTPL was set), and tell every
+        nexus with a Unit Attention"""
+        self.lock.acquire()
+        try:
+            if not self.aptpl:
+                self.keys = {}
+                self.order = []
+                self.release()
+            self.uas = {}
+            self.addUa(self.nexuses, Asc["PowerOnReset"])
+        finally:
+            self.lock.release()
+
+
+################################################################
+
+targets = {}
+targets_lock = threading.Lock()
+
+def getTarget(name="lun0"):
+    """Get the emulated target of that name, creating it if needed"""
+    targets_lock.acquire()
+    try:
+        if name not in targets:
+            targets[name] = PrTarget()
+        return targets[name]
+    finally:
+        targets_lock.release()
+
+def resetTargets():
+    """Forget all emulated targets"""
+    targets_lock.acquire()
+    try:
+        targets.clear()
+    finally:
+        targets_lock.release()
+
+
+class EmulatorIoctl:
+    """Answers SG_IO requests for one nexus from a PrTarget"""
+    def __init__(self, target, nexus):
+        self.target = target
+        self.nexus = nexus
+
+    def __call__(self, fd, req, hdr):
+        if req != SG_IO:
+            raise IOError(errno.ENOTTY, "not SG_IO")
+        cdb = ctypes.string_at(hdr.cmdp, hdr.cmd_len)
+        data_out = None
+        if hdr.dxfer_direction == SG_DXFER_TO_DEV:
+            data_out = ctypes.string_at(hdr.dxferp, hdr.dxfer_len)
+        (status, sense, data) = self.target.execute(self.nexus, cdb,
+                                                    data_out)
+        hdr.status = status
+        hdr.resid = 0
+        if hdr.dxfer_direction == SG_DXFER_FROM_DEV:
+            n = min(len(data or ""), hdr.dxfer_len)
+            if n:
+                ctypes.memmove(hdr.dxferp, data, n)
+            hdr.resid = hdr.dxfer_len - n
+        if sense is not None:
+            n = min(len(sense), hdr.mx_sb_len)
+            ctypes.memmove(hdr.sbp, sense, n)
+            hdr.sb_len_wr = n
+            hdr.driver_status = 0x8     # DRIVER_SENSE
+
+
+class EmulatorTransport(SgIoTransport):
+    """Send commands to an emulated target (through the SG_IO code)"""
+    def __init__(self, dev, target=None):
+        if target is None:
+            target = getTarget()
+        SgIoTransport.__init__(self, dev, ioctl=EmulatorIoctl(target, dev))
+        self.target = target
+        # there is no device to open
+        self.sg.fd = -1
+
+    def close(self):
+        pass
+
+
+class EmulatorIoEngine:
+    """Probe I/O against an emulated target"""
+    def __init__(self, dev, block_size=BLOCK_SIZE, buf_size=None,
+                 target=None):
+        if target is None:
+            target = getTarget()
+        self.dev = dev
+        self.target = target
+        self.block_size = block_size
+        if buf_size is None:
+            buf_size = block_size
+        self.buf = bytearray(buf_size)
+
+    def close(self):
+        pass
+
+    def _transfer(self, write, lba, nblocks):
+        nbytes = nblocks * self.block_size
+        if nbytes > len(self.buf):
+            raise ValueError("Transfer of %d bytes exceeds buffer" % nbytes)
+        start = monotonicNs()
+        data = None
+        if write:
+            data = bytes(self.buf[:nbytes])
+        (ok, got) = self.target.access(self.dev, write, lba, nblocks, data)
+        elapsed = monotonicNs() - start
+        if not ok:
+            return ProbeResult(errno=errno.EBADE, elapsed_ns=elapsed,
+                               expected=nbytes)
+        if got is not None:
+            self.buf[:nbytes] = got
+        return ProbeResult(nbytes=nbytes, elapsed_ns=elapsed, expected=nbytes)
+
+    def read(self, lba=PROBE_LBA, nblocks=1):
+        """Read blocks from the target"""
+        return self._transfer(False, lba, nblocks)
+
+    def write(self, lba=PROBE_LBA, nblocks=1):
+        """Write blocks (of zeros) to the target"""
+        self.buf[:nblocks * self.block_size] = "\0" * \
+                                               (nblocks * self.block_size)
+        return self._transfer(True, lba, nblocks)
+
+    def growBuffer(self, nblocks):
+        """Return our buffer, first made big enough for nblocks blocks
+        if need be"""
+        nbytes = nblocks * self.block_size
+        if nbytes > len(self.buf):
+            self.buf.extend("\0" * (nbytes - len(self.buf)))
+        return self.buf
+
+    def writeBuffer(self, lba=PROBE_LBA, nblocks=1):
+        """Write blocks from our buffer, as it is"""
+        return self._transfer(True, lba, nblocks)
+
+    def capacity(self):
+        """How many blocks the target has"""
+        return self.target.capacity
+
+    def sweep(self, regions, write=False):
+        """Read (or write zeros to) each (lba, nblocks) region"""
+        results = []
+        for (lba, nblocks) in regions:
+            nbytes = nblocks * self.block_size
+            start = monotonicNs()
+            (ok, got) = self.target.access(self.dev, write, lba, nblocks,
+                                           write and "\0" * nbytes or None)
+            elapsed = monotonicNs() - start
+            if ok:
+                results.append(ProbeResult(nbytes=nbytes, elapsed_ns=elapsed))
+            else:
+                results.append(ProbeResult(errno=errno.EBADE,
+                                           elapsed_ns=elapsed))
+        return results
+
+
+################################################################
+
+# (device, command, real outcome, emulated outcome)
+divergences = []
+
+# what to compare in each kind of PR IN data (not the PRgeneration,
+# which the emulator cannot know)
+prin_views = {
+    PrInSa["ReadKeys"] :
+        lambda d: sorted(decodeReadKeys(d).keys),
+    PrInSa["ReadReservation"] :
+        lambda d: decodeReadReservation(d)[1:4],
+    PrInSa["ReadFullStatus"] :
+        lambda d: sorted([(x.key, x.r_holder, x.rtype)
+                          for x in decodeReadFullStatus(d).descriptors])}
+
+
+class OracleTransport(Transport):
+    """Send each command to a real device and to the emulator,
+    keeping any differences in divergences, and returning what the
+    real device said"""
+    def __init__(self, dev, real, target=None):
+        Transport.__init__(self, dev)
+        self.real = real
+        self.emulated = EmulatorTransport(dev, target)
+
+    def compare(self, what, real, emulated):
+        self.last_sense = self.real.last_sense
+        if real != emulated:
+            log.debug("Oracle: %s %s: device=%s emulator=%s" %
+                      (self.dev, what, real, emulated))
+            divergences.append((self.dev, what, real, emulated))
+
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        real = self.real.prOut(sa, key, sakey, prout_type)
+        self.compare("PR OUT 0x%x" % sa, real,
+                     self.emulated.prOut(sa, key, sakey, prout_type))
+        return real
+
+    def prIn(self, sa, alloc_len=PR_IN_ALLOC_LEN):
+        real = self.real.prIn(sa, alloc_len)
+        emulated = self.emulated.prIn(sa, alloc_len)
+        view = prin_views.get(sa)
+        if real[0] != 0 or emulated[0] != 0 or view is None:
+            self.compare("PR IN 0x%x" % sa, real[0], emulated[0])
+        else:
+            self.compare("PR IN 0x%x" % sa, view(real[1]), view(emulated[1]))
+        return real
+
+    def tur(self):
+        real = self.real.tur()
+        self.compare("TEST UNIT READY", real, self.emulated.tur())
+        return real
+
+    def inquirySn(self):
+        return self.real.inquirySn()
+
+    def close(self):
+        self.real.close()
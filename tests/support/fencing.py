@@ -0,0 +1,226 @@
+#!/usr/bin/python
+"""
+fencing -- measure how soon a fenced initiator stops writing
+
+What matters when a cluster node is fenced is how long after the
+PREEMPT (or RESERVE) completes the victim's writes start failing. To
+measure that, the victim streams writes, one after another, each
+timestamped at its start and end, while the fencer sends the fencing
+command:
+
+ - "preempt": the victim holds the reservation, and the fencer (also
+   registered) preempts it, removing the victim's registration
+ - "reserve": the victim is not registered, and there is no
+   reservation, until the fencer reserves
+
+Either way, once the command has completed, the victim may not write.
+Then, for each repetition:
+
+ - the enforcement latency is from the completion of the fencing
+   command to the end of the victim's first rejected write (0 if one
+   was rejected before the command completed)
+ - the slipped writes are those the victim started after the command
+   completed that still succeeded (there should be none)
+ - a victim that could still write PGR_FENCE_WINDOW seconds after the
+   command completed was never fenced
+
+The victim stops once CONFIRM_REJECTS writes in a row have been
+rejected. The latencies are summarized (as percentiles) for each
+reservation type.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import logging
+import threading
+
+import config
+from clock import monotonicNs
+from fixture import ensurePrState
+from reservation import rtypeName
+from stats import summarize, formatSummary
+
+
+__all__ = [
+    'FenceSample',
+    'FencingReport',
+    'WriteStream',
+    'measureFence',
+    'runFencing',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+CONFIRM_REJECTS = 3
+
+# how long to wait for the victim's first write
+START_TIMEOUT = 5.0
+
+
+class WriteStream:
+    """The victim's writes: (start ns, end ns, result) for each"""
+    def __init__(self, victim):
+        self.victim = victim
+        self.writes = []
+        self.started = threading.Event()
+        self.done_ns = None             # when the fence completed
+        self.deadline_ns = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+
+    def start(self):
+        self.thread.start()
+        if not self.started.wait(START_TIMEOUT):
+            self.fenced(monotonicNs(), 0)
+            self.join()
+            raise RuntimeError("%s could not write before being fenced" %
+                               self.victim.dev)
+
+    def fenced(self, done_ns, window):
+        """The fencing command completed at done_ns: keep writing until
+        rejected, or for window seconds"""
+        self.deadline_ns = done_ns + int(window * 1e9)
+        self.done_ns = done_ns
+
+    def finished(self):
+        """Is there nothing more to learn?"""
+        if self.done_ns is None:
+            return False
+        rejects = 0
+        for (start, end, result) in reversed(self.writes):
+            if start < self.done_ns or result == 0:
+                break
+            rejects += 1
+        return rejects >= CONFIRM_REJECTS or \
+               monotonicNs() > self.deadline_ns
+
+    def run(self):
+        io = self.victim.io
+        while not self.finished():
+            start = monotonicNs()
+            result = io.write().result
+            self.writes.append((start, monotonicNs(), result))
+            if result == 0:
+                self.started.set()
+
+    def join(self):
+        self.thread.join()
+        # the disk driver retries Unit Attentions
+        self.victim.ua.consumed(self.victim.dev)
+
+
+class FenceSample:
+    """The outcome of fencing the victim once"""
+    def __init__(self, start_ns, done_ns, result, writes):
+        self.result = result
+        self.fence_ns = done_ns - start_ns
+        self.writes = len(writes)
+        after = [w for w in writes if w[0] >= done_ns]
+        self.slipped = len([w for w in after if w[2] == 0])
+        # (any rejected before the command was sent were not fenced)
+        rejected = [w for w in writes if w[2] != 0 and w[1] >= start_ns]
+        if rejected:
+            self.latency_ns = max(0, rejected[0][1] - done_ns)
+        else:
+            self.latency_ns = None
+
+    def fenced(self):
+        return self.latency_ns is not None
+
+    def __repr__(self):
+        return "FenceSample(result=%d, latency_ns=%s, slipped=%d, " \
+               "writes=%d)" % (self.result, self.latency_ns, self.slipped,
+                               self.writes)
+
+
+def measureFence(victim, fencer, method, prout_type, inits=None,
+                 window=None):
+    """Fence the victim once, by method, with a reservation of type
+    prout_type, returning a FenceSample"""
+    prout_type = int(prout_type)
+    if inits is None:
+        inits = [victim, fencer]
+    if window is None:
+        window = config.fence_window
+    if method == "preempt":
+        ensurePrState(inits, registered=[victim, fencer], holder=victim,
+                      rtype=prout_type)
+    elif method == "reserve":
+        ensurePrState(inits, registered=[fencer])
+    else:
+        raise ValueError("Unknown fencing method: %s" % method)
+    stream = WriteStream(victim)
+    stream.start()
+    start = monotonicNs()
+    if method == "preempt":
+        result = fencer.preempt(victim.key, prout_type)
+    else:
+        result = fencer.reserve(prout_type)
+    done = monotonicNs()
+    stream.fenced(done, window)
+    stream.join()
+    sample = FenceSample(start, done, result, stream.writes)
+    log.debug("%s %s: %s" % (method, rtypeName(prout_type), sample))
+    return sample
+
+
+class FencingReport:
+    """The outcome of fencing, repeatedly, with each reservation
+    type"""
+    def __init__(self, method):
+        self.method = method
+        self.samples = {}               # prout_type -> [FenceSample]
+        self.problems = []
+
+    def addSample(self, prout_type, sample):
+        prout_type = int(prout_type)
+        self.samples.setdefault(prout_type, []).append(sample)
+        name = rtypeName(prout_type)
+        if sample.result != 0:
+            self.problems.append("%s %s failed: %d" %
+                                 (self.method, name, sample.result))
+        elif not sample.fenced():
+            self.problems.append("%s %s: victim never fenced" %
+                                 (self.method, name))
+        elif sample.slipped:
+            self.problems.append("%s %s: %d write(s) slipped through" %
+                                 (self.method, name, sample.slipped))
+
+    def latencies(self, prout_type):
+        return [s.latency_ns for s in self.samples[int(prout_type)]
+                if s.fenced()]
+
+    def format(self):
+        """Format the report for display"""
+        lines = ["fencing by %s:" % self.method]
+        for (prout_type, samples) in sorted(self.samples.items()):
+            lines.append("  %-34s slipped=%-4d unfenced=%-3d latency %s" %
+                         (rtypeName(prout_type),
+                          sum([s.slipped for s in samples]),
+                          len([s for s in samples if not s.fenced()]),
+                          formatSummary(summarize(
+                              self.latencies(prout_type)))))
+            lines.append("  %-34s %s time %s" %
+                         ("", self.method.upper(), formatSummary(summarize(
+                             [s.fence_ns for s in samples]))))
+        lines.extend(["  " + p for p in self.problems])
+        return "\n".join(lines)
+
+
+def runFencing(victim, fencer, method, prout_types, reps=None, inits=None):
+    """Fence the victim reps times with each reservation type,
+    returning a FencingReport"""
+    if reps is None:
+        reps = config.fence_reps
+    report = FencingReport(method)
+    for prout_type in prout_types:
+        for r in xrange(reps):
+            report.addSample(prout_type,
+                             measureFence(victim, fencer, method,
+                                          prout_type, inits))
+    return report
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+"""
+fixture -- declarative PR state set up for PGR testing
+
+A test says what PR state it needs, e.g.:
+
+    ensurePrState([initA, initB, initC], registered=[initA, initB])
+
+and the current state is read once (from every initiator at once,
+which also clears any pending Unit Attentions), and only the PR OUT
+commands needed to get from there to the wanted state are sent. If
+that would take more commands than a CLEAR and re-registering (or the
+state has keys we do not own), a CLEAR is used instead. Unit
+Attentions caused by the set up are cleared before returning.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import logging
+
+from parallel import callEach
+from reservation import AllRegistrantsTypes, keyToStr
+
+
+__all__ = [
+    'ensurePrState',
+    'wantedHolderKey',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+
+def wantedHolderKey(holder, rtype):
+    """The reservation key a snapshot shows for holder and rtype"""
+    if int(rtype) in AllRegistrantsTypes:
+        return keyToStr(0)
+    return holder.key
+
+
+def ensurePrState(inits, registered=(), holder=None, rtype=None):
+    """Bring the target to the state where exactly the registered
+    initiators are registered, and holder (which must be one of them)
+    holds a reservation of type rtype (or there is no reservation, if
+    holder is None), returning the list of PR OUT commands sent"""
+    if holder is not None and holder not in registered:
+        raise ValueError("reservation holder %s must be registered" %
+                         holder.key)
+    by_key = dict([(i.key, i) for i in inits if i.key is not None])
+    snaps = [s for s in callEach(inits, "snapshot") if s is not None]
+    if not snaps:
+        log.debug("Cannot read PR state: clearing")
+        have = set()
+        snap = None
+    else:
+        snap = snaps[0]
+        have = set(snap.registrants)
+    want = set([i.key for i in registered])
+    extra = have - want
+    missing = want - have
+    resvn_ok = False
+    releaser = None
+    if snap is not None:
+        if holder is None:
+            resvn_ok = snap.key is None
+        else:
+            resvn_ok = snap.key == wantedHolderKey(holder, rtype) and \
+                       int(snap.getRtypeNum()) == int(rtype)
+        if snap.key is not None and not resvn_ok:
+            if snap.key == keyToStr(0):
+                # any registrant can release an All Registrants one
+                ours = [by_key[k] for k in sorted(have) if k in by_key]
+                if ours:
+                    releaser = ours[0]
+            elif snap.key in by_key:
+                releaser = by_key[snap.key]
+    sent = []
+    def send(init, name, *args):
+        sent.append("%s %s" % (name, init.key))
+        return getattr(init, name)(*args)
+
+    # a CLEAR costs one command, plus registering everyone again
+    mine = [by_key[k] for k in sorted(have) if k in by_key]
+    clear_cost = 1 + len(want) + (not mine and 1 or 0)
+    surgical_cost = len(extra) + len(missing) + (releaser and 1 or 0)
+    must_clear = snap is None or \
+                 [k for k in extra if k not in by_key] or \
+                 (snap.key is not None and not resvn_ok and releaser is None)
+    if must_clear or clear_cost < surgical_cost:
+        if mine:
+            clearer = mine[0]
+        else:
+            clearer = (list(registered) + list(by_key.values()))[0]
+            send(clearer, "register")
+        if send(clearer, "clear") != 0:
+            # we did not know the state: maybe we were not registered
+            send(clearer, "register")
+            send(clearer, "clear")
+        missing = want
+        resvn_ok = holder is None
+    else:
+        if releaser is not None:
+            send(releaser, "release", snap.getRtypeNum())
+        for k in sorted(extra):
+            send(by_key[k], "unregister")
+    disruptive = len(sent) > 0
+    if missing:
+        sent.extend(["register %s" % k for k in sorted(missing)])
+        callEach([by_key[k] for k in sorted(missing)], "register")
+    if holder is not None and not resvn_ok:
+        send(holder, "reserve", rtype)
+    if disruptive:
+        # CLEAR, RELEASE, and UNREGISTER can leave Unit Attentions
+        callEach(inits, "clearUa")
+    log.debug("PR state set up with: %s" % sent)
+    return sent
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+"""
+fleet -- any number of initiators sharing one LUN
+
+A Fleet is a list of initiators, one per device (i.e. per I_T nexus),
+each with its own generated reservation key. It is used to run the
+registration and reservation tests across every member, and to
+measure how the target's command latency grows with the number of
+registrants:
+
+    fleet = Fleet(config.devices)
+    print formatScaling(measureScaling(fleet))
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import logging
+
+import config
+from clock import monotonicNs
+from initiator import Initiator
+from parallel import callEach
+from reservation import ProutTypes
+from stats import summarize, formatSummary
+
+
+__all__ = [
+    'Fleet',
+    'fleetKey',
+    'measureScaling',
+    'formatScaling',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+# fleet keys are FLEET_KEY_BASE + member number, so they never clash
+# with the keys used by initA and initB
+FLEET_KEY_BASE = 0xf1ee7000
+
+
+def fleetKey(idx):
+    """The reservation key for fleet member idx"""
+    return "0x%x" % (FLEET_KEY_BASE + idx)
+
+
+class Fleet:
+    """A set of initiators, one per device, with unique keys"""
+    def __init__(self, devs=None):
+        if devs is None:
+            devs = config.devices
+        self.members = [Initiator(devs[i], fleetKey(i))
+                        for i in range(len(devs))]
+
+    def __len__(self):
+        return len(self.members)
+
+    def __getitem__(self, idx):
+        return self.members[idx]
+
+    def keys(self):
+        return [m.key for m in self.members]
+
+    def callEach(self, method, *args, **kwargs):
+        """Call a method on some members (all by default) at once"""
+        members = kwargs.get("members", self.members)
+        return callEach(members, method, *args)
+
+    def reset(self):
+        """Remove all registrations and any reservation, and clear the
+        resulting Unit Attentions"""
+        head = self.members[0]
+        # its nexus may be registered under some other key (e.g. by
+        # initA), which it must take over to be able to clear
+        head.registerIgnoringExisting()
+        head.clear()
+        self.callEach("clearUa")
+
+    def registerAll(self, count=None):
+        """Register the first count members (all by default),
+        returning their results"""
+        if count is None:
+            count = len(self.members)
+        return self.callEach("register", members=self.members[:count])
+
+
+################################################################
+
+def timeCall(fn, *args):
+    """Call fn, returning (its result, nanoseconds taken)"""
+    start = monotonicNs()
+    result = fn(*args)
+    return (result, monotonicNs() - start)
+
+
+def measureScaling(fleet, samples=None, rtype=ProutTypes["WriteExclusive"]):
+    """For each number of registrants, from 1 to the fleet size, time
+    the PR commands the first member sends, returning a list of
+    (registrants, {operation: summary}), with latencies in ns"""
+    if samples is None:
+        samples = config.fleet_samples
+    head = fleet[0]
+    ops = [("READ KEYS", head.transport.readKeys),
+           ("READ RESERVATION", head.transport.readReservation),
+           ("READ FULL STATUS", head.transport.readFullStatus),
+           ("RESERVE+RELEASE", None),
+           ("REGISTER", None)]
+    rows = []
+    fleet.reset()
+    for n in range(1, len(fleet) + 1):
+        times = dict([(name, []) for (name, fn) in ops])
+        for s in range(samples):
+            fleet.reset()
+            if n > 1:
+                fleet.registerAll(n - 1)
+            # time adding the n'th registrant
+            (result, ns) = timeCall(fleet[n - 1].register)
+            if result != 0:
+                log.debug("register of %s failed: %d" %
+                          (fleet[n - 1].key, result))
+            times["REGISTER"].append(ns)
+            for (name, fn) in ops:
+                if fn is not None:
+                    times[name].append(timeCall(fn)[1])
+            start = monotonicNs()
+            head.reserve(rtype)
+            head.release(rtype)
+            times["RESERVE+RELEASE"].append(monotonicNs() - start)
+        rows.append((n, dict([(name, summarize(times[name]))
+                              for (name, fn) in ops])))
+        log.debug("%d registrants: %s" % (n, rows[-1][1]))
+    fleet.reset()
+    return rows
+
+
+def formatScaling(rows):
+    """Format the output of measureScaling() for display"""
+    lines = []
+    for (n, summaries) in rows:
+        lines.append("%d registrant(s):" % n)
+        for name in sorted(summaries.keys()):
+            lines.append("  %-18s %s" % (name,
+                                         formatSummary(summaries[name])))
+    return "\n".join(lines)
@@ -4,10 +4,22 @@ Initiator Class for testing PGR
 """
 
 import os
+import time
 import logging
 
-from cmd import runCmdWithOutput
-from reservation import Reservation
+import config
+import retry
+import sweep
+import pattern
+from reservation import Reservation, PrSnapshot, AllRegistrantsTypes, \
+     keyToStr, rtypeName
+from sense import ExitCat
+from sgio import PrOutSa
+from transport import makeTransport
+from probe import PROBE_LBA, makeIoEngine
+from timing import timedOp, resultOf
+from clock import monotonicNs
+from ua import tracker
 
 
 ################################################################
@@ -17,152 +29,342 @@ log = logging.getLogger('nose.user')
 ################################################################
 
 
+def releaseTellsOthers(prout_type):
+    """Does releasing this type of reservation leave a Unit Attention
+    for the other registrants (i.e. is it Registrants Only or All
+    Registrants)?"""
+    return prout_type is not None and int(prout_type) not in (1, 3)
+
+
 class Initiator:
     """A General PGR initiator"""
-    def __init__(self, dev, key):
+    def __init__(self, dev, key, transport=None, io=None):
         self.dev = dev
         self.key = key
+        if transport is None:
+            transport = makeTransport(dev)
+        self.transport = transport
+        if io is None:
+            io = makeIoEngine(dev)
+        self.io = io
+        # commands retried by the last call, and the time that took
+        self.retries = 0
+        self.retry_ns = 0
+        # the CmdResult of the last PR command (e.g. to see why a
+        # getReservation() returned None)
+        self.last_result = None
+        # the type of reservation we last took, if we may still hold it
+        self.holding = None
+        self.ua = tracker
+        self.ua.add(dev)
+        # the regions an access sweep covers, once we know them
+        self.sweep_regions = None
+        # who we are in pattern writes, and the last sequence number
+        # used (from the clock, so that it is new to the media)
+        self.pattern_id = pattern.initiatorId(dev)
+        self.write_seq = int(time.time() * 1000000)
 
-    def runSgCmdWithOutput(self, cmd):
-        """Run the SG command on specified host"""
-        my_cmd = ["sg_persist", "-n"] + cmd + [self.dev]
-        return runCmdWithOutput(my_cmd)
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        """Send a PR OUT, noting any Unit Attentions it reports or
+        leaves for other nexuses"""
+        result = self.withRetries(self.transport.prOut,
+                                  (sa, key, sakey, prout_type),
+                                  idempotent=False)
+        if result != 0:
+            return result
+        if sa in (PrOutSa["Preempt"], PrOutSa["PreemptAndAbort"],
+                  PrOutSa["Clear"]):
+            self.ua.expectOthers(self.dev)
+        elif sa == PrOutSa["Release"] and releaseTellsOthers(prout_type):
+            self.ua.expectOthers(self.dev)
+        elif sa == PrOutSa["Register"] and sakey is None and \
+                 releaseTellsOthers(self.holding):
+            # the holder unregistering releases its reservation
+            self.ua.expectOthers(self.dev)
+        if sa in (PrOutSa["Reserve"], PrOutSa["Preempt"],
+                  PrOutSa["PreemptAndAbort"]):
+            self.holding = prout_type
+        elif sa in (PrOutSa["Release"], PrOutSa["Clear"]) or \
+                 (sa == PrOutSa["Register"] and sakey is None):
+            self.holding = None
+        return result
 
+    @timedOp("READ KEYS")
     def getRegistrants(self):
         """Get list of registrants using specified initiator"""
         registrants = []
-        res = self.runSgCmdWithOutput(["-k"])
-        if "no registered reservation keys" not in res.lines[0].lower():
-            for l in res.lines[1:]:
-                log.debug("key=%s" % l.strip())
-                registrants.append(l.strip())
+        (result, rk) = self.withRetries(self.transport.readKeys)
+        if rk is not None:
+            registrants = [keyToStr(k) for k in rk.keys]
         log.debug("Returning registrants list: %s" % registrants)
         return registrants
 
+    @timedOp("REGISTER")
     def register(self):
         """Register the remote I_T Nexus"""
-        res = self.runSgCmdWithOutput(
-            ["--out",
-             "--register",
-             "--param-sark=" + self.key])
-        return res.result
+        return self.prOut(PrOutSa["Register"], sakey=self.key)
 
+    @timedOp("REGISTER AND IGNORE")
     def registerAndIgnore(self, new_key):
         """Register the remote I_T Nexus"""
-        res = self.runSgCmdWithOutput(
-            ["--out",
-             "--register",
-             "--param-rk=" + self.key,
-             "--param-sark=" + new_key])
-        return res.result
+        return self.prOut(PrOutSa["Register"],
+                          key=self.key, sakey=new_key)
 
+    @timedOp("REGISTER AND IGNORE EXISTING KEY")
+    def registerIgnoringExisting(self):
+        """Register our key for the remote I_T Nexus, replacing any key
+        it is already registered under"""
+        return self.prOut(PrOutSa["RegisterAndIgnore"], sakey=self.key)
+
+    @timedOp("UNREGISTER")
     def unregister(self):
         """UnRegister the remote I_T Nexus"""
-        res = self.runSgCmdWithOutput(
-            ["--out",
-             "--register",
-             "--param-rk=" + self.key])
-        return res.result
+        return self.prOut(PrOutSa["Register"], key=self.key)
 
+    @timedOp("RESERVE")
     def reserve(self, prout_type):
         """Reserve for the host using the supplied type"""
-        res = self.runSgCmdWithOutput(
-            ["--out",
-             "--reserve",
-             "--param-rk=" + self.key,
-             "--prout-type=" + prout_type])
-        return res.result
+        return self.prOut(PrOutSa["Reserve"],
+                          key=self.key, prout_type=prout_type)
+
+    def withRetries(self, fn, args=(), idempotent=True):
+        """Call a transport function, retrying as the retry policy
+        says, returning what it returned last. Commands that are not
+        idempotent are only retried if they cannot have been run."""
+        attempt = 0
+        first_failure = None
+        while True:
+            ret = fn(*args)
+            result = resultOf(ret)
+            if result is None:
+                result = ret[0]
+            self.last_result = result
+            self.ua.note(self.dev, result)
+            sense = getattr(result, "sense", self.transport.last_sense)
+            delay = retry.policy.delay(result, sense, attempt, idempotent)
+            if delay is None:
+                break
+            if first_failure is None:
+                first_failure = monotonicNs()
+            log.debug("%s returned %d (sense %s): retrying in %.3fs" %
+                      (self.dev, result, sense, delay))
+            if delay:
+                time.sleep(delay)
+            attempt += 1
+            self.retries += 1
+        if first_failure is not None:
+            self.retry_ns += monotonicNs() - first_failure
+        return ret
 
+    @timedOp("READ RESERVATION")
     def getReservation(self):
         """Get current reservation"""
-        retry_cnt = 3
-        while retry_cnt > 0:
-            res = self.runSgCmdWithOutput(["-r"])
-            if res.result == 0:
-                break
-            if res.result != 6:
-                log.debug("oh oh -- strange error returned: %d" % res.result)
-                return None
-            if retry_cnt == 1:
-                log.debug("oh oh -- command failed to run after retry")
-                return None
-            log.debug("command returned %d so retrying" % res.result)
-            retry_cnt = retry_cnt - 1
-        if not res.lines:
-            log.debug("No lines! FAIL")
+        (result, rec) = self.withRetries(self.transport.readReservation)
+        if result != 0 or rec is None:
             return None
-        log.debug("Parsing %d lines of reservations:" % len(res.lines))
-        for o in res.lines:
-            log.debug("line=%s" % o)
         rr = Reservation()
-        if "Reservation follows" in res.lines[0]:
-            rr.key = res.lines[1].split("=")[1]
-            rline = res.lines[2]
-            ridx = rline.index("type:")
-            rr.rtype = rline[ridx:].split(":")[1].strip()
+        if rec.key is not None:
+            rr.key = keyToStr(rec.key)
+            rr.rtype = rtypeName(rec.rtype)
             log.debug("Reservation: found key=%s type=%s" % (rr.key, rr.rtype))
         else:
             log.debug("No Reservation found")
         return rr
 
+    def peekReservation(self):
+        """Get the current reservation as a prin.ReadReservation (with
+        numeric fields), or None on error, without retrying"""
+        (result, rec) = self.transport.readReservation()
+        self.last_result = result
+        self.ua.note(self.dev, result)
+        if result != 0:
+            return None
+        return rec
+
+    @timedOp("SNAPSHOT")
+    def snapshot(self):
+        """Get the registrants, reservation, and PRgeneration, using
+        one READ FULL STATUS, returning a PrSnapshot"""
+        (result, fs) = self.withRetries(self.transport.readFullStatus)
+        if result == ExitCat["IllegalRequest"]:
+            log.debug("READ FULL STATUS not supported: reading separately")
+            return self.snapshotFromReads()
+        if result != 0 or fs is None:
+            return None
+        key = None
+        rtype = None
+        for d in fs.descriptors:
+            if d.r_holder:
+                if d.rtype in AllRegistrantsTypes:
+                    key = keyToStr(0)
+                else:
+                    key = keyToStr(d.key)
+                rtype = rtypeName(d.rtype)
+                break
+        snap = PrSnapshot(fs.generation,
+                          tuple([keyToStr(d.key) for d in fs.descriptors]),
+                          key, rtype)
+        log.debug("Snapshot: %s" % (snap,))
+        return snap
+
+    def snapshotFromReads(self):
+        """Get a PrSnapshot using READ KEYS and READ RESERVATION, for
+        targets without READ FULL STATUS"""
+        for i in range(3):
+            (result, rk) = self.withRetries(self.transport.readKeys)
+            if result != 0 or rk is None:
+                return None
+            (result, rr) = self.withRetries(self.transport.readReservation)
+            if result != 0 or rr is None:
+                return None
+            if rk.generation == rr.generation:
+                break
+            log.debug("PRgeneration changed between reads: retrying")
+        key = None
+        rtype = None
+        if rr.key is not None:
+            key = keyToStr(rr.key)
+            rtype = rtypeName(rr.rtype)
+        return PrSnapshot(rr.generation,
+                          tuple([keyToStr(k) for k in rk.keys]),
+                          key, rtype)
+
+    @timedOp("RELEASE")
     def release(self, prout_type):
         """Reserve for the host using the supplied type"""
-        res = self.runSgCmdWithOutput(
-            ["--out",
-             "--release",
-             "--param-rk=" + self.key,
-             "--prout-type=" + prout_type])
-        return res.result
+        return self.prOut(PrOutSa["Release"],
+                          key=self.key, prout_type=prout_type)
+
+    @timedOp("PREEMPT")
+    def preempt(self, victim_key, prout_type):
+        """Preempt the registration (and reservation) of victim_key"""
+        return self.prOut(PrOutSa["Preempt"],
+                          key=self.key, sakey=victim_key,
+                          prout_type=prout_type)
 
+    @timedOp("CLEAR")
     def clear(self):
         """Clear Registrations and Reservation on a target"""
-        res = self.runSgCmdWithOutput(
-            ["--out",
-             "--clear",
-             "--param-rk=" + self.key])
-        return res.result
+        return self.prOut(PrOutSa["Clear"], key=self.key)
 
+    @timedOp("INQUIRY")
     def getDiskInquirySn(self):
         """Get the Disk Serial Number"""
-        res = runCmdWithOutput(["sg_inq", self.dev])
-        ret = None
-        if res.result == 0:
-            if "Unit serial number" in res.lines[-1]:
-                line = res.lines[-1]
-                ret = line.split()[-1]
+        ret = self.transport.inquirySn()
         log.debug("getDiskInquirySn(%s) -> %s" % (self.dev, ret))
         return ret
 
+    @timedOp("TEST UNIT READY")
     def runTur(self):
         """Clear any UA by sending TUR"""
-        res = runCmdWithOutput(["sg_turs", self.dev])
-        return res.result
+        result = self.transport.tur()
+        self.last_result = result
+        self.ua.note(self.dev, result)
+        return result
+
+    def clearUa(self):
+        """Clear any Unit Attentions we expect, by sending TURs (and
+        none if we don't expect any), returning the last result"""
+        result = 0
+        for i in range(3):
+            if not self.ua.isExpected(self.dev):
+                if i == 0:
+                    self.ua.countTur(False)
+                break
+            self.ua.countTur(True)
+            result = self.runTur()
+        return result
+
+    def sweepRegions(self):
+        """The regions an access sweep covers, across the whole LUN"""
+        if self.sweep_regions is None:
+            self.sweep_regions = sweep.sweepPlan(self.io.capacity())
+            log.debug("Sweeping %s: %s" % (self.dev, self.sweep_regions))
+        return self.sweep_regions
 
+    def sweepTarget(self, write=False):
+        """Read from (or write to) every region of the access sweep,
+        returning a SweepResult"""
+        regions = self.sweepRegions()
+        res = sweep.SweepResult(regions, self.io.sweep(
+            [(r.lba, r.nblocks) for r in regions], write))
+        sweep.note(self.dev, write, res)
+        return res
+
+    def sweepVerified(self):
+        """Write a pattern to every region of the access sweep, checking
+        each as writeVerified() does, returning a SweepResult"""
+        regions = self.sweepRegions()
+        res = sweep.SweepResult(regions, [self.writeVerified(r.lba, r.nblocks)
+                                          for r in regions])
+        sweep.note(self.dev, True, res)
+        return res
+
+    @timedOp("READ")
     def readFromTarget(self):
-        """See if we can read from the target"""
-        return runCmdWithOutput(["dd",
-                                 "if=" + self.dev,
-                                 "iflag=direct",
-                                 "of=/dev/null",
-                                 "skip=1",
-                                 "bs=4096",
-                                 "count=1"])
-        
+        """See if we can read from the target (across the LUN, if
+        PGR_ACCESS_SWEEP is set)"""
+        if config.access_sweep:
+            res = self.sweepTarget()
+        else:
+            res = self.io.read()
+        # the disk driver retries Unit Attentions
+        self.ua.consumed(self.dev)
+        return res
+
+    def writeVerified(self, lba=PROBE_LBA, nblocks=1):
+        """Write a pattern, and check by reading it back that it
+        reached the media if, and only if, the write was allowed,
+        raising IntegrityError if not"""
+        if not hasattr(self.io, "writeBuffer"):
+            raise ValueError("Cannot write patterns with %s" %
+                             self.io.__class__.__name__)
+        self.write_seq += 1
+        results = pattern.writePattern(self.io, lba, nblocks,
+                                       self.pattern_id, self.write_seq)
+        check = pattern.verifyPattern(self.io, lba, nblocks,
+                                      self.pattern_id, self.write_seq)
+        if check.unread:
+            # e.g. not allowed to read either
+            pattern.counts["unverified"] += 1
+            log.debug("%s: cannot read back what was written" % self.dev)
+        else:
+            pattern.counts["verified"] += 1
+            allowed = [r.result for r in results] == [0] * len(results)
+            landed = check.count(pattern.OK)
+            if check.count(pattern.GARBAGE) or check.count(pattern.MISPLACED):
+                raise pattern.IntegrityError("%s: corrupt blocks: %s" %
+                                             (self.dev, check.bad))
+            if allowed and landed != nblocks:
+                raise pattern.IntegrityError(
+                    "%s: write allowed, but %d of %d blocks did not reach "
+                    "the media: %s" % (self.dev, nblocks - landed, nblocks,
+                                       check.bad))
+            if not allowed and landed:
+                raise pattern.IntegrityError(
+                    "%s: write rejected, but %d of %d blocks reached the "
+                    "media" % (self.dev, landed, nblocks))
+        failed = [r for r in results if r.result != 0]
+        return (failed or results)[0]
+
+    @timedOp("WRITE")
     def writeToTarget(self):
         """See if we can write to the target (destructive!) """
-        return runCmdWithOutput(["dd",
-                                 "if=/dev/zero",
-                                 "of=" + self.dev,
-                                 "oflag=direct",
-                                 "bs=4096",
-                                 "skip=1",
-                                 "seek=1",
-                                 "count=1"])
+        if config.access_sweep and config.verify_writes:
+            res = self.sweepVerified()
+        elif config.access_sweep:
+            res = self.sweepTarget(write=True)
+        elif config.verify_writes:
+            res = self.writeVerified()
+        else:
+            res = self.io.write()
+        self.ua.consumed(self.dev)
+        return res
 
 #
 # For all to use
 #
 
-initA = Initiator("/dev/sdc", "0x123abc")
-initB = Initiator("/dev/sdd", "0x696969")
-initC = Initiator("/dev/sde", None)
+initA = Initiator(config.devices[0], "0x123abc")
+initB = Initiator(config.devices[1], "0x696969")
+initC = Initiator(config.devices[2], None)
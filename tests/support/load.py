@@ -0,0 +1,476 @@
+#!/usr/bin/python
+"""
+load -- keep I/O in flight while reservations change
+
+The probes do one synchronous transfer at a time, so they never show
+what a target does with I/O already in flight when a reservation
+changes. An IoLoad keeps PGR_LOAD_DEPTH direct reads and writes
+(PGR_LOAD_WRITES percent of them writes, of zeros) outstanding on
+each of a set of devices, at random offsets across the LUN, until it
+is stopped. This is done by one of:
+
+ - AioQueue: the kernel's native asynchronous I/O, one thread per
+   device submitting with io_submit() and reaping with
+   io_getevents(). The system calls are made directly, so libaio need
+   not be installed.
+ - ThreadQueue: a pool of PGR_LOAD_DEPTH threads per device, each
+   with an I/O engine of its own, doing one transfer at a time. This
+   is the fallback, and the only choice for I/O engines other than
+   "direct" (e.g. the emulator).
+
+Every PGR_LOAD_INTERVAL seconds the reads, writes, bytes, and errors
+seen on each device are sampled, giving the throughput, IOPS, and
+errors per interval and per initiator. runAlongside() runs a load
+while another initiator reserves, releases, and clears.
+
+Load I/O is not recorded to (or replayed from) transcripts.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import mmap
+import time
+import errno
+import random
+import ctypes
+import ctypes.util
+import logging
+import platform
+import threading
+
+import config
+from clock import monotonicNs
+from probe import BLOCK_SIZE, makeIoEngine
+
+
+__all__ = [
+    'LoadCounters',
+    'AioQueue',
+    'ThreadQueue',
+    'IoLoad',
+    'LoadReport',
+    'aioAvailable',
+    'runAlongside',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+LOAD_BYTES = 64 << 10
+
+# how long io_getevents() waits, so that stopping is noticed
+REAP_TIMEOUT_NS = 100000000
+
+# (io_setup, io_destroy, io_submit, io_getevents), per architecture
+AIO_SYSCALLS = {
+    "x86_64" : (206, 207, 209, 208),
+    "aarch64" : (0, 1, 2, 4)}
+
+IOCB_CMD_PREAD = 0
+IOCB_CMD_PWRITE = 1
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+
+class Iocb(ctypes.Structure):
+    """struct iocb (for a little-endian, 64-bit machine)"""
+    _fields_ = [("aio_data", ctypes.c_uint64),
+                ("aio_key", ctypes.c_uint32),
+                ("aio_rw_flags", ctypes.c_int32),
+                ("aio_lio_opcode", ctypes.c_uint16),
+                ("aio_reqprio", ctypes.c_int16),
+                ("aio_fildes", ctypes.c_uint32),
+                ("aio_buf", ctypes.c_uint64),
+                ("aio_nbytes", ctypes.c_uint64),
+                ("aio_offset", ctypes.c_int64),
+                ("aio_reserved2", ctypes.c_uint64),
+                ("aio_flags", ctypes.c_uint32),
+                ("aio_resfd", ctypes.c_uint32)]
+
+
+class IoEvent(ctypes.Structure):
+    """struct io_event"""
+    _fields_ = [("data", ctypes.c_uint64),
+                ("obj", ctypes.c_uint64),
+                ("res", ctypes.c_int64),
+                ("res2", ctypes.c_int64)]
+
+
+class Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long),
+                ("tv_nsec", ctypes.c_long)]
+
+
+def aioSyscall(name, *args):
+    """Make an AIO system call, raising OSError if it fails"""
+    nrs = AIO_SYSCALLS[platform.machine()]
+    nr = nrs[["io_setup", "io_destroy", "io_submit",
+              "io_getevents"].index(name)]
+    ret = _libc.syscall(ctypes.c_long(nr), *args)
+    if ret < 0:
+        e = ctypes.get_errno()
+        raise OSError(e, "%s: %s" % (name, os.strerror(e)))
+    return ret
+
+def aioAvailable():
+    """Can native AIO be used here?"""
+    if platform.machine() not in AIO_SYSCALLS:
+        return False
+    ctx = ctypes.c_ulong(0)
+    try:
+        aioSyscall("io_setup", ctypes.c_long(1), ctypes.byref(ctx))
+    except OSError, e:
+        log.debug("No native AIO: %s" % e)
+        return False
+    aioSyscall("io_destroy", ctx)
+    return True
+
+
+################################################################
+
+class LoadCounters:
+    """What one device's load has done since last taken"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.reads = 0
+        self.writes = 0
+        self.nbytes = 0
+        self.read_errors = 0
+        self.write_errors = 0
+        self.errnos = {}                # errno -> count
+
+    def add(self, write, nbytes, expected, err=0):
+        """Count one transfer: nbytes done of expected, or errno err"""
+        self.lock.acquire()
+        try:
+            if write:
+                self.writes += 1
+            else:
+                self.reads += 1
+            if err or nbytes != expected:
+                if write:
+                    self.write_errors += 1
+                else:
+                    self.read_errors += 1
+                self.errnos[err] = self.errnos.get(err, 0) + 1
+            else:
+                self.nbytes += nbytes
+        finally:
+            self.lock.release()
+
+    def take(self):
+        """Return a copy of the counts, and start again from zero"""
+        self.lock.acquire()
+        try:
+            taken = LoadCounters()
+            for attr in ("reads", "writes", "nbytes", "read_errors",
+                         "write_errors", "errnos"):
+                setattr(taken, attr, getattr(self, attr))
+            self.clear()
+        finally:
+            self.lock.release()
+        return taken
+
+    def errors(self):
+        return self.read_errors + self.write_errors
+
+    def ios(self):
+        return self.reads + self.writes
+
+
+class LoadQueue:
+    """Base class for keeping I/O in flight on one device"""
+    def __init__(self, dev, depth, writes, nbytes=LOAD_BYTES):
+        self.dev = dev
+        self.depth = depth
+        self.writes = writes
+        self.nbytes = nbytes
+        self.nblocks = nbytes // BLOCK_SIZE
+        self.counters = LoadCounters()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.rand = random.Random()
+
+    def nextIo(self):
+        """Choose the next transfer: (write, lba)"""
+        return (self.rand.randrange(100) < self.writes,
+                self.rand.randrange(max(1, self.capacity - self.nblocks)))
+
+    def startThread(self, target, *args):
+        t = threading.Thread(target=target, args=args)
+        t.setDaemon(True)
+        t.start()
+        self.threads.append(t)
+
+    def stop(self):
+        """Stop, and wait for what is in flight"""
+        self.stopping.set()
+        for t in self.threads:
+            t.join()
+
+
+class AioQueue(LoadQueue):
+    """Keeps I/O in flight on a device using native AIO"""
+    def start(self):
+        self.fd = os.open(self.dev, os.O_RDWR | os.O_DIRECT)
+        self.capacity = os.lseek(self.fd, 0, os.SEEK_END) // BLOCK_SIZE
+        self.ctx = ctypes.c_ulong(0)
+        try:
+            aioSyscall("io_setup", ctypes.c_long(self.depth),
+                       ctypes.byref(self.ctx))
+        except OSError:
+            os.close(self.fd)
+            raise
+        # a buffer for each read, and one (of zeros) all writes share
+        self.bufs = mmap.mmap(-1, (self.depth + 1) * self.nbytes)
+        self.base = ctypes.addressof(ctypes.c_char.from_buffer(self.bufs))
+        self.iocbs = (Iocb * self.depth)()
+        self.startThread(self.run)
+
+    def submit(self, slot):
+        """Start the next transfer in a slot, returning whether it was
+        started"""
+        (write, lba) = self.nextIo()
+        iocb = self.iocbs[slot]
+        ctypes.memset(ctypes.byref(iocb), 0, ctypes.sizeof(iocb))
+        iocb.aio_data = slot
+        iocb.aio_fildes = self.fd
+        if write:
+            iocb.aio_lio_opcode = IOCB_CMD_PWRITE
+            iocb.aio_buf = self.base + self.depth * self.nbytes
+        else:
+            iocb.aio_lio_opcode = IOCB_CMD_PREAD
+            iocb.aio_buf = self.base + slot * self.nbytes
+        iocb.aio_nbytes = self.nbytes
+        iocb.aio_offset = lba * BLOCK_SIZE
+        ptr = (ctypes.POINTER(Iocb) * 1)(ctypes.pointer(iocb))
+        try:
+            aioSyscall("io_submit", self.ctx, ctypes.c_long(1), ptr)
+        except OSError, e:
+            self.counters.add(write, 0, self.nbytes, e.errno)
+            return False
+        return True
+
+    def run(self):
+        events = (IoEvent * self.depth)()
+        timeout = Timespec(0, REAP_TIMEOUT_NS)
+        idle = range(self.depth)
+        inflight = 0
+        while True:
+            if not self.stopping.isSet():
+                while idle:
+                    slot = idle.pop()
+                    if self.submit(slot):
+                        inflight += 1
+                    else:
+                        idle.append(slot)
+                        break
+            elif not inflight:
+                break
+            try:
+                n = aioSyscall("io_getevents", self.ctx, ctypes.c_long(1),
+                               ctypes.c_long(self.depth), events,
+                               ctypes.byref(timeout))
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            for ev in events[:n]:
+                slot = int(ev.data)
+                write = self.iocbs[slot].aio_lio_opcode == IOCB_CMD_PWRITE
+                if ev.res < 0:
+                    self.counters.add(write, 0, self.nbytes, -ev.res)
+                else:
+                    self.counters.add(write, ev.res, self.nbytes)
+                inflight -= 1
+                idle.append(slot)
+        aioSyscall("io_destroy", self.ctx)
+        os.close(self.fd)
+
+
+def makeLoadEngine(dev):
+    """Create an I/O engine for one load thread: each has a worker
+    process of its own, as a worker serves one request at a time, and
+    the device's shared one is not to be closed by the load"""
+    if config.io_engine == "worker":
+        from worker import Worker, WorkerIoEngine
+        return WorkerIoEngine(dev, Worker(dev))
+    return makeIoEngine(dev, config.io_engine)
+
+
+class ThreadQueue(LoadQueue):
+    """Keeps I/O in flight on a device from a pool of threads"""
+    def start(self):
+        engines = [makeLoadEngine(self.dev) for i in range(self.depth)]
+        try:
+            self.capacity = engines[0].capacity()
+        except Exception:
+            for io in engines:
+                io.close()
+            raise
+        for io in engines:
+            self.startThread(self.run, io)
+
+    def run(self, io):
+        try:
+            while not self.stopping.isSet():
+                (write, lba) = self.nextIo()
+                (res,) = io.sweep([(lba, self.nblocks)], write)
+                self.counters.add(write, getattr(res, "nbytes", 0),
+                                  self.nbytes, getattr(res, "errno", 0))
+        finally:
+            io.close()
+
+
+################################################################
+
+class LoadReport:
+    """The samples taken from a load: (seconds from the start, dev,
+    LoadCounters), every interval"""
+    def __init__(self, devs, engine):
+        self.devs = devs
+        self.engine = engine
+        self.samples = []
+
+    def add(self, elapsed, dev, counters, secs):
+        self.samples.append((elapsed, dev, counters, secs))
+
+    def totals(self, dev):
+        """All the I/O done on one device, as LoadCounters"""
+        total = LoadCounters()
+        for (elapsed, sdev, counters, secs) in self.samples:
+            if sdev != dev:
+                continue
+            for attr in ("reads", "writes", "nbytes", "read_errors",
+                         "write_errors"):
+                setattr(total, attr,
+                        getattr(total, attr) + getattr(counters, attr))
+            for (err, count) in counters.errnos.items():
+                total.errnos[err] = total.errnos.get(err, 0) + count
+        return total
+
+    def seconds(self, dev):
+        return sum([secs for (elapsed, sdev, counters, secs) in self.samples
+                    if sdev == dev])
+
+    def formatLine(self, label, counters, secs):
+        secs = max(secs, 1e-9)
+        errnos = ", ".join(["%s=%d" % (errno.errorcode.get(e, e), n)
+                            for (e, n) in sorted(counters.errnos.items())])
+        return "  %-14s %8.1f MiB/s %8.0f IOPS  r=%-7d w=%-7d " \
+               "errors r=%d w=%d %s" % \
+               (label, counters.nbytes / secs / (1 << 20),
+                counters.ios() / secs, counters.reads, counters.writes,
+                counters.read_errors, counters.write_errors, errnos)
+
+    def format(self):
+        """Format the report for display"""
+        lines = ["I/O load (%s):" % self.engine]
+        for (elapsed, dev, counters, secs) in self.samples:
+            lines.append(self.formatLine("%6.2fs %s" % (elapsed, dev),
+                                         counters, secs))
+        for dev in self.devs:
+            lines.append(self.formatLine("total %s" % dev, self.totals(dev),
+                                         self.seconds(dev)))
+        return "\n".join(lines)
+
+
+class IoLoad:
+    """Keeps I/O in flight on several devices, sampling what it does
+    every interval"""
+    def __init__(self, devs, depth=None, writes=None, interval=None,
+                 engine=None, nbytes=LOAD_BYTES):
+        if depth is None:
+            depth = config.load_depth
+        if writes is None:
+            writes = config.load_writes
+        if interval is None:
+            interval = config.load_interval
+        if engine is None:
+            engine = config.load_engine
+        if engine == "auto":
+            if config.io_engine == "direct" and aioAvailable():
+                engine = "aio"
+            else:
+                engine = "threads"
+        if engine not in ("aio", "threads"):
+            raise ValueError("Unknown load engine: %s" % engine)
+        self.devs = devs
+        self.interval = interval
+        self.engine = engine
+        cls = engine == "aio" and AioQueue or ThreadQueue
+        self.queues = [cls(dev, depth, writes, nbytes) for dev in devs]
+        self.stopping = threading.Event()
+        self.report = LoadReport(devs, engine)
+
+    def start(self):
+        """Start the load on every device (or, if it cannot be started
+        on one, on none)"""
+        log.debug("Starting %s I/O load on %s" % (self.engine, self.devs))
+        started = []
+        try:
+            for q in self.queues:
+                q.start()
+                started.append(q)
+        except Exception:
+            for q in started:
+                q.stop()
+            raise
+        self.start_ns = self.last_ns = monotonicNs()
+        self.sampler = threading.Thread(target=self.sampleLoop)
+        self.sampler.setDaemon(True)
+        self.sampler.start()
+
+    def sample(self):
+        now = monotonicNs()
+        for q in self.queues:
+            self.report.add((now - self.start_ns) / 1e9, q.dev,
+                            q.counters.take(), (now - self.last_ns) / 1e9)
+        self.last_ns = now
+
+    def sampleLoop(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        """Stop the load, returning its LoadReport"""
+        self.stopping.set()
+        self.sampler.join()
+        for q in self.queues:
+            q.stop()
+        self.sample()
+        return self.report
+
+
+def runAlongside(loaded, changer, prout_type, rounds, hold=None, **kwargs):
+    """Keep I/O load on the loaded initiators while the changer
+    registers, reserves, releases, and clears, rounds times, holding
+    each state for hold seconds (half an interval, by default).
+    Returns (the LoadReport, the changer's [(op, result)])."""
+    load = IoLoad([i.dev for i in loaded], **kwargs)
+    if hold is None:
+        hold = load.interval / 2
+    results = []
+    load.start()
+    try:
+        for r in range(rounds):
+            results.append(("REGISTER", changer.register()))
+            results.append(("RESERVE", changer.reserve(prout_type)))
+            time.sleep(hold)
+            results.append(("RELEASE", changer.release(prout_type)))
+            time.sleep(hold)
+            results.append(("RESERVE", changer.reserve(prout_type)))
+            time.sleep(hold)
+            results.append(("CLEAR", changer.clear()))
+            time.sleep(hold)
+    finally:
+        report = load.stop()
+    return (report, results)
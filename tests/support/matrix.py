@@ -0,0 +1,148 @@
+#!/usr/bin/python
+"""
+matrix -- reservation type test matrix for PGR testing
+
+The reservation type tests differ only in what each initiator may do
+under each type. Here that is one table, and the test cases for every
+reservation type x role (holder, other registrant, non-registrant) x
+action (read, write, release, unregister) are generated from it.
+
+Cases that do not change the PR state (read and write) share one
+reservation set up per type; the others set up their state each, but
+only send the commands needed to get there (see fixture).
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import unittest
+
+from fixture import ensurePrState, wantedHolderKey
+from reservation import ProutTypes, AllRegistrantsTypes
+from visibility import waitForReservation, waitForNoReservation
+
+
+__all__ = [
+    'Roles',
+    'Actions',
+    'AccessTable',
+    'expectedOutcome',
+    'makeMatrixTestCases',
+    ]
+
+################################################################
+
+Roles = ("holder", "registrant", "nonregistrant")
+Actions = ("read", "write", "release", "unregister")
+
+Y = True
+N = False
+
+# (read, write) access for the roles other than the holder, which
+# always has both
+AccessTable = {
+    ProutTypes["WriteExclusive"] :
+        {"registrant" : (Y, N), "nonregistrant" : (Y, N)},
+    ProutTypes["ExclusiveAccess"] :
+        {"registrant" : (N, N), "nonregistrant" : (N, N)},
+    ProutTypes["WriteExclusiveRegistrantsOnly"] :
+        {"registrant" : (Y, Y), "nonregistrant" : (Y, N)},
+    ProutTypes["ExclusiveAccessRegistrantsOnly"] :
+        {"registrant" : (Y, Y), "nonregistrant" : (N, N)},
+    ProutTypes["WriteExclusiveAllRegistrants"] :
+        {"registrant" : (Y, Y), "nonregistrant" : (Y, N)},
+    ProutTypes["ExclusiveAccessAllRegistrants"] :
+        {"registrant" : (Y, Y), "nonregistrant" : (N, N)},
+    }
+
+
+def expectedOutcome(rtype, role, action):
+    """What should happen: for read and write, whether it is allowed;
+    for release and unregister, (exit status, whether the reservation
+    is gone afterwards)"""
+    all_registrants = int(rtype) in AllRegistrantsTypes
+    if action in ("read", "write"):
+        if role == "holder":
+            return True
+        return AccessTable[rtype][role][action == "write"]
+    if action == "release":
+        if role == "holder":
+            return (0, True)
+        if role == "registrant":
+            # releasing someone else's reservation does nothing
+            return (0, all_registrants)
+        return (24, False)
+    # unregister (a non-registrant has nothing to unregister)
+    if role == "holder":
+        return (0, not all_registrants)
+    return (0, False)
+
+
+################################################################
+
+def makeMatrixTestCases(name, rtype, holder, registrant, nonregistrant):
+    """Return (access, state) TestCase classes for one reservation
+    type, with a test method for each role and action"""
+    inits = [holder, registrant, nonregistrant]
+    roles = {"holder" : holder,
+             "registrant" : registrant,
+             "nonregistrant" : nonregistrant}
+    resvn_key = wantedHolderKey(holder, rtype)
+
+    def reserve():
+        ensurePrState(inits, registered=[holder, registrant],
+                      holder=holder, rtype=rtype)
+        waitForReservation(inits, resvn_key, rtype)
+
+    def setUpClass(cls):
+        reserve()
+
+    def setUp(self):
+        reserve()
+
+    def accessTest(role, action):
+        def test(self):
+            init = roles[role]
+            if action == "read":
+                ret = init.readFromTarget()
+            else:
+                ret = init.writeToTarget()
+            allowed = expectedOutcome(rtype, role, action)
+            self.assertEqual(ret.result, not allowed and 1 or 0)
+        return test
+
+    def stateTest(role, action):
+        def test(self):
+            init = roles[role]
+            if action == "release":
+                res = init.release(rtype)
+            else:
+                res = init.unregister()
+            (status, released) = expectedOutcome(rtype, role, action)
+            self.assertEqual(res, status)
+            if released:
+                waitForNoReservation(inits)
+            snap = holder.snapshot()
+            if released:
+                self.assertEqual(snap.key, None)
+            else:
+                self.assertEqual(snap.key, resvn_key)
+                self.assertEqual(snap.getRtypeNum(), rtype)
+            if action == "unregister" and init.key is not None:
+                self.assertFalse(snap.isRegistered(init.key))
+        return test
+
+    # the access cases share one reservation, set up once
+    access = {"__doc__" : "Test %s read and write access" % name,
+              "setUpClass" : classmethod(setUpClass)}
+    state = {"__doc__" : "Test %s release and unregister" % name,
+             "setUp" : setUp}
+    for role in Roles:
+        for action in Actions:
+            method = "test%s%s" % (role.capitalize(), action.capitalize())
+            if action in ("read", "write"):
+                access[method] = accessTest(role, action)
+            else:
+                state[method] = stateTest(role, action)
+    return (type("test%sAccessTestCase" % name, (unittest.TestCase,), access),
+            type("test%sStateTestCase" % name, (unittest.TestCase,), state))
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+"""
+opbench -- PR operation micro-benchmarks for PGR testing
+
+Drives each Initiator operation in a tight loop, for a given time
+per operation and initiator, and reports operations per second and
+latency percentiles, per operation and per initiator. Commands that
+an operation needs first (e.g. RESERVE before RELEASE) are sent
+between the timed ones, and are not counted.
+
+The results are a dict (see runOpBench()), which can be written as
+JSON to compare one target build with another.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import time
+import logging
+
+import config
+from clock import monotonicNs
+from reservation import ProutTypes
+from stats import summarize, formatSummary
+
+
+__all__ = [
+    'benchOps',
+    'runOpBench',
+    'formatOpBench',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+def noop(init, rtype):
+    pass
+
+# name -> (untimed preparation, timed operation, needs registration)
+benchOps = {
+    "REGISTER" : (lambda i, t: i.unregister(),
+                  lambda i, t: i.register(), False),
+    "UNREGISTER" : (lambda i, t: i.register(),
+                    lambda i, t: i.unregister(), False),
+    "RESERVE" : (lambda i, t: i.release(t),
+                 lambda i, t: i.reserve(t), True),
+    "RELEASE" : (lambda i, t: i.reserve(t),
+                 lambda i, t: i.release(t), True),
+    "CLEAR" : (lambda i, t: i.register(),
+               lambda i, t: i.clear(), False),
+    "READ KEYS" : (noop, lambda i, t: i.getRegistrants(), True),
+    "READ RESERVATION" : (noop, lambda i, t: i.getReservation(), True),
+    }
+
+# commands returning data (not a result) fail when they return None
+data_ops = ("READ KEYS", "READ RESERVATION")
+
+
+def addRate(summary, latencies):
+    """Add operations per second (of device time) to a summary"""
+    total = sum(latencies)
+    if total:
+        summary["ops_per_sec"] = len(latencies) * 1000000000.0 / total
+    else:
+        summary["ops_per_sec"] = None
+    return summary
+
+
+def loopOp(init, name, duration, rtype):
+    """Run one operation from one initiator for duration seconds,
+    returning (latencies in ns, number of failures)"""
+    (prep, op, _) = benchOps[name]
+    latencies = []
+    failures = 0
+    deadline = monotonicNs() + int(duration * 1000000000)
+    while monotonicNs() < deadline:
+        prep(init, rtype)
+        start = monotonicNs()
+        res = op(init, rtype)
+        latencies.append(monotonicNs() - start)
+        if (name in data_ops and res is None) or \
+               (name not in data_ops and res != 0):
+            failures += 1
+    return (latencies, failures)
+
+
+def runOpBench(fleet, duration=1.0, ops=None,
+               rtype=ProutTypes["WriteExclusive"]):
+    """Benchmark each operation from each fleet member in turn,
+    returning a dict of results (latencies in ns):
+
+        {"duration": ..., "transport": ..., "serial": ...,
+         "ops": {name: {"all": summary,
+                        "initiators": {key: summary}}}}
+
+    where each summary is from stats.summarize(), with "ops_per_sec"
+    and "failures" added"""
+    if ops is None:
+        ops = sorted(benchOps.keys())
+    results = {"started" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "duration" : duration,
+               "transport" : config.transport,
+               "rtype" : rtype,
+               "devices" : [m.dev for m in fleet],
+               "serial" : fleet[0].getDiskInquirySn(),
+               "ops" : {}}
+    for name in ops:
+        every = []
+        failed = 0
+        per_init = {}
+        for init in fleet:
+            fleet.reset()
+            if benchOps[name][2]:
+                init.register()
+            (latencies, failures) = loopOp(init, name, duration, rtype)
+            s = addRate(summarize(latencies), latencies)
+            s["failures"] = failures
+            per_init[init.key] = s
+            every.extend(latencies)
+            failed += failures
+            log.debug("%s from %s: %s" % (name, init.key, s))
+        s = addRate(summarize(every), every)
+        s["failures"] = failed
+        results["ops"][name] = {"all" : s, "initiators" : per_init}
+    fleet.reset()
+    return results
+
+
+def formatOpBench(results):
+    """Format the output of runOpBench() for display"""
+    lines = []
+    for name in sorted(results["ops"].keys()):
+        op = results["ops"][name]
+        lines.append(formatLine(name, op["all"]))
+        for key in sorted(op["initiators"].keys()):
+            lines.append(formatLine("  " + key, op["initiators"][key]))
+    return "\n".join(lines)
+
+def formatLine(label, s):
+    rate = s["ops_per_sec"] and "%10.1f/s" % s["ops_per_sec"] or \
+           "%12s" % "-"
+    return "%-20s %s fail=%-4d %s" % (label, rate, s["failures"],
+                                      formatSummary(s))
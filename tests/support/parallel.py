@@ -0,0 +1,126 @@
+#!/usr/bin/python
+"""
+parallel -- issue commands from several initiators concurrently
+
+Each initiator has its own device (and descriptor), so commands for
+different initiators can be in flight at the same time: the time
+taken is then that of the slowest, not the sum of them all.
+
+For example, to get the serial number from three devices at once:
+
+    sns = callEach([initA, initB, initC], "getDiskInquirySn")
+
+or, to overlap calls that differ:
+
+    (a, b) = gather(AsyncInitiator(initA).getReservation(),
+                    AsyncInitiator(initB).getRegistrants())
+
+The commands are run in threads (the SG_IO ioctl, direct I/O, and
+waiting for a child process all let other threads run meanwhile).
+Calls to the same initiator are still done one at a time.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import weakref
+import threading
+import logging
+
+
+__all__ = [
+    'Pending',
+    'AsyncInitiator',
+    'spawn',
+    'gather',
+    'callEach',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+
+class Pending:
+    """The eventual result of a call running in the background"""
+    def __init__(self, fn, args=(), kwargs={}, lock=None):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.lock = lock
+        self.value = None
+        self.exc_info = None
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _run(self):
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            try:
+                self.value = self.fn(*self.args, **self.kwargs)
+            except:
+                self.exc_info = sys.exc_info()
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+    def done(self):
+        """Has the call finished?"""
+        return not self.thread.isAlive()
+
+    def result(self):
+        """Wait for the call to finish, and return its result (or raise
+        its exception)"""
+        self.thread.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+
+def spawn(fn, *args, **kwargs):
+    """Start calling fn in the background, returning a Pending"""
+    return Pending(fn, args, kwargs)
+
+def gather(*pendings):
+    """Wait for all the Pending calls, returning their results"""
+    return [p.result() for p in pendings]
+
+
+class AsyncInitiator:
+    """An Initiator whose methods return a Pending instead of waiting"""
+
+    # one lock per transport (copies of an Initiator share one), so
+    # that calls for the same device are done in turn, going when the
+    # transport does
+    locks = weakref.WeakKeyDictionary()
+    locks_lock = threading.Lock()
+
+    def __init__(self, init):
+        self.init = init
+        self.locks_lock.acquire()
+        try:
+            self.lock = self.locks.setdefault(init.transport,
+                                              threading.Lock())
+        finally:
+            self.locks_lock.release()
+
+    def __getattr__(self, name):
+        attr = getattr(self.init, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            return Pending(attr, args, kwargs, lock=self.lock)
+        return call
+
+
+def callEach(inits, method, *args):
+    """Call the same method on each initiator concurrently, returning
+    the list of results"""
+    log.debug("Calling %s on %d initiators" % (method, len(inits)))
+    return gather(*[getattr(AsyncInitiator(i), method)(*args)
+                    for i in inits])
@@ -0,0 +1,213 @@
+#!/usr/bin/python
+"""
+pattern -- self-describing block patterns, to check what reached media
+
+The probes write zeros, so they cannot tell whether a write that was
+rejected partly landed, or a write that was allowed was lost. Instead
+every block can be written with a pattern saying who wrote it:
+
+    offset  size
+         0     8  magic, "PGRBLK01"
+         8     4  CRC-32 of the rest of the block (from offset 12)
+        12     4  initiator id (a CRC-32 of its device name)
+        16     8  sequence number (per initiator)
+        24     8  LBA
+        32     -  the 20 bytes from offset 12, repeated
+
+Reading back, each block is classified as holding the pattern wanted,
+zeros, another pattern (e.g. an older write), a pattern for another
+LBA, or garbage (a bad magic or CRC). The blocks are built in, and
+checked in place from, the I/O engine's own aligned buffer, reused
+from call to call, using buffer() and struct.unpack_from() rather
+than copying out slices. Large transfers go CHUNK bytes at a time.
+
+With PGR_VERIFY_WRITES=1, writeToTarget() writes a pattern, reads it
+back, and raises IntegrityError if an allowed write did not land, a
+rejected write did, or the block is garbage. With PGR_ACCESS_SWEEP=1
+too, every region of the sweep is written and verified that way.
+(Under Exclusive Access a rejected writer cannot read back either, so
+that is not verified.)
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import zlib
+import struct
+import atexit
+import logging
+
+from probe import BLOCK_SIZE
+
+
+__all__ = [
+    'IntegrityError',
+    'VerifyResult',
+    'initiatorId',
+    'makeBlock',
+    'fillPattern',
+    'checkBlock',
+    'writePattern',
+    'verifyPattern',
+    'counts',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+MAGIC = "PGRBLK01"
+HEADER = struct.Struct(">8sIIQQ")
+CRC_START = 12
+
+CHUNK = 1 << 20
+
+# what a block can hold
+OK = "ok"
+ZEROS = "zeros"
+OTHER = "other"
+MISPLACED = "misplaced"
+GARBAGE = "garbage"
+
+# writes verified (or not) by writeToTarget, for the report at exit
+counts = {"verified" : 0, "unverified" : 0}
+
+
+class IntegrityError(AssertionError):
+    """What reached the media is not what the write's outcome says"""
+    pass
+
+
+def initiatorId(dev):
+    """The initiator id written in patterns, for a device"""
+    return zlib.crc32(dev) & 0xffffffff
+
+def makeBlock(init_id, seq, lba, block_size=BLOCK_SIZE):
+    """Return the pattern for one block"""
+    tail = struct.pack(">IQQ", init_id, seq, lba)
+    body = (tail * (block_size // len(tail) + 1))[:block_size - CRC_START]
+    crc = zlib.crc32(body) & 0xffffffff
+    return MAGIC + struct.pack(">I", crc) + body
+
+def fillPattern(buf, init_id, seq, lba, nblocks, block_size=BLOCK_SIZE):
+    """Fill the start of buf with the pattern for nblocks blocks from
+    lba"""
+    for i in range(nblocks):
+        off = i * block_size
+        buf[off:off + block_size] = makeBlock(init_id, seq, lba + i,
+                                              block_size)
+
+zero_crcs = {}
+
+def zeroCrc(block_size):
+    """The CRC-32 of a block of zeros"""
+    if block_size not in zero_crcs:
+        zero_crcs[block_size] = zlib.crc32("\0" * block_size) & 0xffffffff
+    return zero_crcs[block_size]
+
+def checkBlock(buf, off, lba, init_id=None, seq=None,
+               block_size=BLOCK_SIZE):
+    """Classify the block at offset off of buf, read from lba, against
+    the writer and sequence number wanted (if given), returning
+    (what, init_id, seq)"""
+    (magic, crc, bid, bseq, blba) = HEADER.unpack_from(buf, off)
+    if magic != MAGIC:
+        if magic == "\0" * 8 and zeroCrc(block_size) == \
+               zlib.crc32(buffer(buf, off, block_size)) & 0xffffffff:
+            return (ZEROS, None, None)
+        return (GARBAGE, None, None)
+    body = buffer(buf, off + CRC_START, block_size - CRC_START)
+    if zlib.crc32(body) & 0xffffffff != crc:
+        return (GARBAGE, bid, bseq)
+    if blba != lba:
+        return (MISPLACED, bid, bseq)
+    if (init_id is not None and bid != init_id) or \
+           (seq is not None and bseq != seq):
+        return (OTHER, bid, bseq)
+    return (OK, bid, bseq)
+
+
+class VerifyResult:
+    """What a range of blocks was found to hold: a count of each
+    classification, the LBAs of the first few that were not as
+    wanted, and how many could not be read"""
+    MAX_BAD = 8
+
+    def __init__(self):
+        self.counts = {}
+        self.bad = []                   # [(lba, what, init_id, seq)]
+        self.unread = 0
+
+    def add(self, lba, what, init_id, seq):
+        self.counts[what] = self.counts.get(what, 0) + 1
+        if what != OK and len(self.bad) < self.MAX_BAD:
+            self.bad.append((lba, what, init_id, seq))
+
+    def count(self, what):
+        return self.counts.get(what, 0)
+
+    def __repr__(self):
+        return "VerifyResult(counts=%s, unread=%d, bad=%s)" % \
+               (self.counts, self.unread, self.bad)
+
+
+def chunks(lba, nblocks, block_size):
+    """Split a range into (lba, nblocks) of at most CHUNK bytes"""
+    per = max(1, CHUNK // block_size)
+    while nblocks > 0:
+        n = min(per, nblocks)
+        yield (lba, n)
+        lba += n
+        nblocks -= n
+
+def writePattern(io, lba, nblocks, init_id, seq):
+    """Write the pattern to nblocks blocks from lba, returning the
+    ProbeResult for each chunk"""
+    results = []
+    for (clba, n) in chunks(lba, nblocks, io.block_size):
+        fillPattern(io.growBuffer(n), init_id, seq, clba, n, io.block_size)
+        results.append(io.writeBuffer(clba, n))
+    return results
+
+def verifyPattern(io, lba, nblocks, init_id=None, seq=None):
+    """Read back nblocks blocks from lba, classifying each against the
+    writer and sequence number wanted, returning a VerifyResult"""
+    bs = io.block_size
+    res = VerifyResult()
+    for (clba, n) in chunks(lba, nblocks, bs):
+        io.growBuffer(n)
+        if io.read(clba, n).result != 0:
+            res.unread += n
+            continue
+        buf = io.buf
+        unpack = HEADER.unpack_from
+        crc32 = zlib.crc32
+        good = 0
+        for i in range(n):
+            off = i * bs
+            (magic, crc, bid, bseq, blba) = unpack(buf, off)
+            # the usual case, checked here; anything else in full
+            if magic == MAGIC and blba == clba + i and \
+                   init_id in (None, bid) and seq in (None, bseq) and \
+                   crc32(buffer(buf, off + CRC_START,
+                                bs - CRC_START)) & 0xffffffff == crc:
+                good += 1
+                continue
+            (what, bid, bseq) = checkBlock(buf, off, clba + i, init_id,
+                                           seq, bs)
+            res.add(clba + i, what, bid, bseq)
+        if good:
+            res.counts[OK] = res.counts.get(OK, 0) + good
+    return res
+
+
+def reportAtExit():
+    if counts["verified"] or counts["unverified"]:
+        sys.stderr.write("Write verification: %d verified, %d could not "
+                         "be read back\n" % (counts["verified"],
+                                             counts["unverified"]))
+
+atexit.register(reportAtExit)
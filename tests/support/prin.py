@@ -0,0 +1,151 @@
+#!/usr/bin/python
+"""
+prin -- PERSISTENT RESERVE IN parameter data decoding for PGR testing
+
+Decodes the binary parameter data returned by READ KEYS, READ
+RESERVATION, and READ FULL STATUS into compact records. Decoding is
+done over a memoryview, so that nothing is copied (transport IDs are
+returned as memoryview slices), and is linear in the size of the
+data, so large registrant lists are no problem.
+
+Each record has a "needed" field: the number of bytes the device had
+to return. If that is more than was received the data was truncated,
+and the command should be reissued with a larger allocation length.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import struct
+from collections import namedtuple
+
+
+__all__ = [
+    'ReadKeys',
+    'ReadReservation',
+    'FullStatus',
+    'StatusDescriptor',
+    'DecodeError',
+    'decodeReadKeys',
+    'decodeReadReservation',
+    'decodeReadFullStatus',
+    'transportIdName',
+    'hexDumpToBytes',
+    ]
+
+################################################################
+
+HDR_LEN = 8
+KEY_LEN = 8
+RESVN_DESC_LEN = 16
+STATUS_DESC_HDR_LEN = 24
+
+ReadKeys = namedtuple("ReadKeys", "generation keys needed")
+
+# key, scope, and rtype are None if there is no reservation
+ReadReservation = namedtuple("ReadReservation",
+                             "generation key scope rtype needed")
+
+FullStatus = namedtuple("FullStatus", "generation descriptors needed")
+
+StatusDescriptor = namedtuple("StatusDescriptor",
+                              "key all_tg_pt r_holder scope rtype "
+                              "rel_tgt_port transport_id")
+
+
+class DecodeError(ValueError):
+    """Parameter data too short, or otherwise malformed"""
+    pass
+
+
+def _header(buf):
+    """Return (memoryview, generation, additional-length, available)"""
+    mv = memoryview(buf)
+    if len(mv) < HDR_LEN:
+        raise DecodeError("PR IN data too short: %d bytes" % len(mv))
+    (gen, add_len) = struct.unpack_from(">II", mv, 0)
+    return (mv, gen, add_len, min(add_len, len(mv) - HDR_LEN))
+
+
+def decodeReadKeys(buf):
+    """Decode READ KEYS parameter data"""
+    (mv, gen, add_len, avail) = _header(buf)
+    nkeys = avail // KEY_LEN
+    keys = struct.unpack_from(">%dQ" % nkeys, mv, HDR_LEN)
+    return ReadKeys(gen, keys, HDR_LEN + add_len)
+
+
+def decodeReadReservation(buf):
+    """Decode READ RESERVATION parameter data"""
+    (mv, gen, add_len, avail) = _header(buf)
+    if avail < RESVN_DESC_LEN:
+        return ReadReservation(gen, None, None, None, HDR_LEN + add_len)
+    (key, stype) = struct.unpack_from(">Q5xB", mv, HDR_LEN)
+    return ReadReservation(gen, key, stype >> 4, stype & 0xf,
+                           HDR_LEN + add_len)
+
+
+def decodeReadFullStatus(buf):
+    """Decode READ FULL STATUS parameter data"""
+    (mv, gen, add_len, avail) = _header(buf)
+    end = HDR_LEN + avail
+    descs = []
+    off = HDR_LEN
+    while off + STATUS_DESC_HDR_LEN <= end:
+        (key, flags, stype, rel_tgt_port, tid_len) = \
+              struct.unpack_from(">Q4xBB4xHI", mv, off)
+        tid_start = off + STATUS_DESC_HDR_LEN
+        if tid_start + tid_len > end:
+            # truncated descriptor
+            break
+        descs.append(StatusDescriptor(key,
+                                      bool(flags & 0x2),
+                                      bool(flags & 0x1),
+                                      stype >> 4,
+                                      stype & 0xf,
+                                      rel_tgt_port,
+                                      mv[tid_start:tid_start + tid_len]))
+        off = tid_start + tid_len
+    return FullStatus(gen, descs, HDR_LEN + add_len)
+
+
+def transportIdName(tid):
+    """Return the iSCSI name from a TransportID, or None"""
+    if tid is None or len(tid) < 4:
+        return None
+    (proto, name_len) = struct.unpack_from(">BxH", tid, 0)
+    if proto & 0xf != 0x5:              # not iSCSI
+        return None
+    name = tid[4:4 + name_len].tobytes()
+    return name.split("\0")[0].split(",")[0]
+
+
+def hexDumpToBytes(lines):
+    """Convert a hex dump (as from "sg_persist --hex") back to bytes
+
+    Each dump line is an offset followed by up to 16 hex bytes, and
+    maybe an ASCII rendering. The additional length in the first 8
+    bytes says how much data there is, so the ASCII is never
+    mistaken for data."""
+    out = bytearray()
+    total = None
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 2 or line[:1] != " ":
+            continue
+        try:
+            int(fields[0], 16)
+        except ValueError:
+            continue
+        for f in fields[1:17]:
+            if total is not None and len(out) >= total:
+                break
+            if len(f) != 2:
+                break
+            try:
+                out.append(int(f, 16))
+            except ValueError:
+                break
+            if total is None and len(out) == HDR_LEN:
+                total = HDR_LEN + struct.unpack_from(">I", bytes(out), 4)[0]
+    return bytes(out)
@@ -0,0 +1,309 @@
+#!/usr/bin/python
+"""
+probe -- read/write access probes for PGR testing
+
+An I/O engine checks whether an initiator can read from or write to
+the target. Two are provided:
+
+ - DirectIoEngine: keeps one O_DIRECT descriptor and one page-aligned
+   buffer open per initiator, and does the pread/pwrite in-process
+   (the default)
+ - DdIoEngine: runs "dd" with direct I/O for each probe (the fallback)
+
+Either way the result is a ProbeResult, with a "result" that is 0 for
+success and 1 for failure, just like the exit status of dd, and the
+errno the I/O failed with, which is as close as the block layer lets
+us get to the SCSI status: EBADE is a RESERVATION CONFLICT, and
+ETIMEDOUT a timeout (EIO could be anything).
+
+Each engine can also sweep a list of (lba, nblocks) regions (see
+sweep.py), returning a result for each, and say how many blocks the
+device has. The direct engine does each region with one
+preadv/pwritev, however large, from a reusable 1 MiB buffer.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import mmap
+import errno
+import ctypes
+import ctypes.util
+import logging
+
+import config
+from clock import monotonicNs
+from cmd import runCmdWithOutput
+from deadline import watchdog
+from sense import ScsiStatus
+
+
+__all__ = [
+    'ProbeResult',
+    'DirectIoEngine',
+    'DdIoEngine',
+    'makeIoEngine',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+BLOCK_SIZE = 4096
+PROBE_LBA = 1
+
+# the buffer a sweep's vectored I/O uses, over and over for a region
+# larger than it
+SWEEP_CHUNK = 1 << 20
+IOV_MAX = 1024
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+for _fn in (_libc.pread, _libc.pwrite):
+    _fn.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t,
+                    ctypes.c_int64]
+    _fn.restype = ctypes.c_ssize_t
+
+
+class Iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p),
+                ("iov_len", ctypes.c_size_t)]
+
+for _fn in (_libc.preadv, _libc.pwritev):
+    _fn.argtypes = [ctypes.c_int, ctypes.POINTER(Iovec), ctypes.c_int,
+                    ctypes.c_int64]
+    _fn.restype = ctypes.c_ssize_t
+
+
+# the SCSI status an errno tells us of, if any
+errno_status = {
+    0 : ScsiStatus["Good"],
+    errno.EBADE : ScsiStatus["ReservationConflict"]}
+
+# errnos by message, for dd's
+errno_messages = dict([(os.strerror(e), e) for e in errno.errorcode])
+
+
+class ProbeResult:
+    """The outcome of one read or write probe"""
+    def __init__(self, errno=0, nbytes=0, elapsed_ns=0, expected=None):
+        self.errno = errno
+        self.nbytes = nbytes
+        self.elapsed_ns = elapsed_ns
+        # the block layer passes on no sense data
+        self.status = errno_status.get(errno)
+        self.sense = None
+        if errno or (expected is not None and nbytes != expected):
+            self.result = 1
+        else:
+            self.result = 0
+    def isConflict(self):
+        """Was it refused with a RESERVATION CONFLICT?"""
+        return self.status == ScsiStatus["ReservationConflict"]
+    def isTimeout(self):
+        """Did it time out?"""
+        return self.errno == errno.ETIMEDOUT
+    def __repr__(self):
+        return "ProbeResult(result=%d, errno=%d, nbytes=%d, elapsed_ns=%d)" % \
+               (self.result, self.errno, self.nbytes, self.elapsed_ns)
+
+
+class DirectIoEngine:
+    """Probe I/O done in-process, using O_DIRECT"""
+    def __init__(self, dev, block_size=BLOCK_SIZE, buf_size=None):
+        self.dev = dev
+        self.block_size = block_size
+        self.fd = None
+        if buf_size is None:
+            buf_size = block_size
+        # anonymous mmap memory is page-aligned, as O_DIRECT requires
+        self.buf = mmap.mmap(-1, buf_size)
+        self.buf_addr = ctypes.addressof(ctypes.c_char.from_buffer(self.buf))
+        # made the first time we sweep
+        self.sweep_buf = None
+
+    def open(self):
+        """Open the device, if not already open"""
+        if self.fd is None:
+            log.debug("Opening %s for direct I/O" % self.dev)
+            self.fd = os.open(self.dev, os.O_RDWR | os.O_DIRECT)
+        return self.fd
+
+    def close(self):
+        """Close the device, if open"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def capacity(self):
+        """How many blocks the device has"""
+        return os.lseek(self.open(), 0, os.SEEK_END) // self.block_size
+
+    def _call(self, fn, lba, nbytes, *args):
+        """Do one fn(fd, *args, offset) at lba, which should transfer
+        nbytes"""
+        try:
+            fd = self.open()
+        except OSError, e:
+            log.debug("Cannot open %s: %s" % (self.dev, e))
+            return ProbeResult(errno=e.errno, expected=nbytes)
+        watch = watchdog.start(self.dev, "%s lba=%d" % (fn.__name__, lba))
+        start = monotonicNs()
+        try:
+            ret = fn(fd, *(args + (lba * self.block_size,)))
+        finally:
+            elapsed = monotonicNs() - start
+            watchdog.finish(watch)
+        if ret < 0:
+            res = ProbeResult(errno=ctypes.get_errno(), elapsed_ns=elapsed,
+                              expected=nbytes)
+        else:
+            res = ProbeResult(nbytes=ret, elapsed_ns=elapsed, expected=nbytes)
+        log.debug("%s %s lba=%d -> %s" % (fn.__name__, self.dev, lba, res))
+        return res
+
+    def _transfer(self, fn, lba, nblocks):
+        """Do one pread/pwrite from/to our buffer"""
+        nbytes = nblocks * self.block_size
+        if nbytes > len(self.buf):
+            raise ValueError("Transfer of %d bytes exceeds buffer" % nbytes)
+        return self._call(fn, lba, nbytes, self.buf_addr, nbytes)
+
+    def read(self, lba=PROBE_LBA, nblocks=1):
+        """Read blocks from the device"""
+        return self._transfer(_libc.pread, lba, nblocks)
+
+    def write(self, lba=PROBE_LBA, nblocks=1):
+        """Write blocks (of zeros) to the device (destructive!)"""
+        nbytes = nblocks * self.block_size
+        self.buf[0:nbytes] = "\0" * nbytes
+        return self._transfer(_libc.pwrite, lba, nblocks)
+
+    def growBuffer(self, nblocks):
+        """Return our buffer, first made big enough for nblocks blocks
+        if need be"""
+        nbytes = nblocks * self.block_size
+        if nbytes > len(self.buf):
+            self.buf = mmap.mmap(-1, nbytes)
+            self.buf_addr = ctypes.addressof(
+                ctypes.c_char.from_buffer(self.buf))
+        return self.buf
+
+    def writeBuffer(self, lba=PROBE_LBA, nblocks=1):
+        """Write blocks from our buffer, as it is (destructive!)"""
+        return self._transfer(_libc.pwrite, lba, nblocks)
+
+    def sweep(self, regions, write=False):
+        """Read (or write zeros to) each (lba, nblocks) region, with
+        one preadv (or pwritev) each, returning a ProbeResult for each"""
+        if self.sweep_buf is None:
+            self.sweep_buf = mmap.mmap(-1, SWEEP_CHUNK)
+            self.sweep_dirty = False
+        if write and self.sweep_dirty:
+            # it holds what was last read
+            self.sweep_buf[:] = "\0" * SWEEP_CHUNK
+            self.sweep_dirty = False
+        elif not write:
+            self.sweep_dirty = True
+        addr = ctypes.addressof(ctypes.c_char.from_buffer(self.sweep_buf))
+        fn = write and _libc.pwritev or _libc.preadv
+        results = []
+        for (lba, nblocks) in regions:
+            nbytes = nblocks * self.block_size
+            # every chunk of the region uses the same buffer
+            lens = [SWEEP_CHUNK] * (nbytes // SWEEP_CHUNK)
+            if nbytes % SWEEP_CHUNK:
+                lens.append(nbytes % SWEEP_CHUNK)
+            if len(lens) > IOV_MAX:
+                raise ValueError("Transfer of %d bytes is too large" % nbytes)
+            iov = (Iovec * len(lens))(*[Iovec(addr, n) for n in lens])
+            results.append(self._call(fn, lba, nbytes, iov, len(lens)))
+        return results
+
+
+class DdIoEngine:
+    """Probe I/O done by running dd"""
+    def __init__(self, dev, block_size=BLOCK_SIZE):
+        self.dev = dev
+        self.block_size = block_size
+
+    def close(self):
+        pass
+
+    def run(self, cmd, nblocks):
+        """Run dd, returning a ProbeResult, with the errno taken from
+        its error message"""
+        res = runCmdWithOutput(cmd)
+        nbytes = nblocks * self.block_size
+        if res.result == 0:
+            return ProbeResult(nbytes=nbytes, elapsed_ns=res.elapsed_ns)
+        err = errno.EIO
+        for line in res.output or []:
+            if line.startswith("dd: "):
+                err = errno_messages.get(line.split(": ")[-1], err)
+        return ProbeResult(errno=err, elapsed_ns=res.elapsed_ns,
+                           expected=nbytes)
+
+    def read(self, lba=PROBE_LBA, nblocks=1):
+        """Read blocks from the device"""
+        return self.run(["dd",
+                         "if=" + self.dev,
+                         "iflag=direct",
+                         "of=/dev/null",
+                         "skip=%d" % lba,
+                         "bs=%d" % self.block_size,
+                         "count=%d" % nblocks], nblocks)
+
+    def write(self, lba=PROBE_LBA, nblocks=1):
+        """Write blocks (of zeros) to the device (destructive!)"""
+        return self.run(["dd",
+                         "if=/dev/zero",
+                         "of=" + self.dev,
+                         "oflag=direct",
+                         "bs=%d" % self.block_size,
+                         "seek=%d" % lba,
+                         "count=%d" % nblocks], nblocks)
+
+    def capacity(self):
+        """How many blocks the device has"""
+        fd = os.open(self.dev, os.O_RDONLY)
+        try:
+            return os.lseek(fd, 0, os.SEEK_END) // self.block_size
+        finally:
+            os.close(fd)
+
+    def sweep(self, regions, write=False):
+        """Read (or write zeros to) each (lba, nblocks) region, running
+        dd for each"""
+        fn = write and self.write or self.read
+        return [fn(lba, nblocks) for (lba, nblocks) in regions]
+
+
+################################################################
+
+io_engines = {
+    "direct" : DirectIoEngine,
+    "dd" : DdIoEngine}
+
+def makeIoEngine(dev, kind=None):
+    """Create the configured kind of I/O engine for a device (which
+    is recorded to, or replayed from, a transcript if so configured)"""
+    if kind is None:
+        if config.replay:
+            from transcript import ReplayIoEngine
+            return ReplayIoEngine(dev)
+        if config.record:
+            from transcript import RecordingIoEngine
+            return RecordingIoEngine(makeIoEngine(dev, config.io_engine))
+        kind = config.io_engine
+    if kind == "worker":
+        from worker import WorkerIoEngine
+        return WorkerIoEngine(dev)
+    if kind == "emulator":
+        from emulator import EmulatorIoEngine
+        return EmulatorIoEngine(dev)
+    if kind not in io_engines:
+        raise ValueError("Unknown I/O engine: %s" % kind)
+    return io_engines[kind](dev)
@@ -4,6 +4,7 @@ reservation stuff for PGR testing
 """
 
 import logging
+from collections import namedtuple
 
 from cmd import runCmdWithOutput
 
@@ -24,6 +25,51 @@ ProutTypes = {
     "WriteExclusiveAllRegistrants" : "7",
     "ExclusiveAccessAllRegistrants" : "8"}
 
+# Reservation Type descriptions, as displayed by sg_persist
+RtypeNames = {
+    1 : "Write Exclusive",
+    3 : "Exclusive Access",
+    5 : "Write Exclusive, registrants only",
+    6 : "Exclusive Access, registrants only",
+    7 : "Write Exclusive, all registrants",
+    8 : "Exclusive Access, all registrants"}
+
+# All Registrants types, where every registrant is a reservation holder
+AllRegistrantsTypes = (7, 8)
+
+
+def keyToInt(key):
+    """Convert a key string (e.g. "0x123abc") to a number"""
+    if key is None:
+        return 0
+    return int(key, 16)
+
+def keyToStr(key):
+    """Convert a key number to a string, as sg_persist displays it"""
+    return "0x%x" % key
+
+def rtypeToNum(rtype):
+    """Get a reservation type, as a number (as a string)"""
+    ret = ProutTypes["NoType"]
+    if rtype == "Exclusive Access":
+        ret = ProutTypes["ExclusiveAccess"]
+    elif rtype == "Write Exclusive":
+        ret = ProutTypes["WriteExclusive"]
+    elif rtype == "Exclusive Access, registrants only":
+        ret = ProutTypes["ExclusiveAccessRegistrantsOnly"]
+    elif rtype == "Write Exclusive, registrants only":
+        ret = ProutTypes["WriteExclusiveRegistrantsOnly"]
+    elif rtype == "Exclusive Access, all registrants":
+        ret = ProutTypes["ExclusiveAccessAllRegistrants"]
+    elif rtype == "Write Exclusive, all registrants":
+        ret = ProutTypes["WriteExclusiveAllRegistrants"]
+    log.debug("Given rtype=%s, returning Num=%s" % (rtype, ret))
+    return ret
+
+def rtypeName(rtype):
+    """Get the description of a reservation type number"""
+    return RtypeNames.get(rtype, "obsolete [%d]" % rtype)
+
 
 class Reservation:
     """Represents a reservation on a target"""
@@ -32,19 +78,18 @@ class Reservation:
         self.rtype = None
     def getRtypeNum(self):
         """Get the reservation type, as a number (as a string)"""
-        ret = ProutTypes["NoType"]
-        if self.rtype == "Exclusive Access":
-            ret = ProutTypes["ExclusiveAccess"]
-        elif self.rtype == "Write Exclusive":
-            ret = ProutTypes["WriteExclusive"]
-        elif self.rtype == "Exclusive Access, registrants only":
-            ret = ProutTypes["ExclusiveAccessRegistrantsOnly"]
-        elif self.rtype == "Write Exclusive, registrants only":
-            ret = ProutTypes["WriteExclusiveRegistrantsOnly"]
-        elif self.rtype == "Exclusive Access, all registrants":
-            ret = ProutTypes["ExclusiveAccessAllRegistrants"]
-        elif self.rtype == "Write Exclusive, all registrants":
-            ret = ProutTypes["WriteExclusiveAllRegistrants"]
-        log.debug("Given rtype=%s, returning Num=%s" % \
-               (self.rtype, ret))
-        return ret
+        return rtypeToNum(self.rtype)
+
+
+class PrSnapshot(namedtuple("PrSnapshot",
+                            "generation registrants key rtype")):
+    """An immutable snapshot of the PR state of a target: the
+    PRgeneration, the registered keys, and the reservation key and
+    type (as for a Reservation, these are None if not reserved)"""
+    __slots__ = ()
+    def getRtypeNum(self):
+        """Get the reservation type, as a number (as a string)"""
+        return rtypeToNum(self.rtype)
+    def isRegistered(self, key):
+        """Is the supplied key registered?"""
+        return key in self.registrants
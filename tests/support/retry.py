@@ -0,0 +1,136 @@
+#!/usr/bin/python
+"""
+retry -- when, and how soon, to retry a failed command
+
+A failed command is classified, by the sense data (key, ASC, ASCQ)
+its CmdResult carries if the transport gives us that, or else by its
+sg3_utils exit category. Each class says how many times to retry,
+and the backoff between tries: base_ms, doubling each time, up to
+max_ms.
+
+The classes (and their defaults) are:
+
+ - unit-attention: 3 retries, at once
+ - not-ready: LUN becoming ready, or in an ALUA transition; 5
+   retries, from 10ms up to 1s
+ - busy: BUSY or TASK SET FULL; 5 retries, from 1ms up to 100ms
+ - aborted: ABORTED COMMAND; 3 retries, from 1ms up to 50ms
+
+A command that may have been executed (an aborted one) is only
+retried if it is safe to send twice (i.e. not PR OUT). RESERVATION
+CONFLICT and ILLEGAL REQUEST are what the tests check for, so they
+are never retried; nor are timeouts and transport errors, or NOT
+READY that is not going away (e.g. MEDIUM NOT PRESENT), since they
+would only fail again, taking as long.
+
+PGR_RETRY_POLICY changes the classes, e.g. "busy=10:1:500" gives
+busy 10 retries, from 1ms up to 500ms, and "unit-attention=0" turns
+off retrying on Unit Attention. "none" turns off all retries.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import logging
+from collections import namedtuple
+
+import config
+from sense import ExitCat, SenseKeys
+
+
+__all__ = [
+    'RetryClass',
+    'RetryPolicy',
+    'parsePolicy',
+    'policy',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+# retries: how many times to retry; safe: whether the command cannot
+# have been executed, so that retrying anything is safe
+RetryClass = namedtuple("RetryClass", "name retries base_ms max_ms safe")
+
+default_classes = [
+    RetryClass("unit-attention", 3, 0, 0, True),
+    RetryClass("not-ready", 5, 10, 1000, True),
+    RetryClass("busy", 5, 1, 100, True),
+    RetryClass("aborted", 3, 1, 50, False),
+    ]
+
+# (sense key, ASC, ASCQ) -> class name, with None matching anything;
+# the first match wins
+sense_rules = [
+    ((SenseKeys["NotReady"], 0x04, 0x01), "not-ready"),
+    ((SenseKeys["NotReady"], 0x04, 0x0a), "not-ready"),
+    ((SenseKeys["UnitAttention"], None, None), "unit-attention"),
+    ((SenseKeys["AbortedCommand"], None, None), "aborted"),
+    ]
+
+# exit category -> class name, for when there is no sense data
+result_rules = {
+    ExitCat["UnitAttention"] : "unit-attention",
+    ExitCat["Busy"] : "busy",
+    ExitCat["TaskSetFull"] : "busy",
+    ExitCat["AbortedCommand"] : "aborted"}
+
+
+class RetryPolicy:
+    """Classifies failures, and says how long to wait before each
+    retry"""
+    def __init__(self, classes=default_classes):
+        self.classes = dict([(c.name, c) for c in classes])
+
+    def classify(self, result, sense=None):
+        """Return the RetryClass of a failure, or None if it is not
+        to be retried"""
+        if result == ExitCat["Clean"]:
+            return None
+        if sense is None:
+            sense = getattr(result, "sense", None)
+        name = None
+        if sense is not None:
+            for ((key, asc, ascq), cls) in sense_rules:
+                if sense.key == key and asc in (None, sense.asc) and \
+                       ascq in (None, sense.ascq):
+                    name = cls
+                    break
+        else:
+            name = result_rules.get(result)
+        return self.classes.get(name)
+
+    def delay(self, result, sense, attempt, idempotent=True):
+        """Return how many seconds to wait before retry number attempt
+        (from 0), or None not to retry"""
+        cls = self.classify(result, sense)
+        if cls is None or attempt >= cls.retries:
+            return None
+        if not (cls.safe or idempotent):
+            return None
+        return min(cls.max_ms, cls.base_ms * (2 ** attempt)) / 1000.0
+
+
+def parsePolicy(spec):
+    """Make a RetryPolicy from the defaults and a PGR_RETRY_POLICY
+    string: "none", or "class=retries[:base_ms[:max_ms]],..." """
+    classes = dict([(c.name, c) for c in default_classes])
+    spec = spec.strip()
+    if spec == "none":
+        return RetryPolicy([c._replace(retries=0) for c in classes.values()])
+    for item in [i for i in spec.split(",") if i.strip()]:
+        (name, sep, values) = item.strip().partition("=")
+        if name not in classes or not sep:
+            raise ValueError("Bad retry policy item: %s" % item)
+        fields = ["retries", "base_ms", "max_ms"]
+        nums = [int(v) for v in values.split(":")]
+        classes[name] = classes[name]._replace(
+            **dict(zip(fields, nums)))
+    return RetryPolicy(classes.values())
+
+
+# the policy in force
+policy = parsePolicy(config.retry_policy)
@@ -0,0 +1,252 @@
+#!/usr/bin/python
+"""
+sense -- SCSI status and sense data decoding for PGR testing
+
+Commands return a CmdResult: an int, the sg3_utils exit category (so
+it compares just as an exit status from sg_persist would), that also
+carries the SCSI status, the decoded sense data, the host and driver
+status, and how long the command took, so that callers can tell a
+RESERVATION CONFLICT from a transport error or a timeout.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+__all__ = [
+    'ScsiStatus',
+    'SenseKeys',
+    'ExitCat',
+    'Sense',
+    'CmdResult',
+    'decodeSense',
+    'exitCategory',
+    'resultFromExit',
+    'resultToWire',
+    'resultFromWire',
+    ]
+
+
+# SCSI status byte values
+ScsiStatus = {
+    "Good" : 0x00,
+    "CheckCondition" : 0x02,
+    "ConditionMet" : 0x04,
+    "Busy" : 0x08,
+    "ReservationConflict" : 0x18,
+    "TaskSetFull" : 0x28,
+    "AcaActive" : 0x30,
+    "TaskAborted" : 0x40}
+
+# Sense keys
+SenseKeys = {
+    "NoSense" : 0x0,
+    "RecoveredError" : 0x1,
+    "NotReady" : 0x2,
+    "MediumError" : 0x3,
+    "HardwareError" : 0x4,
+    "IllegalRequest" : 0x5,
+    "UnitAttention" : 0x6,
+    "DataProtect" : 0x7,
+    "AbortedCommand" : 0xb,
+    "Miscompare" : 0xe}
+
+# Exit status categories, as used by the sg3_utils commands, so that a
+# result from the native transport can be compared with sg_persist
+ExitCat = {
+    "Clean" : 0,
+    "NotReady" : 2,
+    "MediumHard" : 3,
+    "IllegalRequest" : 5,
+    "UnitAttention" : 6,
+    "DataProtect" : 7,
+    "AbortedCommand" : 11,
+    "Miscompare" : 14,
+    "NoSense" : 20,
+    "Recovered" : 21,
+    "ResConflict" : 24,
+    "ConditionMet" : 25,
+    "Busy" : 26,
+    "TaskSetFull" : 27,
+    "AcaActive" : 28,
+    "Timeout" : 33,
+    "Other" : 99}
+
+
+class Sense:
+    """Decoded sense data (fixed or descriptor format)"""
+    def __init__(self, key=0, asc=0, ascq=0, raw=None):
+        self.key = key
+        self.asc = asc
+        self.ascq = ascq
+        self.raw = raw
+    def __repr__(self):
+        return "Sense(key=0x%x, asc=0x%02x, ascq=0x%02x)" % \
+               (self.key, self.asc, self.ascq)
+    def matches(self, key, asc=None, ascq=None):
+        """Is this the sense key (and ASC and ASCQ, if given)?"""
+        return self.key == key and asc in (None, self.asc) and \
+               ascq in (None, self.ascq)
+
+
+class CmdResult(int):
+    """The outcome of a command: its exit category, along with the
+    SCSI status (None if not known, e.g. from sg_persist), the decoded
+    sense data (or None), the host and driver status, the errno if it
+    could not be issued at all, and how long it took"""
+    def __new__(cls, result=0, status=None, sense=None, host_status=0,
+                driver_status=0, errno=0, elapsed_ns=0):
+        self = int.__new__(cls, result)
+        self.status = status
+        self.sense = sense
+        self.host_status = host_status
+        self.driver_status = driver_status
+        self.errno = errno
+        self.elapsed_ns = elapsed_ns
+        return self
+
+    @property
+    def result(self):
+        """The exit category, as a plain int (as for a ProbeResult)"""
+        return int(self)
+
+    def isConflict(self):
+        """Was it a RESERVATION CONFLICT?"""
+        return self.status == ScsiStatus["ReservationConflict"]
+
+    def isTimeout(self):
+        """Did it time out (rather than get a status)?"""
+        return int(self) == ExitCat["Timeout"]
+
+    def isTransportError(self):
+        """Did it fail on the way to or from the target, without a
+        status (not counting a timeout)?"""
+        return bool(self.errno or self.host_status) and not self.isTimeout()
+
+    def senseIs(self, key, asc=None, ascq=None):
+        """Was there sense data with this key (and ASC and ASCQ, if
+        given)?"""
+        return self.sense is not None and self.sense.matches(key, asc, ascq)
+
+    def __repr__(self):
+        parts = ["%d" % self]
+        if self.status is not None:
+            parts.append("status=0x%02x" % self.status)
+        if self.sense is not None:
+            parts.append("sense=%s" % (self.sense,))
+        if self.host_status or self.driver_status:
+            parts.append("host=0x%x, driver=0x%x" %
+                         (self.host_status, self.driver_status))
+        if self.errno:
+            parts.append("errno=%d" % self.errno)
+        parts.append("elapsed_ns=%d" % self.elapsed_ns)
+        return "CmdResult(%s)" % ", ".join(parts)
+
+
+def decodeSense(sb):
+    """Decode a sense buffer (a byte string), or None if not valid"""
+    if not sb or len(sb) < 2:
+        return None
+    sb = bytearray(sb)
+    code = sb[0] & 0x7f
+    if code in (0x70, 0x71):
+        # fixed format
+        key = len(sb) > 2 and sb[2] & 0xf or 0
+        asc = len(sb) > 12 and sb[12] or 0
+        ascq = len(sb) > 13 and sb[13] or 0
+    elif code in (0x72, 0x73):
+        # descriptor format
+        key = sb[1] & 0xf
+        asc = len(sb) > 2 and sb[2] or 0
+        ascq = len(sb) > 3 and sb[3] or 0
+    else:
+        return None
+    return Sense(key, asc, ascq, bytes(sb))
+
+
+def exitCategory(status, sense=None, host_status=0, driver_status=0):
+    """Map a SCSI status (and sense) onto an sg3_utils exit category"""
+    if host_status or (driver_status & 0xf) not in (0, 0x8):
+        # DRIVER_SENSE (0x8) just means sense is available
+        if host_status == 0x3 or driver_status & 0xf == 0x6:
+            # DID_TIME_OUT or DRIVER_TIMEOUT
+            return ExitCat["Timeout"]
+        return ExitCat["Other"]
+    if status == ScsiStatus["Good"]:
+        return ExitCat["Clean"]
+    if status == ScsiStatus["ReservationConflict"]:
+        return ExitCat["ResConflict"]
+    if status == ScsiStatus["ConditionMet"]:
+        return ExitCat["ConditionMet"]
+    if status == ScsiStatus["Busy"]:
+        return ExitCat["Busy"]
+    if status == ScsiStatus["TaskSetFull"]:
+        return ExitCat["TaskSetFull"]
+    if status == ScsiStatus["AcaActive"]:
+        return ExitCat["AcaActive"]
+    if status != ScsiStatus["CheckCondition"] or sense is None:
+        return ExitCat["Other"]
+    key = sense.key
+    if key == SenseKeys["NoSense"]:
+        return ExitCat["NoSense"]
+    if key == SenseKeys["RecoveredError"]:
+        return ExitCat["Recovered"]
+    if key == SenseKeys["NotReady"]:
+        return ExitCat["NotReady"]
+    if key in (SenseKeys["MediumError"], SenseKeys["HardwareError"]):
+        return ExitCat["MediumHard"]
+    if key == SenseKeys["IllegalRequest"]:
+        return ExitCat["IllegalRequest"]
+    if key == SenseKeys["UnitAttention"]:
+        return ExitCat["UnitAttention"]
+    if key == SenseKeys["DataProtect"]:
+        return ExitCat["DataProtect"]
+    if key == SenseKeys["AbortedCommand"]:
+        return ExitCat["AbortedCommand"]
+    if key == SenseKeys["Miscompare"]:
+        return ExitCat["Miscompare"]
+    return ExitCat["Other"]
+
+
+# the status an exit category must have come from, where there is
+# only one (all the sense-based ones are CHECK CONDITION)
+category_status = {
+    ExitCat["Clean"] : ScsiStatus["Good"],
+    ExitCat["ResConflict"] : ScsiStatus["ReservationConflict"],
+    ExitCat["ConditionMet"] : ScsiStatus["ConditionMet"],
+    ExitCat["Busy"] : ScsiStatus["Busy"],
+    ExitCat["TaskSetFull"] : ScsiStatus["TaskSetFull"],
+    ExitCat["AcaActive"] : ScsiStatus["AcaActive"]}
+for _cat in ("NotReady", "MediumHard", "IllegalRequest", "UnitAttention",
+             "DataProtect", "AbortedCommand", "Miscompare", "NoSense",
+             "Recovered"):
+    category_status[ExitCat[_cat]] = ScsiStatus["CheckCondition"]
+
+
+def resultFromExit(result, elapsed_ns=0):
+    """Make a CmdResult from an sg3_utils exit status alone, inferring
+    the SCSI status where it can be"""
+    return CmdResult(result, category_status.get(result),
+                     elapsed_ns=elapsed_ns)
+
+
+def resultToWire(res):
+    """A CmdResult (or plain exit status) as a JSON-able list"""
+    if not isinstance(res, CmdResult):
+        return res
+    sense = None
+    if res.sense is not None:
+        sense = [res.sense.key, res.sense.asc, res.sense.ascq]
+    return [int(res), res.status, sense, res.host_status,
+            res.driver_status, res.errno, res.elapsed_ns]
+
+
+def resultFromWire(wire):
+    """Make a CmdResult from resultToWire()'s list (or a plain exit
+    status, as older transcripts have)"""
+    if not isinstance(wire, list):
+        return resultFromExit(wire)
+    (result, status, sense, host_status, driver_status, errno,
+     elapsed_ns) = wire
+    if sense is not None:
+        sense = Sense(*sense)
+    return CmdResult(result, status, sense, host_status, driver_status,
+                     errno, elapsed_ns)
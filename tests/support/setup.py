@@ -1,6 +1,14 @@
 #!/usr/bin/python
 """
 Module setup help
+
+The preflight checks (root access, unless everything is emulated or
+replayed, the tools needed, and that every device is the same LUN)
+are run once per session, no matter how many test modules call
+set_up_module(). If PGR_PREFLIGHT_CACHE names a file, a passing
+preflight is also remembered there, keyed by a fingerprint of the
+devices (from sysfs) and the tools (their binary files), so later
+runs can skip it while nothing has changed.
 """
 
 __author__ = "Lee Duncan <leeman.duncan@gmail.com>"
@@ -8,32 +16,146 @@ __author__ = "Lee Duncan <leeman.duncan@gmail.com>"
 
 import os
 import sys
+import json
+import hashlib
+import logging
+
+import config
 from cmd import verifyCmdExists
+from parallel import callEach
 
 
 
 ################################################################
 
-def set_up_module(ia, ib, ic):
-    """Whole-module setup"""
-    if os.geteuid() != 0:
-        print >>sys.stderr, "Fatal: must be root to run this script\n"
-        sys.exit(1)
-    verifyCmdExists(["sg_persist", "-V"])
-    verifyCmdExists(["sg_inq", "-V"])
-    verifyCmdExists(["dd", "--version"])
+log = logging.getLogger('nose.user')
+
+################################################################
+
+# sysfs attributes identifying the LUN behind a device
+IDENTITY_ATTRS = ["wwid", "vendor", "model", "rev", "vpd_pg80"]
+
+# preflights passed this session, keyed by settings and devices
+preflight_done = {}
+
+
+def requiredTools():
+    """The commands (and version options) the settings need"""
+    tools = []
+    if config.replay:
+        # nothing is run
+        return tools
+    if config.transport == "sg_persist":
+        tools.extend([["sg_persist", "-V"], ["sg_inq", "-V"]])
+    if config.io_engine == "dd":
+        tools.append(["dd", "--version"])
+    return tools
+
+def findTool(name):
+    """Return the path of a command, or None"""
+    for d in os.environ.get("PATH", "").split(os.pathsep):
+        path = os.path.join(d, name)
+        if os.access(path, os.X_OK):
+            return path
+    return None
+
+def deviceIdentity(dev):
+    """Return what sysfs says about the device, without sending it
+    any commands (or None if it is not there)"""
+    try:
+        st = os.stat(dev)
+    except OSError:
+        return None
+    ident = [dev, st.st_rdev]
+    sysdev = os.path.join("/sys/class/block",
+                          os.path.basename(os.path.realpath(dev)), "device")
+    for attr in IDENTITY_ATTRS:
+        try:
+            f = open(os.path.join(sysdev, attr))
+            ident.append(f.read().strip())
+            f.close()
+        except IOError:
+            ident.append(None)
+    return ident
+
+def preflightFingerprint(inits):
+    """Return a fingerprint of everything the preflight checks depend
+    on, or None if something is missing"""
+    parts = [config.transport, config.io_engine]
+    for (cmd, opt) in requiredTools():
+        path = findTool(cmd)
+        if path is None:
+            return None
+        st = os.stat(path)
+        parts.append([path, st.st_size, int(st.st_mtime)])
+    for i in inits:
+        ident = deviceIdentity(i.dev)
+        if ident is None:
+            return None
+        parts.append(ident)
+    return hashlib.sha1(json.dumps(parts)).hexdigest()
+
+def loadPreflightCache(path):
+    """Return the dict of fingerprints from the cache file"""
+    try:
+        f = open(path)
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return {}
+
+def savePreflightCache(path, fingerprint, serial):
+    cache = loadPreflightCache(path)
+    cache[fingerprint] = serial
+    try:
+        f = open(path, "w")
+        json.dump(cache, f)
+        f.close()
+    except IOError, e:
+        log.debug("Cannot write preflight cache %s: %s" % (path, e))
+
+def preflight(inits):
+    """Check the tools needed exist, and that all the initiators see
+    the same device, returning its serial number"""
+    for cmd in requiredTools():
+        verifyCmdExists(cmd)
     # make sure all devices are the same
-    iiA = ia.getDiskInquirySn()
-    iiB = ib.getDiskInquirySn()
-    iiC = ic.getDiskInquirySn()
-    if not iiA or not iiB or not iiC:
+    sns = callEach(inits, "getDiskInquirySn")
+    devs = ", ".join([i.dev for i in inits])
+    if not all(sns):
         print >>sys.stderr, \
-              "Fatal: cannot get INQUIRY data from %s, %s, or %s\n" % \
-              (ia.dev, ib.dev, ic.dev)
+              "Fatal: cannot get INQUIRY data from %s\n" % devs
         sys.exit(1)
-    if iiA != iiB or iiA != iiC:
+    if len(set(sns)) != 1:
         print >>sys.stderr, \
-              "Fatal: Serial numbers differ for %s, %s, or %s\n" % \
-              (ia.dev, ib.dev, ic.dev)
+              "Fatal: Serial numbers differ for %s\n" % devs
+        sys.exit(1)
+    return sns[0]
+
+def set_up_module(*inits):
+    """Whole-module setup: check we can run, and that all the
+    initiators see the same device (once per session)"""
+    offline = config.replay or (config.transport == "emulator" and
+                                config.io_engine == "emulator")
+    if os.geteuid() != 0 and not offline:
+        print >>sys.stderr, "Fatal: must be root to run this script\n"
         sys.exit(1)
+    key = (config.transport, config.io_engine,
+           tuple([i.dev for i in inits]))
+    if key in preflight_done:
+        return
+    fingerprint = None
+    if config.preflight_cache:
+        fingerprint = preflightFingerprint(inits)
+        cache = loadPreflightCache(config.preflight_cache)
+        if fingerprint is not None and fingerprint in cache:
+            log.debug("Preflight cached for %s" % (key,))
+            preflight_done[key] = cache[fingerprint]
+            return
+    preflight_done[key] = preflight(inits)
+    if fingerprint is not None:
+        savePreflightCache(config.preflight_cache, fingerprint,
+                           preflight_done[key])
 
@@ -0,0 +1,244 @@
+#!/usr/bin/python
+"""
+sgio -- native SG_IO access for PGR testing
+
+Builds SCSI CDBs (PERSISTENT RESERVE IN/OUT, TEST UNIT READY,
+INQUIRY) and issues them with the SG_IO ioctl on an open device,
+so that no helper command has to be run.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import ctypes
+import fcntl
+import struct
+import logging
+
+import config
+from clock import monotonicNs
+from deadline import watchdog
+from sense import ExitCat, CmdResult, decodeSense, exitCategory
+
+
+__all__ = [
+    'SgIoHdr',
+    'SgIoResult',
+    'SgDevice',
+    'PrInSa',
+    'PrOutSa',
+    'prInCdb',
+    'prOutCdb',
+    'prOutParams',
+    'turCdb',
+    'inquiryCdb',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+SG_IO = 0x2285
+SG_INTERFACE_ID = ord('S')
+SG_DXFER_NONE = -1
+SG_DXFER_TO_DEV = -2
+SG_DXFER_FROM_DEV = -3
+
+SENSE_LEN = 64
+DEFAULT_TIMEOUT_MS = 20000
+
+# PERSISTENT RESERVE IN service actions
+PrInSa = {
+    "ReadKeys" : 0x00,
+    "ReadReservation" : 0x01,
+    "ReportCapabilities" : 0x02,
+    "ReadFullStatus" : 0x03}
+
+# PERSISTENT RESERVE OUT service actions
+PrOutSa = {
+    "Register" : 0x00,
+    "Reserve" : 0x01,
+    "Release" : 0x02,
+    "Clear" : 0x03,
+    "Preempt" : 0x04,
+    "PreemptAndAbort" : 0x05,
+    "RegisterAndIgnore" : 0x06,
+    "RegisterAndMove" : 0x07}
+
+PR_IN_OPCODE = 0x5e
+PR_OUT_OPCODE = 0x5f
+PR_OUT_PARAM_LEN = 24
+PR_SCOPE_LU = 0x0
+
+
+class SgIoHdr(ctypes.Structure):
+    """The Linux sg_io_hdr_t structure (see <scsi/sg.h>)"""
+    _fields_ = [
+        ("interface_id", ctypes.c_int),
+        ("dxfer_direction", ctypes.c_int),
+        ("cmd_len", ctypes.c_ubyte),
+        ("mx_sb_len", ctypes.c_ubyte),
+        ("iovec_count", ctypes.c_ushort),
+        ("dxfer_len", ctypes.c_uint),
+        ("dxferp", ctypes.c_void_p),
+        ("cmdp", ctypes.c_void_p),
+        ("sbp", ctypes.c_void_p),
+        ("timeout", ctypes.c_uint),
+        ("flags", ctypes.c_uint),
+        ("pack_id", ctypes.c_int),
+        ("usr_ptr", ctypes.c_void_p),
+        ("status", ctypes.c_ubyte),
+        ("masked_status", ctypes.c_ubyte),
+        ("msg_status", ctypes.c_ubyte),
+        ("sb_len_wr", ctypes.c_ubyte),
+        ("host_status", ctypes.c_ushort),
+        ("driver_status", ctypes.c_ushort),
+        ("resid", ctypes.c_int),
+        ("duration", ctypes.c_uint),
+        ("info", ctypes.c_uint)]
+
+
+################################################################
+# CDB builders
+
+def prInCdb(sa, alloc_len):
+    """Build a PERSISTENT RESERVE IN CDB"""
+    return struct.pack(">BB5xHB", PR_IN_OPCODE, sa & 0x1f, alloc_len, 0)
+
+def prOutCdb(sa, prout_type=0, scope=PR_SCOPE_LU,
+             param_len=PR_OUT_PARAM_LEN):
+    """Build a PERSISTENT RESERVE OUT CDB"""
+    return struct.pack(">BBB2xIB", PR_OUT_OPCODE, sa & 0x1f,
+                       ((scope & 0xf) << 4) | (prout_type & 0xf),
+                       param_len, 0)
+
+def prOutParams(key=0, sakey=0, aptpl=False):
+    """Build the basic PERSISTENT RESERVE OUT parameter list"""
+    flags = 0
+    if aptpl:
+        flags |= 0x1
+    return struct.pack(">QQ4xB3x", key, sakey, flags)
+
+def turCdb():
+    """Build a TEST UNIT READY CDB"""
+    return struct.pack(">6B", 0, 0, 0, 0, 0, 0)
+
+def inquiryCdb(alloc_len, page=None):
+    """Build an INQUIRY CDB, optionally for a VPD page"""
+    if page is None:
+        return struct.pack(">BBBHB", 0x12, 0, 0, alloc_len, 0)
+    return struct.pack(">BBBHB", 0x12, 0x1, page, alloc_len, 0)
+
+
+################################################################
+
+class SgIoResult:
+    """The outcome of a single SG_IO request. Its result is a
+    CmdResult, carrying the status and sense data along with it."""
+    def __init__(self, status=0, host_status=0, driver_status=0,
+                 sense=None, data=None, resid=0, duration=0, errno=0,
+                 elapsed_ns=0):
+        self.status = status
+        self.host_status = host_status
+        self.driver_status = driver_status
+        self.sense = sense
+        self.data = data
+        self.resid = resid
+        self.duration = duration
+        self.errno = errno
+        self.elapsed_ns = elapsed_ns
+        if errno:
+            self.result = CmdResult(ExitCat["Other"], errno=errno,
+                                    elapsed_ns=elapsed_ns)
+        else:
+            self.result = CmdResult(exitCategory(status, sense, host_status,
+                                                 driver_status),
+                                    status, sense, host_status,
+                                    driver_status, elapsed_ns=elapsed_ns)
+
+
+class SgDevice:
+    """A device we send SCSI commands to using SG_IO
+
+    The ioctl layer can be replaced (e.g. for testing without real
+    hardware): it is called just like fcntl.ioctl(fd, SG_IO, hdr), and
+    is expected to fill in the output fields of the header."""
+    def __init__(self, dev, ioctl=None, fd=None):
+        self.dev = dev
+        self.fd = fd
+        if ioctl is None:
+            ioctl = fcntl.ioctl
+        self.ioctl = ioctl
+
+    def open(self):
+        """Open the device, if not already open"""
+        if self.fd is None:
+            log.debug("Opening %s for SG_IO" % self.dev)
+            self.fd = os.open(self.dev, os.O_RDWR | os.O_NONBLOCK)
+        return self.fd
+
+    def close(self):
+        """Close the device, if open"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def execute(self, cdb, data_out=None, data_in_len=0,
+                timeout_ms=None):
+        """Issue a CDB, returning an SgIoResult"""
+        if timeout_ms is None:
+            # have the kernel abort it before the harness deadline
+            timeout_ms = DEFAULT_TIMEOUT_MS
+            if config.cmd_deadline > 0:
+                timeout_ms = min(timeout_ms, int(config.cmd_deadline * 1000))
+        fd = self.open()
+        hdr = SgIoHdr()
+        cdb_buf = ctypes.create_string_buffer(cdb, len(cdb))
+        sense_buf = ctypes.create_string_buffer(SENSE_LEN)
+        hdr.interface_id = SG_INTERFACE_ID
+        hdr.cmd_len = len(cdb)
+        hdr.cmdp = ctypes.addressof(cdb_buf)
+        hdr.mx_sb_len = SENSE_LEN
+        hdr.sbp = ctypes.addressof(sense_buf)
+        hdr.timeout = timeout_ms
+        data_buf = None
+        if data_out is not None:
+            data_buf = ctypes.create_string_buffer(data_out, len(data_out))
+            hdr.dxfer_direction = SG_DXFER_TO_DEV
+            hdr.dxfer_len = len(data_out)
+            hdr.dxferp = ctypes.addressof(data_buf)
+        elif data_in_len:
+            data_buf = ctypes.create_string_buffer(data_in_len)
+            hdr.dxfer_direction = SG_DXFER_FROM_DEV
+            hdr.dxfer_len = data_in_len
+            hdr.dxferp = ctypes.addressof(data_buf)
+        else:
+            hdr.dxfer_direction = SG_DXFER_NONE
+        log.debug("SG_IO %s: cdb=%s" % (self.dev, cdb.encode("hex")))
+        watch = watchdog.start(self.dev, "SG_IO cdb=%s" % cdb.encode("hex"))
+        start = monotonicNs()
+        try:
+            try:
+                self.ioctl(fd, SG_IO, hdr)
+            except (IOError, OSError), e:
+                log.debug("SG_IO %s failed: %s" % (self.dev, e))
+                return SgIoResult(errno=e.errno,
+                                  elapsed_ns=monotonicNs() - start)
+        finally:
+            watchdog.finish(watch)
+        elapsed = monotonicNs() - start
+        sense = None
+        if hdr.sb_len_wr:
+            sense = decodeSense(sense_buf.raw[:hdr.sb_len_wr])
+        data = None
+        if data_in_len:
+            data = data_buf.raw[:max(0, data_in_len - hdr.resid)]
+        res = SgIoResult(hdr.status, hdr.host_status, hdr.driver_status,
+                         sense, data, hdr.resid, hdr.duration,
+                         elapsed_ns=elapsed)
+        log.debug("SG_IO %s: status=0x%x sense=%s -> %d" %
+                  (self.dev, res.status, res.sense, res.result))
+        return res
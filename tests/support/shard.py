@@ -0,0 +1,176 @@
+#!/usr/bin/python
+"""
+shard -- run test modules in parallel across a pool of LUNs
+
+The test modules share PR state on their LUN, so on one LUN they must
+run one after another. Given a pool of LUNs, each reachable through
+its own devices (one per initiator), the modules are instead handed
+out to one worker process per LUN as each LUN becomes free, and their
+results merged into one report.
+
+Each module runs in a child process (this file, run as a script) with
+PGR_DEVICES set to its LUN's devices, which runs the module with
+unittest and writes its results as one JSON line.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import json
+import time
+import Queue
+import logging
+import threading
+import subprocess
+import unittest
+
+
+__all__ = [
+    'SuiteModules',
+    'parsePool',
+    'runShards',
+    'formatShardReport',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+# the modules that use initA, initB, and initC on one LUN
+SuiteModules = [
+    "testRegister",
+    "testReserveEA",
+    "testReserveWE",
+    "testReserveEARO",
+    "testReserveWERO",
+    "testReserveEAAR",
+    "testReserveWEAR",
+    ]
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parsePool(text):
+    """Parse a LUN pool: LUNs separated by ";", each a list of devices
+    separated by spaces or commas, e.g. "sdc,sdd,sde; sdf,sdg,sdh" """
+    pool = []
+    for lun in text.split(";"):
+        devs = lun.replace(",", " ").split()
+        if devs:
+            pool.append(devs)
+    return pool
+
+
+class JsonResult(unittest.TestResult):
+    """Keeps just the test ids of failures and errors, with their
+    tracebacks"""
+    def describe(self, pairs):
+        return [(t.id(), tb) for (t, tb) in pairs]
+
+    def summary(self, module, seconds):
+        return {"module" : module,
+                "ran" : self.testsRun,
+                "failures" : self.describe(self.failures),
+                "errors" : self.describe(self.errors),
+                "skipped" : len(getattr(self, "skipped", [])),
+                "seconds" : seconds}
+
+def runModule(module):
+    """Run one test module (in the child), returning its summary"""
+    suite = unittest.defaultTestLoader.loadTestsFromName(module)
+    result = JsonResult()
+    start = time.time()
+    suite.run(result)
+    return result.summary(module, time.time() - start)
+
+
+def runChild(module, lun, testdir):
+    """Run a module in a child process on a LUN, returning its
+    summary (with the LUN added)"""
+    script = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+    env = dict(os.environ)
+    env["PGR_DEVICES"] = " ".join(lun)
+    log.debug("Running %s on %s" % (module, lun))
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, script, testdir, module],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            env=env)
+    (out, err) = proc.communicate()
+    lines = out.splitlines()
+    try:
+        summary = json.loads(lines[-1])
+    except (IndexError, ValueError):
+        # it died (e.g. the preflight failed): report why
+        summary = {"module" : module,
+                   "ran" : 0,
+                   "failures" : [],
+                   "errors" : [(module, "exit %d: %s" %
+                                (proc.returncode, err.strip()[-2000:]))],
+                   "skipped" : 0,
+                   "seconds" : time.time() - start}
+    summary["lun"] = lun
+    summary["output"] = err
+    return summary
+
+
+def runShards(pool, modules=None, testdir=TESTS_DIR):
+    """Run the modules (the whole suite by default) across the pool
+    of LUNs, one at a time per LUN, returning their summaries in
+    module order"""
+    if modules is None:
+        modules = SuiteModules
+    todo = Queue.Queue()
+    for m in modules:
+        todo.put(m)
+    results = {}
+    def shard(lun):
+        while True:
+            try:
+                m = todo.get_nowait()
+            except Queue.Empty:
+                return
+            results[m] = runChild(m, lun, testdir)
+    threads = [threading.Thread(target=shard, args=(lun,)) for lun in pool]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return [results[m] for m in modules]
+
+
+def formatShardReport(summaries, wall):
+    """Format the merged results"""
+    lines = []
+    ran = 0
+    bad = []
+    busy = 0.0
+    for s in summaries:
+        lines.append("%-18s %-26s ran=%-3d fail=%-3d error=%-3d %7.2fs" %
+                     (s["module"], ",".join(s["lun"]), s["ran"],
+                      len(s["failures"]), len(s["errors"]), s["seconds"]))
+        ran += s["ran"]
+        busy += s["seconds"]
+        for (kind, items) in (("FAIL", s["failures"]), ("ERROR", s["errors"])):
+            bad.extend(["%s: %s\n%s" % (kind, tid, tb) for (tid, tb) in items])
+    lines.append("Ran %d tests in %.2fs (%.2fs if run one after another)" %
+                 (ran, wall, busy))
+    if bad:
+        lines.append("")
+        lines.extend(bad)
+        lines.append("FAILED (%d problems)" % len(bad))
+    else:
+        lines.append("OK")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # child: run from the tests directory (not from here, so that our
+    # neighbours, e.g. cmd.py, do not hide standard modules)
+    sys.path[0] = sys.argv[1]
+    os.chdir(sys.argv[1])
+    print json.dumps(runModule(sys.argv[2]))
@@ -0,0 +1,48 @@
+#!/usr/bin/python
+"""
+stats -- latency statistics for PGR testing
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import math
+
+
+__all__ = [
+    'percentile',
+    'summarize',
+    'formatSummary',
+    ]
+
+
+def percentile(values, pct):
+    """Return the pct'th percentile of a sorted list (nearest rank)"""
+    if not values:
+        return None
+    idx = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(idx, len(values) - 1))]
+
+def summarize(values):
+    """Summarize a list of latencies (or other values) as a dict"""
+    values = sorted(values)
+    if not values:
+        return {"count" : 0}
+    return {"count" : len(values),
+            "min" : values[0],
+            "mean" : sum(values) / float(len(values)),
+            "p50" : percentile(values, 50),
+            "p90" : percentile(values, 90),
+            "p99" : percentile(values, 99),
+            "max" : values[-1]}
+
+def formatSummary(summary, scale=1000.0, unit="us"):
+    """Format a summary of nanosecond values for display"""
+    if not summary["count"]:
+        return "no samples"
+    return "n=%d p50=%.1f%s p90=%.1f%s p99=%.1f%s max=%.1f%s" % \
+           (summary["count"],
+            summary["p50"] / scale, unit,
+            summary["p90"] / scale, unit,
+            summary["p99"] / scale, unit,
+            summary["max"] / scale, unit)
@@ -0,0 +1,229 @@
+#!/usr/bin/python
+"""
+sweep -- probe access across the whole of a LUN
+
+The read and write probes normally touch just one block (PROBE_LBA),
+so a target that enforces reservations only on some LBA ranges, or
+only for small transfers, would pass. With PGR_ACCESS_SWEEP=1, each
+probe instead sweeps a set of regions across the LUN:
+
+ - the first block, and the last
+ - a large (4 MiB) transfer in the middle, and one ending at the last
+   block
+ - PGR_SWEEP_RANDOM regions at random offsets, of sizes from one
+   block to 2 MiB, chosen from PGR_SWEEP_SEED (which a transcript
+   records, so a replay sweeps the same regions)
+ - any given in PGR_SWEEP_LBAS
+
+Every initiator sweeps the same regions. The direct I/O engine does
+each region with one preadv (or pwritev), from its one open
+descriptor.
+
+A sweep passes (result 0) if every region was allowed, and fails
+(result 1) if every region was denied, like a single probe. If some
+were allowed and some denied, the target is enforcing the
+reservation on only part of the LUN: that is result 2, which no test
+expects. How often each initiator was allowed and denied each region
+is summarized at the end of the run.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import random
+import atexit
+import logging
+import threading
+from collections import namedtuple
+
+import config
+from probe import BLOCK_SIZE
+
+
+__all__ = [
+    'Region',
+    'SweepResult',
+    'parseLbas',
+    'sweepPlan',
+    'note',
+    'formatSummary',
+    'seed',
+    'chooseSeed',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+Region = namedtuple("Region", "name lba nblocks")
+
+LARGE_BYTES = 4 << 20
+RANDOM_BYTES = [4096, 8192, 65536, 256 << 10, 1 << 20, 2 << 20]
+
+# results of a sweep
+ALLOWED = 0
+DENIED = 1
+MIXED = 2
+
+def chooseSeed():
+    """The seed for this run: PGR_SWEEP_SEED if set, else the one a
+    transcript being replayed was recorded with, else a random one"""
+    if config.sweep_seed:
+        return int(config.sweep_seed)
+    if config.replay:
+        from transcript import getReader
+        recorded = getReader().header("sweep_seed")
+        if recorded is not None:
+            return recorded
+    return random.randrange(1 << 32)
+
+# the seed random regions are chosen from, for this run
+seed = chooseSeed()
+
+
+def parseLbas(spec):
+    """Parse a PGR_SWEEP_LBAS string, "lba[:nblocks],...", into a
+    list of (lba, nblocks)"""
+    lbas = []
+    for item in [i.strip() for i in spec.split(",") if i.strip()]:
+        (lba, sep, nblocks) = item.partition(":")
+        try:
+            lbas.append((int(lba), int(nblocks or "1")))
+        except ValueError:
+            raise ValueError("Bad sweep region: %s" % item)
+    return lbas
+
+def sweepPlan(capacity, block_size=BLOCK_SIZE, nrandom=None,
+              plan_seed=None, lbas=None):
+    """Return the Regions to sweep on a LUN of capacity blocks, by
+    default as configured"""
+    if nrandom is None:
+        nrandom = config.sweep_random
+    if plan_seed is None:
+        plan_seed = seed
+    if lbas is None:
+        lbas = parseLbas(config.sweep_lbas)
+    def region(name, lba, nblocks):
+        # kept within the LUN
+        nblocks = max(1, min(nblocks, capacity))
+        return Region(name, max(0, min(lba, capacity - nblocks)), nblocks)
+    large = LARGE_BYTES // block_size
+    plan = [region("first", 0, 1),
+            region("last", capacity - 1, 1),
+            region("large-middle", (capacity - large) // 2, large),
+            region("large-end", capacity - large, large)]
+    rand = random.Random(plan_seed)
+    for i in range(nrandom):
+        nblocks = max(1, rand.choice(RANDOM_BYTES) // block_size)
+        plan.append(region("random-%d" % i, rand.randrange(capacity),
+                           nblocks))
+    for (lba, nblocks) in lbas:
+        if lba < 0:
+            lba += capacity
+        plan.append(region("lba-%d" % lba, lba, nblocks))
+    return plan
+
+
+class SweepResult:
+    """The outcome of sweeping a list of Regions, answering what a
+    single probe's result does for the sweep as a whole: its status
+    and sense data are those of the first region denied (or of the
+    first region, if none was)"""
+    def __init__(self, regions, results):
+        self.regions = regions
+        self.results = results
+        self.nbytes = sum([getattr(r, "nbytes", 0) for r in results])
+        self.elapsed_ns = sum([getattr(r, "elapsed_ns", 0) for r in results])
+        if not self.denied():
+            self.result = ALLOWED
+        elif not self.allowed():
+            self.result = DENIED
+        else:
+            self.result = MIXED
+        first = ([r for r in results if r.result != 0] + results[:1] +
+                 [None])[0]
+        self.status = getattr(first, "status", None)
+        self.sense = getattr(first, "sense", None)
+
+    def isConflict(self):
+        """Was every region refused with a RESERVATION CONFLICT?"""
+        return bool(self.results) and \
+               all([r.isConflict() for r in self.results])
+
+    def isTimeout(self):
+        """Did any region time out?"""
+        return any([r.isTimeout() for r in self.results])
+
+    def allowed(self):
+        return [reg for (reg, res) in zip(self.regions, self.results)
+                if res.result == 0]
+
+    def denied(self):
+        return [reg for (reg, res) in zip(self.regions, self.results)
+                if res.result != 0]
+
+    def __repr__(self):
+        return "SweepResult(result=%d, allowed=%d, denied=%d)" % \
+               (self.result, len(self.allowed()), len(self.denied()))
+
+
+def formatRegion(region):
+    return "%s (lba %d+%d)" % (region.name, region.lba, region.nblocks)
+
+def formatRegions(regions):
+    return ", ".join([formatRegion(r) for r in regions]) or "none"
+
+
+################################################################
+# the summary, per initiator
+
+# (dev, "read" or "write") -> {region: [times allowed, times denied]}
+summary = {}
+mixed = {}                              # (dev, op) -> mixed sweeps
+summary_lock = threading.Lock()
+
+def note(dev, write, res):
+    """Add a sweep by an initiator to the summary"""
+    op = write and "write" or "read"
+    summary_lock.acquire()
+    try:
+        counts = summary.setdefault((dev, op), {})
+        for reg in res.allowed():
+            counts.setdefault(reg, [0, 0])[0] += 1
+        for reg in res.denied():
+            counts.setdefault(reg, [0, 0])[1] += 1
+        if res.result == MIXED:
+            mixed[(dev, op)] = mixed.get((dev, op), 0) + 1
+    finally:
+        summary_lock.release()
+    if res.result == MIXED:
+        log.error("%s %s enforced on only part of the LUN: allowed %s; "
+                  "denied %s" % (dev, op, formatRegions(res.allowed()),
+                                 formatRegions(res.denied())))
+
+def formatSummary():
+    lines = ["Access sweeps (PGR_SWEEP_SEED=%d):" % seed]
+    summary_lock.acquire()
+    try:
+        for (dev, op) in sorted(summary.keys()):
+            counts = summary[(dev, op)]
+            regions = sorted(counts.keys(), key=lambda r: r.lba)
+            lines.append("  %s %s: %d partly-enforced sweep(s)" %
+                         (dev, op, mixed.get((dev, op), 0)))
+            # with enforcement everywhere, every region's counts match
+            for reg in regions:
+                lines.append("    %s: allowed %d, denied %d" %
+                             ((formatRegion(reg),) + tuple(counts[reg])))
+    finally:
+        summary_lock.release()
+    return "\n".join(lines) + "\n"
+
+
+def reportAtExit():
+    if summary:
+        sys.stderr.write(formatSummary())
+
+atexit.register(reportAtExit)
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+"""
+timing -- per-command timing instrumentation for PGR testing
+
+When enabled (PGR_CMD_TIMING=1, or "--with-cmd-timing" on the
+testit.py command line), every Initiator operation and every command
+run by runCmdWithOutput() is recorded as a CmdRecord: the test it ran
+in, the operation, the initiator, its start and end (monotonic ns),
+its exit status, and how many times it was retried (and how long
+that took). The records are aggregated per test, and reported at the
+end of the run.
+
+Other consumers can see each record as it is made with addHook().
+
+When disabled, the only cost is checking a flag on each call.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import atexit
+import threading
+from collections import namedtuple
+
+import config
+from clock import monotonicNs
+from stats import summarize
+
+
+__all__ = [
+    'CmdRecord',
+    'enable',
+    'isEnabled',
+    'setTest',
+    'addHook',
+    'record',
+    'timedOp',
+    'formatReport',
+    'reset',
+    ]
+
+################################################################
+
+# kind is "op" (an Initiator operation) or "cmd" (a child process,
+# usually run for an "op", so their times overlap)
+CmdRecord = namedtuple("CmdRecord",
+                       "test kind op dev key start end result retries "
+                       "retry_ns")
+
+NO_TEST = "(outside any test)"
+
+enabled = False
+current_test = NO_TEST
+records = []
+walls = {}
+hooks = []
+reported = False
+lock = threading.Lock()
+
+
+def enable(on=True):
+    """Turn instrumentation on (or off)"""
+    global enabled
+    enabled = on
+
+def isEnabled():
+    return enabled
+
+def setTest(name, wall_ns=None):
+    """Say which test is now running (None for none), and how long
+    the last one took, if known"""
+    global current_test
+    if wall_ns is not None:
+        walls[current_test] = walls.get(current_test, 0) + wall_ns
+    if name is None:
+        name = NO_TEST
+    current_test = name
+
+def addHook(fn):
+    """Call fn(record) for each CmdRecord, as it is made"""
+    hooks.append(fn)
+
+def record(kind, op, dev, key, start, end, result, retries=0, retry_ns=0):
+    """Record one command"""
+    rec = CmdRecord(current_test, kind, op, dev, key, start, end,
+                    result, retries, retry_ns)
+    lock.acquire()
+    try:
+        records.append(rec)
+    finally:
+        lock.release()
+    for fn in hooks:
+        fn(rec)
+
+def reset():
+    """Forget everything recorded so far"""
+    lock.acquire()
+    try:
+        del records[:]
+        walls.clear()
+    finally:
+        lock.release()
+
+
+def resultOf(ret):
+    """The exit status of an operation's return value, if it has one"""
+    if isinstance(ret, (int, long)):
+        return ret
+    return getattr(ret, "result", None)
+
+def timedOp(name):
+    """Decorator recording each call of an Initiator method as the
+    operation name"""
+    def wrap(fn):
+        def timed(self, *args, **kwargs):
+            if not enabled:
+                return fn(self, *args, **kwargs)
+            self.retries = 0
+            self.retry_ns = 0
+            start = monotonicNs()
+            ret = fn(self, *args, **kwargs)
+            record("op", name, self.dev, self.key, start, monotonicNs(),
+                   resultOf(ret), self.retries, self.retry_ns)
+            return ret
+        timed.__name__ = fn.__name__
+        timed.__doc__ = fn.__doc__
+        return timed
+    return wrap
+
+
+################################################################
+
+def aggregate():
+    """Return {test: {(kind, op): [record, ...]}}"""
+    tests = {}
+    lock.acquire()
+    try:
+        for rec in records:
+            ops = tests.setdefault(rec.test, {})
+            ops.setdefault((rec.kind, rec.op), []).append(rec)
+    finally:
+        lock.release()
+    return tests
+
+def formatOps(ops):
+    lines = []
+    for (kind, op) in sorted(ops.keys()):
+        recs = ops[(kind, op)]
+        s = summarize([r.end - r.start for r in recs])
+        lines.append("    %-3s %-22s n=%-5d total=%9.3fms p50=%8.3fms "
+                     "max=%8.3fms retries=%d (%.3fms) failed=%d" %
+                     (kind, op, s["count"],
+                      sum([r.end - r.start for r in recs]) / 1e6,
+                      s["p50"] / 1e6, s["max"] / 1e6,
+                      sum([r.retries for r in recs]),
+                      sum([r.retry_ns for r in recs]) / 1e6,
+                      len([r for r in recs if r.result not in (0, None)])))
+    return lines
+
+def formatReport():
+    """Format the per-test timing report"""
+    tests = aggregate()
+    lines = ["Command timing (device time is summed over initiators, "
+             "so may exceed wall time):"]
+    every = {}
+    for test in sorted(tests.keys()):
+        ops = tests[test]
+        op_recs = [r for ((kind, op), recs) in ops.items() if kind == "op"
+                   for r in recs]
+        dev_ns = sum([r.end - r.start for r in op_recs])
+        retried = ", retries %d (%.3fms)" % \
+                  (sum([r.retries for r in op_recs]),
+                   sum([r.retry_ns for r in op_recs]) / 1e6)
+        if test in walls:
+            lines.append("  %s: wall %.3fms, device %.3fms, harness %.3fms%s"
+                         % (test, walls[test] / 1e6, dev_ns / 1e6,
+                            max(0, walls[test] - dev_ns) / 1e6, retried))
+        else:
+            lines.append("  %s: device %.3fms%s" %
+                         (test, dev_ns / 1e6, retried))
+        lines.extend(formatOps(ops))
+        for (k, recs) in ops.items():
+            every.setdefault(k, []).extend(recs)
+    lines.append("  all tests:")
+    lines.extend(formatOps(every))
+    return "\n".join(lines) + "\n"
+
+def report(stream):
+    """Write the report (once)"""
+    global reported
+    if not reported:
+        reported = True
+        stream.write(formatReport())
+
+def reportAtExit():
+    if enabled:
+        report(sys.stderr)
+
+
+if config.cmd_timing:
+    enable()
+atexit.register(reportAtExit)
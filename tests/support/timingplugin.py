@@ -0,0 +1,45 @@
+#!/usr/bin/python
+"""
+timingplugin -- nose plugin reporting per-command timing
+
+Enabled with "--with-cmd-timing" (testit.py adds the plugin), or by
+setting PGR_CMD_TIMING=1. It tells the timing module which test is
+running, and how long each took, and prints the timing report at the
+end of the run.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+from nose.plugins import Plugin
+
+import timing
+from clock import monotonicNs
+
+
+__all__ = [
+    'CmdTiming',
+    ]
+
+
+class CmdTiming(Plugin):
+    """Record and report how long each command takes, per test"""
+    name = "cmd-timing"
+
+    def configure(self, options, conf):
+        Plugin.configure(self, options, conf)
+        if timing.isEnabled():
+            self.enabled = True
+        if self.enabled:
+            timing.enable()
+        self.start = None
+
+    def beforeTest(self, test):
+        timing.setTest(test.id())
+        self.start = monotonicNs()
+
+    def afterTest(self, test):
+        timing.setTest(None, monotonicNs() - self.start)
+
+    def report(self, stream):
+        timing.report(stream)
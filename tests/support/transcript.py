@@ -0,0 +1,357 @@
+#!/usr/bin/python
+"""
+transcript -- record device commands, and replay them offline
+
+With PGR_RECORD set to a file name, every command the configured
+transport and I/O engine send (PR OUT, PR IN, TEST UNIT READY,
+INQUIRY, and the read and write probes) is appended to that file,
+with its arguments, its outcome, and how long it took. The
+transcript is append-only, one compact JSON line per command, so it
+survives a run that dies part way, and several processes can add to
+the same one. Each recording starts with a header line giving its
+settings, including the access sweep seed, which a replay reuses
+unless PGR_SWEEP_SEED is set.
+
+With PGR_REPLAY set to a transcript, the same commands are answered
+from it instead, without touching any device: each device's commands
+must come in the order they were recorded, so a change in what the
+harness sends shows up as a ReplayMismatch. Set PGR_REPLAY_TIMING=1
+to also take as long as each command originally did.
+
+Races (see contention) are not repeatable, so neither are their
+transcripts.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import json
+import time
+import base64
+import logging
+import threading
+
+import config
+from clock import monotonicNs
+from probe import PROBE_LBA, ProbeResult
+from sense import resultToWire, resultFromWire
+from transport import PR_IN_ALLOC_LEN, Transport
+
+
+__all__ = [
+    'ReplayMismatch',
+    'TranscriptWriter',
+    'TranscriptReader',
+    'RecordingTransport',
+    'RecordingIoEngine',
+    'ReplayTransport',
+    'ReplayIoEngine',
+    'getWriter',
+    'getReader',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+# 2: command results carry their status and sense data (the bare exit
+# statuses of version 1 are still read)
+TRANSCRIPT_VERSION = 2
+
+
+class ReplayMismatch(Exception):
+    """A command was not the one recorded next for its device"""
+    pass
+
+
+class TranscriptWriter:
+    """Appends commands to a transcript file"""
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                          0644)
+        # (sweep needs this module when replaying)
+        import sweep
+        self.write({"transcript" : TRANSCRIPT_VERSION,
+                    "started" : time.time(),
+                    "pid" : os.getpid(),
+                    "transport" : config.transport,
+                    "io_engine" : config.io_engine,
+                    "sweep_seed" : sweep.seed})
+
+    def write(self, obj):
+        # one write() per line, so lines from several processes do not
+        # get mixed up
+        os.write(self.fd, json.dumps(obj, separators=(",", ":")) + "\n")
+
+    def record(self, dev, op, args, reply, elapsed_ns):
+        """Add one command, and its (JSON-able) reply"""
+        self.write([dev, op, list(args), reply, elapsed_ns])
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class TranscriptReader:
+    """Serves the commands in a transcript, in order for each device"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.queues = {}                # dev -> [[op, args, reply, ns]]
+        self.headers = []
+        f = open(path)
+        try:
+            for line in f:
+                rec = json.loads(line)
+                if isinstance(rec, dict):
+                    # a header, from the start of a recording
+                    self.headers.append(rec)
+                    continue
+                (dev, op, args, reply, elapsed_ns) = rec
+                self.queues.setdefault(dev, []).append(
+                    (op, args, reply, elapsed_ns))
+        finally:
+            f.close()
+        for q in self.queues.values():
+            q.reverse()
+
+    def next(self, dev, op, args):
+        """Return (reply, elapsed_ns) for the device's next command,
+        which must be the one given"""
+        # compare the arguments as they were written
+        args = json.loads(json.dumps(list(args)))
+        self.lock.acquire()
+        try:
+            q = self.queues.get(dev)
+            if not q:
+                raise ReplayMismatch("%s: %s%s not recorded" %
+                                     (dev, op, tuple(args)))
+            (rop, rargs, reply, elapsed_ns) = q[-1]
+            if (rop, rargs) != (op, args):
+                raise ReplayMismatch("%s: %s%s sent, but %s%s recorded" %
+                                     (dev, op, tuple(args),
+                                      rop, tuple(rargs)))
+            q.pop()
+        finally:
+            self.lock.release()
+        if config.replay_timing:
+            time.sleep(elapsed_ns / 1e9)
+        return (reply, elapsed_ns)
+
+    def header(self, name):
+        """Return a setting from the first recording's header that has
+        it (or None)"""
+        for h in self.headers:
+            if name in h:
+                return h[name]
+        return None
+
+    def remaining(self):
+        """How many commands have not been replayed, per device"""
+        return dict([(dev, len(q)) for (dev, q) in self.queues.items()])
+
+
+writers = {}
+readers = {}
+files_lock = threading.Lock()
+
+def getWriter(path=None):
+    """Get the writer for a transcript (PGR_RECORD by default)"""
+    if path is None:
+        path = config.record
+    files_lock.acquire()
+    try:
+        # a forked child must not share its parent's writer's header
+        if path not in writers or writers[path][0] != os.getpid():
+            writers[path] = (os.getpid(), TranscriptWriter(path))
+        return writers[path][1]
+    finally:
+        files_lock.release()
+
+def getReader(path=None):
+    """Get the reader for a transcript (PGR_REPLAY by default)"""
+    if path is None:
+        path = config.replay
+    files_lock.acquire()
+    try:
+        if path not in readers:
+            log.debug("Replaying from %s" % path)
+            readers[path] = TranscriptReader(path)
+        return readers[path]
+    finally:
+        files_lock.release()
+
+
+################################################################
+# replies as written to a transcript
+
+def probeToWire(res):
+    return [res.result, getattr(res, "errno", 0),
+            getattr(res, "nbytes", 0), getattr(res, "elapsed_ns", 0)]
+
+def probeFromWire(wire):
+    (result, errno, nbytes, elapsed_ns) = wire
+    res = ProbeResult(errno, nbytes, elapsed_ns)
+    res.result = result
+    return res
+
+def prInToWire(ret):
+    (result, data) = ret
+    return [resultToWire(result), data and base64.b64encode(data)]
+
+def prInFromWire(wire):
+    (result, data) = wire
+    return (resultFromWire(result), data and base64.b64decode(data))
+
+
+################################################################
+
+class RecordingTransport(Transport):
+    """Passes commands to another transport, recording each one"""
+    def __init__(self, inner, writer=None):
+        Transport.__init__(self, inner.dev)
+        self.inner = inner
+        if writer is None:
+            writer = getWriter()
+        self.writer = writer
+
+    def call(self, op, args, fn, to_wire=resultToWire):
+        start = monotonicNs()
+        ret = fn(*args)
+        self.writer.record(self.dev, op, args, to_wire(ret),
+                           monotonicNs() - start)
+        self.last_sense = self.inner.last_sense
+        return ret
+
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        return self.call("prOut", (sa, key, sakey, prout_type),
+                         self.inner.prOut)
+
+    def prIn(self, sa, alloc_len=PR_IN_ALLOC_LEN):
+        return self.call("prIn", (sa, alloc_len), self.inner.prIn,
+                         prInToWire)
+
+    def tur(self):
+        return self.call("tur", (), self.inner.tur)
+
+    def inquirySn(self):
+        return self.call("inquirySn", (), self.inner.inquirySn,
+                         lambda r: r)
+
+    def close(self):
+        self.inner.close()
+
+
+class RecordingIoEngine:
+    """Passes probes to another I/O engine, recording each one"""
+    def __init__(self, inner, writer=None):
+        self.dev = inner.dev
+        self.inner = inner
+        if writer is None:
+            writer = getWriter()
+        self.writer = writer
+
+    def close(self):
+        self.inner.close()
+
+    def call(self, op, fn, lba, nblocks):
+        start = monotonicNs()
+        res = fn(lba, nblocks)
+        self.writer.record(self.dev, op, (lba, nblocks), probeToWire(res),
+                           monotonicNs() - start)
+        return res
+
+    def read(self, lba=PROBE_LBA, nblocks=1):
+        """Read blocks from the device"""
+        return self.call("read", self.inner.read, lba, nblocks)
+
+    def write(self, lba=PROBE_LBA, nblocks=1):
+        """Write blocks (of zeros) to the device (destructive!)"""
+        return self.call("write", self.inner.write, lba, nblocks)
+
+    def capacity(self):
+        """How many blocks the device has"""
+        start = monotonicNs()
+        ret = self.inner.capacity()
+        self.writer.record(self.dev, "capacity", (), ret,
+                           monotonicNs() - start)
+        return ret
+
+    def sweep(self, regions, write=False):
+        """Read (or write zeros to) each (lba, nblocks) region"""
+        regions = [list(r) for r in regions]
+        start = monotonicNs()
+        results = self.inner.sweep(regions, write)
+        self.writer.record(self.dev, "sweep", (regions, write),
+                           [probeToWire(r) for r in results],
+                           monotonicNs() - start)
+        return results
+
+
+class ReplayTransport(Transport):
+    """Answers commands from a transcript"""
+    def __init__(self, dev, reader=None):
+        Transport.__init__(self, dev)
+        if reader is None:
+            reader = getReader()
+        self.reader = reader
+
+    def replay(self, op, *args):
+        return self.reader.next(self.dev, op, args)[0]
+
+    def result(self, wire):
+        result = resultFromWire(wire)
+        self.last_sense = result.sense
+        return result
+
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        return self.result(self.replay("prOut", sa, key, sakey, prout_type))
+
+    def prIn(self, sa, alloc_len=PR_IN_ALLOC_LEN):
+        (result, data) = prInFromWire(self.replay("prIn", sa, alloc_len))
+        self.last_sense = result.sense
+        return (result, data)
+
+    def tur(self):
+        return self.result(self.replay("tur"))
+
+    def inquirySn(self):
+        sn = self.replay("inquirySn")
+        return sn and str(sn)
+
+
+class ReplayIoEngine:
+    """Answers probes from a transcript"""
+    def __init__(self, dev, reader=None):
+        self.dev = dev
+        if reader is None:
+            reader = getReader()
+        self.reader = reader
+
+    def close(self):
+        pass
+
+    def read(self, lba=PROBE_LBA, nblocks=1):
+        """Read blocks from the device"""
+        return probeFromWire(self.reader.next(self.dev, "read",
+                                              (lba, nblocks))[0])
+
+    def write(self, lba=PROBE_LBA, nblocks=1):
+        """Write blocks to the device"""
+        return probeFromWire(self.reader.next(self.dev, "write",
+                                              (lba, nblocks))[0])
+
+    def capacity(self):
+        """How many blocks the device has"""
+        return self.reader.next(self.dev, "capacity", ())[0]
+
+    def sweep(self, regions, write=False):
+        """Read (or write) each (lba, nblocks) region"""
+        regions = [list(r) for r in regions]
+        return [probeFromWire(w) for w in
+                self.reader.next(self.dev, "sweep", (regions, write))[0]]
@@ -0,0 +1,254 @@
+#!/usr/bin/python
+"""
+transport -- how PGR commands get to a device
+
+A Transport issues the SCSI commands an Initiator needs. Two are
+provided:
+
+ - SgIoTransport: builds the CDBs itself and issues them with the
+   SG_IO ioctl on an already-open device (the default)
+ - SgPersistTransport: runs the sg3_utils commands and parses their
+   output (the fallback)
+
+The "worker" transport (see worker.py) runs an SgIoTransport in a
+long-lived child process, and the "emulator" transport (see
+emulator.py) sends the commands to an in-process emulated target.
+
+Results are sg3_utils-style exit categories in both cases, so either
+can be used by the same tests. They are CmdResults (see sense.py), so
+they also say what status (and, from SG_IO, what sense data) the
+command got, and how long it took. PERSISTENT RESERVE IN data is returned
+in binary either way (sg_persist is asked for a hex dump), and decoded
+by the prin module.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import struct
+import logging
+
+import config
+from cmd import runCmdWithOutput
+from prin import DecodeError, decodeReadKeys, decodeReadReservation, \
+     decodeReadFullStatus, hexDumpToBytes
+from reservation import keyToInt
+from sense import ExitCat, resultFromExit
+from sgio import SgDevice, PrInSa, PrOutSa, prInCdb, prOutCdb, \
+     prOutParams, turCdb, inquiryCdb
+
+
+__all__ = [
+    'Transport',
+    'SgPersistTransport',
+    'SgIoTransport',
+    'makeTransport',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+PR_IN_ALLOC_LEN = 8192
+PR_IN_MAX_ALLOC_LEN = 0xffff
+
+
+class Transport:
+    """Base class for ways of sending commands to a device"""
+    def __init__(self, dev):
+        self.dev = dev
+        # the decoded sense data from the last command, if we have it
+        self.last_sense = None
+
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        """Send a PERSISTENT RESERVE OUT, returning a CmdResult"""
+        raise NotImplementedError
+
+    def prIn(self, sa, alloc_len=PR_IN_ALLOC_LEN):
+        """Send a PERSISTENT RESERVE IN, returning (CmdResult, data)"""
+        raise NotImplementedError
+
+    def readPrIn(self, sa, decode):
+        """Send a PERSISTENT RESERVE IN and decode its data, returning
+        (result, record). If the data was truncated, the command is
+        reissued with a large enough allocation length."""
+        alloc_len = PR_IN_ALLOC_LEN
+        while True:
+            (result, data) = self.prIn(sa, alloc_len)
+            if result != 0:
+                return (result, None)
+            try:
+                rec = decode(data)
+            except DecodeError, e:
+                log.debug("Bad PR IN data from %s: %s" % (self.dev, e))
+                return (resultFromExit(ExitCat["Other"],
+                                       getattr(result, "elapsed_ns", 0)),
+                        None)
+            if rec.needed <= len(data) or alloc_len >= PR_IN_MAX_ALLOC_LEN:
+                return (result, rec)
+            log.debug("PR IN needs %d bytes, reissuing" % rec.needed)
+            alloc_len = min(rec.needed, PR_IN_MAX_ALLOC_LEN)
+
+    def readKeys(self):
+        """Return (result, ReadKeys) from READ KEYS"""
+        return self.readPrIn(PrInSa["ReadKeys"], decodeReadKeys)
+
+    def readReservation(self):
+        """Return (result, ReadReservation) from READ RESERVATION"""
+        return self.readPrIn(PrInSa["ReadReservation"],
+                             decodeReadReservation)
+
+    def readFullStatus(self):
+        """Return (result, FullStatus) from READ FULL STATUS"""
+        return self.readPrIn(PrInSa["ReadFullStatus"], decodeReadFullStatus)
+
+    def tur(self):
+        """Send a TEST UNIT READY, returning a CmdResult"""
+        raise NotImplementedError
+
+    def inquirySn(self):
+        """Return the Unit Serial Number, or None"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held"""
+        pass
+
+
+################################################################
+
+class SgPersistTransport(Transport):
+    """Send commands by running sg_persist, sg_turs, and sg_inq"""
+
+    # map PR OUT service actions to sg_persist options
+    prout_opts = {
+        PrOutSa["Register"] : "--register",
+        PrOutSa["Reserve"] : "--reserve",
+        PrOutSa["Release"] : "--release",
+        PrOutSa["Clear"] : "--clear",
+        PrOutSa["Preempt"] : "--preempt",
+        PrOutSa["PreemptAndAbort"] : "--preempt-abort",
+        PrOutSa["RegisterAndIgnore"] : "--register-ignore"}
+
+    # map PR IN service actions to sg_persist options
+    prin_opts = {
+        PrInSa["ReadKeys"] : "--read-keys",
+        PrInSa["ReadReservation"] : "--read-reservation",
+        PrInSa["ReportCapabilities"] : "--report-capabilities",
+        PrInSa["ReadFullStatus"] : "--read-full-status"}
+
+    def runSgCmdWithOutput(self, cmd):
+        """Run the SG command on our device"""
+        my_cmd = ["sg_persist", "-n"] + cmd + [self.dev]
+        return runCmdWithOutput(my_cmd)
+
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        cmd = ["--out", self.prout_opts[sa]]
+        if key is not None:
+            cmd.append("--param-rk=" + key)
+        if sakey is not None:
+            cmd.append("--param-sark=" + sakey)
+        if prout_type is not None:
+            cmd.append("--prout-type=" + prout_type)
+        res = self.runSgCmdWithOutput(cmd)
+        return resultFromExit(res.result, res.elapsed_ns)
+
+    def prIn(self, sa, alloc_len=PR_IN_ALLOC_LEN):
+        res = self.runSgCmdWithOutput(["--hex",
+                                       "--alloc-length=%d" % alloc_len,
+                                       self.prin_opts[sa]])
+        result = resultFromExit(res.result, res.elapsed_ns)
+        if result != 0:
+            return (result, None)
+        return (result, hexDumpToBytes(res.lines))
+
+    def tur(self):
+        res = runCmdWithOutput(["sg_turs", self.dev])
+        return resultFromExit(res.result, res.elapsed_ns)
+
+    def inquirySn(self):
+        res = runCmdWithOutput(["sg_inq", self.dev])
+        ret = None
+        if res.result == 0:
+            if "Unit serial number" in res.lines[-1]:
+                line = res.lines[-1]
+                ret = line.split()[-1]
+        return ret
+
+
+################################################################
+
+class SgIoTransport(Transport):
+    """Send commands in-process, using the SG_IO ioctl"""
+    def __init__(self, dev, ioctl=None):
+        Transport.__init__(self, dev)
+        self.sg = SgDevice(dev, ioctl=ioctl)
+
+    def execute(self, cdb, data_out=None, data_in_len=0):
+        """Issue a CDB, keeping its sense data, returning an SgIoResult"""
+        res = self.sg.execute(cdb, data_out=data_out,
+                              data_in_len=data_in_len)
+        self.last_sense = res.sense
+        return res
+
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        rtype = 0
+        if prout_type is not None:
+            rtype = int(prout_type)
+        res = self.execute(prOutCdb(sa, rtype),
+                           data_out=prOutParams(keyToInt(key),
+                                                keyToInt(sakey)))
+        return res.result
+
+    def prIn(self, sa, alloc_len=PR_IN_ALLOC_LEN):
+        res = self.execute(prInCdb(sa, alloc_len), data_in_len=alloc_len)
+        return (res.result, res.data)
+
+    def tur(self):
+        return self.execute(turCdb()).result
+
+    def inquirySn(self):
+        res = self.execute(inquiryCdb(252, page=0x80), data_in_len=252)
+        if res.result != 0 or len(res.data) < 4:
+            return None
+        page_len = struct.unpack_from(">H", res.data, 2)[0]
+        sn = res.data[4:4 + page_len].strip(" \0")
+        if not sn:
+            return None
+        return sn
+
+    def close(self):
+        self.sg.close()
+
+
+################################################################
+
+transports = {
+    "sgio" : SgIoTransport,
+    "sg_persist" : SgPersistTransport}
+
+def makeTransport(dev, kind=None):
+    """Create the configured kind of transport for a device (which
+    is recorded to, or replayed from, a transcript if so configured)"""
+    if kind is None:
+        if config.replay:
+            from transcript import ReplayTransport
+            return ReplayTransport(dev)
+        if config.record:
+            from transcript import RecordingTransport
+            return RecordingTransport(makeTransport(dev, config.transport))
+        kind = config.transport
+    if kind == "worker":
+        from worker import WorkerTransport
+        return WorkerTransport(dev)
+    if kind == "emulator":
+        from emulator import EmulatorTransport
+        return EmulatorTransport(dev)
+    if kind not in transports:
+        raise ValueError("Unknown transport: %s" % kind)
+    if config.oracle:
+        from emulator import OracleTransport
+        return OracleTransport(dev, transports[kind](dev))
+    return transports[kind](dev)
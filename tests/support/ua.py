@@ -0,0 +1,154 @@
+#!/usr/bin/python
+"""
+ua -- track which nexuses may have a Unit Attention pending
+
+Rather than sending a TEST UNIT READY "just in case" to clear Unit
+Attentions, each Initiator tells the tracker what happened:
+
+ - a command that got CHECK CONDITION/UNIT ATTENTION (judged from
+   its sense data when there is any, else from its sg_persist exit
+   category) means another may still be queued for that nexus
+ - a command that completed any other way (other than INQUIRY, which
+   never reports one) means none is pending
+ - a successful PREEMPT or CLEAR, a RELEASE of a Registrants Only or
+   All Registrants reservation, or the holder of such a reservation
+   unregistering, leaves a Unit Attention for the other nexuses
+ - read and write probes consume them (the disk driver retries them)
+
+Initiator.clearUa() then only sends a TUR if one is expected.
+
+The counters (Unit Attentions seen, by ASC/ASCQ when known, TURs
+sent, and TURs saved) are reported at the end of the run along with
+the command timings.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import atexit
+import logging
+import threading
+
+import timing
+from sense import ExitCat, SenseKeys
+
+
+__all__ = [
+    'UaTracker',
+    'tracker',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+# results that say the command got past any Unit Attention checks,
+# so none was pending
+NO_UA_RESULTS = (ExitCat["Clean"], ExitCat["IllegalRequest"],
+                 ExitCat["ResConflict"])
+
+
+class UaTracker:
+    """Which nexuses (by device) may have a Unit Attention pending"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.devs = set()               # every nexus known
+        self.pending = set()            # those that may have one
+        self.seen = 0
+        self.causes = {}                # (ASC, ASCQ) -> times seen
+        self.turs_sent = 0
+        self.turs_saved = 0
+
+    def add(self, dev):
+        """Know about a nexus (so it can be told about others' UAs)"""
+        self.lock.acquire()
+        try:
+            self.devs.add(dev)
+        finally:
+            self.lock.release()
+
+    def expect(self, devs):
+        """Expect a Unit Attention on each of the nexuses"""
+        self.lock.acquire()
+        try:
+            self.pending.update(devs)
+        finally:
+            self.lock.release()
+
+    def expectOthers(self, dev):
+        """Expect a Unit Attention on every nexus but this one"""
+        self.expect([d for d in self.devs if d != dev])
+
+    def isExpected(self, dev):
+        return dev in self.pending
+
+    def note(self, dev, result):
+        """Note the result of a command (not INQUIRY) from a nexus"""
+        sense = getattr(result, "sense", None)
+        if sense is not None:
+            is_ua = sense.matches(SenseKeys["UnitAttention"])
+        else:
+            is_ua = result == ExitCat["UnitAttention"]
+        self.lock.acquire()
+        try:
+            if is_ua:
+                self.seen += 1
+                self.pending.add(dev)
+                if sense is not None:
+                    cause = (sense.asc, sense.ascq)
+                    self.causes[cause] = self.causes.get(cause, 0) + 1
+                    log.debug("%s: Unit Attention %02x/%02x" %
+                              (dev, sense.asc, sense.ascq))
+            elif result in NO_UA_RESULTS:
+                self.pending.discard(dev)
+        finally:
+            self.lock.release()
+
+    def consumed(self, dev):
+        """Any Unit Attention for the nexus has been dealt with"""
+        self.lock.acquire()
+        try:
+            self.pending.discard(dev)
+        finally:
+            self.lock.release()
+
+    def countTur(self, sent):
+        """Count a TUR sent (or not sent) to clear Unit Attentions"""
+        self.lock.acquire()
+        try:
+            if sent:
+                self.turs_sent += 1
+            else:
+                self.turs_saved += 1
+        finally:
+            self.lock.release()
+
+    def reset(self):
+        """Forget all counts and expectations (not the nexuses)"""
+        self.lock.acquire()
+        try:
+            self.pending.clear()
+            self.causes.clear()
+            self.seen = self.turs_sent = self.turs_saved = 0
+        finally:
+            self.lock.release()
+
+    def format(self):
+        causes = "".join([" %02x/%02x=%d" % (asc, ascq, n) for
+                          ((asc, ascq), n) in sorted(self.causes.items())])
+        return "Unit Attentions: seen=%d%s, TURs sent=%d, TURs saved=%d\n" % \
+               (self.seen, causes, self.turs_sent, self.turs_saved)
+
+
+# the nexuses this process uses, shared by all its Initiators
+tracker = UaTracker()
+
+
+def reportAtExit():
+    if timing.isEnabled():
+        sys.stderr.write(tracker.format())
+
+atexit.register(reportAtExit)
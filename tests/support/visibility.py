@@ -0,0 +1,100 @@
+#!/usr/bin/python
+"""
+visibility -- wait for PR state to be seen from every initiator
+
+After one initiator changes the PR state, the others may not see the
+change at once (e.g. with some targets, or through multipath). Rather
+than sleeping for a fixed time, these functions poll READ RESERVATION
+from each initiator until the expected state is seen from all of them,
+backing off from a short interval, and return how long that took (the
+propagation time). Each propagation time is kept in "propagation", and
+recorded by the timing module when that is enabled.
+
+If the state is not seen by the deadline (PGR_VISIBILITY_DEADLINE
+seconds, by default), VisibilityTimeout is raised.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import time
+import logging
+
+import config
+import timing
+from clock import monotonicNs
+from parallel import callEach
+from reservation import keyToInt
+
+
+__all__ = [
+    'VisibilityTimeout',
+    'waitForState',
+    'waitForReservation',
+    'waitForNoReservation',
+    'propagation',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+FIRST_INTERVAL = 0.001
+MAX_INTERVAL = 0.05
+
+# (description, ns) for each wait
+propagation = []
+
+
+class VisibilityTimeout(AssertionError):
+    """The expected PR state was not seen in time"""
+    pass
+
+
+def waitForState(inits, matches, what, deadline=None):
+    """Poll each initiator's reservation until matches(record) is true
+    for all of them, returning the time taken in ns"""
+    if deadline is None:
+        deadline = config.visibility_deadline
+    start = monotonicNs()
+    end = start + int(deadline * 1000000000)
+    waiting = list(inits)
+    interval = FIRST_INTERVAL
+    while True:
+        recs = callEach(waiting, "peekReservation")
+        waiting = [waiting[i] for i in range(len(waiting))
+                   if recs[i] is None or not matches(recs[i])]
+        now = monotonicNs()
+        if not waiting:
+            break
+        if now >= end:
+            raise VisibilityTimeout(
+                "%s not seen from %s after %.3fs" %
+                (what, ", ".join([i.dev for i in waiting]), deadline))
+        time.sleep(interval)
+        interval = min(interval * 2, MAX_INTERVAL)
+    elapsed = now - start
+    propagation.append((what, elapsed))
+    if timing.enabled:
+        timing.record("wait", "VISIBLE", None, None, start, now, 0)
+    log.debug("%s seen from all in %.3fms" % (what, elapsed / 1e6))
+    return elapsed
+
+
+def waitForReservation(inits, key, rtype, deadline=None):
+    """Wait until all the initiators see a reservation of type rtype
+    held by key ("0x0" for All Registrants types)"""
+    knum = keyToInt(key)
+    tnum = int(rtype)
+    return waitForState(inits,
+                        lambda r: r.key == knum and r.rtype == tnum,
+                        "reservation by %s (type %d)" % (key, tnum),
+                        deadline)
+
+
+def waitForNoReservation(inits, deadline=None):
+    """Wait until none of the initiators see a reservation"""
+    return waitForState(inits, lambda r: r.key is None,
+                        "no reservation", deadline)
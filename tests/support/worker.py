@@ -0,0 +1,267 @@
+#!/usr/bin/python
+"""
+worker -- a long-lived per-device command worker for PGR testing
+
+Instead of starting a new process for every command, each device gets
+one worker process. The worker opens the device once, then reads
+requests (one JSON object per line) from its stdin, executes them
+using the in-process SG_IO transport and direct I/O engine, and
+writes one JSON result line per request to its stdout.
+
+Requests may be queued: submit() any number of them, then collect()
+the results, in order.
+"""
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import json
+import atexit
+import logging
+import subprocess
+
+from deadline import watchdog
+from transport import PR_IN_ALLOC_LEN, Transport, makeTransport
+from probe import ProbeResult, makeIoEngine
+from sense import resultToWire, resultFromWire
+
+
+__all__ = [
+    'Worker',
+    'WorkerError',
+    'WorkerTransport',
+    'WorkerIoEngine',
+    'getWorker',
+    ]
+
+################################################################
+
+log = logging.getLogger('nose.user')
+
+################################################################
+
+
+MAX_PENDING = 64
+
+
+class WorkerError(Exception):
+    """The worker process failed"""
+    pass
+
+
+class Worker:
+    """A child process that executes commands for one device"""
+    def __init__(self, dev, transport="sgio", io_engine="direct"):
+        self.dev = dev
+        self.transport = transport
+        self.io_engine = io_engine
+        self.start()
+
+    def start(self):
+        """Start the worker process"""
+        script = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+        cmd = [sys.executable, script, self.dev, self.transport,
+               self.io_engine]
+        log.debug("Starting worker: %s" % cmd)
+        self.proc = subprocess.Popen(cmd,
+                                     stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     close_fds=True)
+        self.pending = 0
+        self.done = []
+
+    def kill(self):
+        """Kill the worker (e.g. if it has hung)"""
+        if self.proc is not None:
+            self.proc.kill()
+
+    def submit(self, op, *args):
+        """Queue a request, without waiting for its result"""
+        if self.proc is None:
+            raise WorkerError("worker for %s is closed" % self.dev)
+        if self.pending >= MAX_PENDING:
+            # don't let the pipes fill up in both directions
+            self.done.append(self._next())
+        try:
+            self.proc.stdin.write(json.dumps([op, list(args)]) + "\n")
+        except IOError, e:
+            self.died(e)
+        self.pending += 1
+
+    def _next(self):
+        """Wait for the next result"""
+        try:
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except IOError, e:
+            self.died(e)
+        self.pending -= 1
+        if not line:
+            self.died("end of output")
+        (status, value) = json.loads(line)
+        if status != "ok":
+            raise WorkerError("worker for %s: %s" % (self.dev, value))
+        return value
+
+    def collect(self):
+        """Return the results of all queued requests, in order"""
+        results = self.done
+        self.done = []
+        while self.pending > 0:
+            results.append(self._next())
+        return results
+
+    def died(self, why):
+        """The worker has died (or been killed): start another one, for
+        the requests to come, and raise WorkerError for these"""
+        log.debug("Worker for %s died (%s): restarting" % (self.dev, why))
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.start()
+        raise WorkerError("worker for %s died" % self.dev)
+
+    def call(self, op, *args):
+        """Run one request, and return its result. If it hangs, the
+        worker is killed (and so started again)."""
+        watch = watchdog.start(self.dev, "worker %s%s" % (op, args),
+                               self.kill)
+        try:
+            self.submit(op, *args)
+            return self.collect()[-1]
+        finally:
+            watchdog.finish(watch)
+
+    def close(self):
+        """Stop the worker"""
+        if self.proc is not None:
+            log.debug("Stopping worker for %s" % self.dev)
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+
+workers = {}
+
+def getWorker(dev):
+    """Get the worker for a device, starting it if needed"""
+    if dev not in workers or workers[dev].proc is None:
+        workers[dev] = Worker(dev)
+    return workers[dev]
+
+def closeWorkers():
+    """Stop all workers"""
+    for w in workers.values():
+        w.close()
+    workers.clear()
+
+atexit.register(closeWorkers)
+
+
+################################################################
+
+class WorkerTransport(Transport):
+    """Send commands by way of the device's worker process"""
+    def __init__(self, dev, worker=None):
+        Transport.__init__(self, dev)
+        if worker is None:
+            worker = getWorker(dev)
+        self.worker = worker
+
+    def result(self, wire):
+        result = resultFromWire(wire)
+        self.last_sense = result.sense
+        return result
+
+    def prOut(self, sa, key=None, sakey=None, prout_type=None):
+        return self.result(self.worker.call("prOut", sa, key, sakey,
+                                            prout_type))
+
+    def prIn(self, sa, alloc_len=PR_IN_ALLOC_LEN):
+        (result, data) = self.worker.call("prIn", sa, alloc_len)
+        return (self.result(result), data and data.decode("hex"))
+
+    def tur(self):
+        return self.result(self.worker.call("tur"))
+
+    def inquirySn(self):
+        sn = self.worker.call("inquirySn")
+        return sn and str(sn)
+
+    def close(self):
+        self.worker.close()
+
+
+class WorkerIoEngine:
+    """Do probe I/O by way of the device's worker process"""
+    def __init__(self, dev, worker=None):
+        self.dev = dev
+        if worker is None:
+            worker = getWorker(dev)
+        self.worker = worker
+
+    def close(self):
+        self.worker.close()
+
+    def read(self, lba=1, nblocks=1):
+        """Read blocks from the device"""
+        return probeFromWire(self.worker.call("read", lba, nblocks))
+
+    def write(self, lba=1, nblocks=1):
+        """Write blocks (of zeros) to the device (destructive!)"""
+        return probeFromWire(self.worker.call("write", lba, nblocks))
+
+    def capacity(self):
+        """How many blocks the device has"""
+        return self.worker.call("capacity")
+
+    def sweep(self, regions, write=False):
+        """Read (or write zeros to) each (lba, nblocks) region"""
+        return [probeFromWire(w) for w in
+                self.worker.call("sweep", list(regions), write)]
+
+
+################################################################
+# the worker process itself
+
+def probeToWire(res):
+    return (res.result, res.errno, res.nbytes, res.elapsed_ns)
+
+def probeFromWire(wire):
+    (result, errno, nbytes, elapsed_ns) = wire
+    res = ProbeResult(errno, nbytes, elapsed_ns)
+    res.result = result
+    return res
+
+def prInToWire(ret):
+    (result, data) = ret
+    return (resultToWire(result), data and data.encode("hex"))
+
+def serve(dev, transport_kind, io_kind, infile, outfile):
+    """Execute requests from infile, writing results to outfile"""
+    transport = makeTransport(dev, transport_kind)
+    io = makeIoEngine(dev, io_kind)
+    ops = {
+        "prOut" : lambda *a: resultToWire(transport.prOut(*a)),
+        "prIn" : lambda *a: prInToWire(transport.prIn(*a)),
+        "tur" : lambda: resultToWire(transport.tur()),
+        "inquirySn" : transport.inquirySn,
+        "read" : lambda *a: probeToWire(io.read(*a)),
+        "write" : lambda *a: probeToWire(io.write(*a)),
+        "capacity" : io.capacity,
+        "sweep" : lambda *a: [probeToWire(r) for r in io.sweep(*a)]}
+    for line in iter(infile.readline, ""):
+        (op, args) = json.loads(line)
+        try:
+            reply = ["ok", ops[op](*args)]
+        except Exception, e:
+            reply = ["error", "%s: %s" % (op, e)]
+        outfile.write(json.dumps(reply) + "\n")
+        outfile.flush()
+    transport.close()
+    io.close()
+
+if __name__ == '__main__':
+    serve(sys.argv[1], sys.argv[2], sys.argv[3], sys.stdin, sys.stdout)
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests what happens when several initiators send
+ conflicting PR OUT commands at the same instant. initA and initB race
+ from separate processes, and initC watches.
+
+ Set PGR_CONTENTION_ROUNDS to change how many times each race is run
+ (the default is 20).
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import unittest
+
+from support import config
+from support.initiator import initA, initB, initC
+from support.reservation import ProutTypes
+from support.setup import set_up_module
+from support.contention import Barrier, ReserveRace, PreemptRace, \
+     RegisterRace, runContention
+
+################################################################
+
+def setUpModule():
+    """Whole-module setup"""
+    set_up_module(initA, initB, initC)
+
+def my_race(race):
+    """Run a race between initA and initB, watched by initC"""
+    report = runContention([initA, initB], race, config.contention_rounds,
+                           observers=[initC])
+    print >>sys.stderr, "\n" + report.format()
+    return report
+
+class BrokenRace(RegisterRace):
+    """A race in which the second contender fails"""
+    def fire(self, init, idx, keys):
+        if idx == 1:
+            raise IOError("contender lost its device")
+        return RegisterRace.fire(self, init, idx, keys)
+
+################################################################
+
+class test01ReserveContentionTestCase(unittest.TestCase):
+    """Test simultaneous RESERVE from two registrants"""
+
+    def testReserveRaceWriteExclusive(self):
+        report = my_race(ReserveRace(ProutTypes["WriteExclusive"]))
+        self.assertEqual(report.problems, [])
+
+    def testReserveRaceExclusiveAccess(self):
+        report = my_race(ReserveRace(ProutTypes["ExclusiveAccess"]))
+        self.assertEqual(report.problems, [])
+
+    def testReserveRaceAllRegistrants(self):
+        report = my_race(
+            ReserveRace(ProutTypes["WriteExclusiveAllRegistrants"]))
+        self.assertEqual(report.problems, [])
+
+################################################################
+
+class test02PreemptContentionTestCase(unittest.TestCase):
+    """Test two registrants preempting each other at once"""
+
+    def testPreemptRace(self):
+        report = my_race(PreemptRace(ProutTypes["WriteExclusive"]))
+        self.assertEqual(report.problems, [])
+
+################################################################
+
+class test03RegisterContentionTestCase(unittest.TestCase):
+    """Test simultaneous REGISTER"""
+
+    def testRegisterRace(self):
+        report = my_race(RegisterRace(ProutTypes["NoType"]))
+        self.assertEqual(report.problems, [])
+
+################################################################
+
+class test04FailedContenderTestCase(unittest.TestCase):
+    """Test that a failing contender ends the run, rather than hanging
+    it"""
+
+    def testContenderFails(self):
+        race = BrokenRace(ProutTypes["NoType"])
+        report = runContention([initA, initB], race, 5, observers=[initC])
+        self.assertEqual(report.rounds, 1)
+        self.assertEqual(report.errors, [0, 1])
+        self.assertTrue("contender lost its device" in report.problems[0])
+
+    def testBarrierTimesOut(self):
+        barrier = Barrier(2)
+        self.assertFalse(barrier.wait(0.1))
+        # and stays broken for everyone else
+        self.assertFalse(barrier.wait())
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests catching commands that hang, using child
+ processes, a fake ioctl layer, and a fake sysfs tree, so it does not
+ need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import config, deadline
+from support.cmd import runCmdWithOutput
+from support.deadline import CommandHung, Watchdog, deviceOf, sessionState
+from testSgIo import makeInitiator
+
+################################################################
+
+DEADLINE = 0.2
+
+class SlowIoctl:
+    """An ioctl layer that takes a while, then answers GOOD"""
+    def __init__(self, secs):
+        self.secs = secs
+        self.timeouts = []
+
+    def __call__(self, fd, req, hdr):
+        self.timeouts.append(hdr.timeout)
+        time.sleep(self.secs)
+        hdr.status = 0
+
+def makeSysfs(root):
+    """A sysfs tree with sdx on iSCSI session7"""
+    def write(path, value):
+        path = os.path.join(root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, "w")
+        f.write(value + "\n")
+        f.close()
+    lun = "devices/platform/host3/session7/target3:0:0/3:0:0:0"
+    write(lun + "/state", "blocked")
+    write("class/iscsi_session/session7/state", "FAILED")
+    write("class/iscsi_session/session7/targetname", "iqn.2003-04.test:t1")
+    write("class/iscsi_session/session7/recovery_tmo", "120")
+    write("class/iscsi_connection/connection7:0/persistent_address",
+          "10.0.0.1")
+    os.makedirs(os.path.join(root, "class/block/sdx"))
+    os.symlink(os.path.join(root, lun),
+               os.path.join(root, "class/block/sdx/device"))
+
+################################################################
+
+class test01DeadlineTestCase(unittest.TestCase):
+    """Test commands past their deadline are cancelled and reported"""
+
+    def setUp(self):
+        self.saved = config.cmd_deadline
+        config.cmd_deadline = DEADLINE
+        del deadline.hangs[:]
+
+    def tearDown(self):
+        config.cmd_deadline = self.saved
+        del deadline.hangs[:]
+
+    def testChildKilled(self):
+        start = time.time()
+        # ($0 is only there to name the device)
+        self.assertRaises(CommandHung, runCmdWithOutput,
+                          ["sh", "-c", "sleep 30", "/dev/sdx"])
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(len(deadline.hangs), 1)
+        self.assertEqual(deadline.hangs[0]["dev"], "/dev/sdx")
+
+    def testQuickChild(self):
+        self.assertEqual(runCmdWithOutput(["true"]).result, 0)
+        self.assertEqual(deadline.hangs, [])
+
+    def testSgIoHung(self):
+        (init, fake) = makeInitiator()
+        init.transport.sg.ioctl = SlowIoctl(DEADLINE + 1.2)
+        self.assertRaises(CommandHung, init.runTur)
+        # the kernel is asked to give up first
+        self.assertTrue(init.transport.sg.ioctl.timeouts[0] <= DEADLINE * 1000)
+        self.assertTrue(deadline.hangs[0]["what"].startswith("SG_IO"))
+
+    def testNoDeadline(self):
+        config.cmd_deadline = 0
+        (init, fake) = makeInitiator()
+        init.transport.sg.ioctl = SlowIoctl(0.3)
+        self.assertEqual(init.runTur(), 0)
+
+    def testStop(self):
+        dog = Watchdog()
+        dog.finish(dog.start(None, "nothing"))
+        thread = dog.thread
+        dog.stop()
+        self.assertFalse(thread.isAlive())
+        # and it starts again when next needed
+        dog.finish(dog.start(None, "nothing"))
+        self.assertTrue(dog.thread.isAlive())
+        dog.stop()
+
+################################################################
+
+class test02DiagnosticsTestCase(unittest.TestCase):
+    """Test gathering diagnostics from sysfs"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        makeSysfs(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def testSessionState(self):
+        state = sessionState("/dev/sdx", self.root)
+        self.assertEqual(state["device"], {"state" : "blocked"})
+        self.assertEqual(state["session"]["name"], "session7")
+        self.assertEqual(state["session"]["state"], "FAILED")
+        self.assertEqual(state["session"]["recovery_tmo"], "120")
+        self.assertEqual(state["connections"][0]["persistent_address"],
+                         "10.0.0.1")
+
+    def testNoSuchDevice(self):
+        self.assertEqual(sessionState("/dev/sdq", self.root), {})
+
+    def testDeviceOf(self):
+        self.assertEqual(deviceOf(["sg_persist", "-n", "--in", "/dev/sdc"]),
+                         "/dev/sdc")
+        self.assertEqual(deviceOf(["dd", "if=/dev/zero", "of=/dev/sdd",
+                                   "bs=512"]), "/dev/sdd")
+        self.assertEqual(deviceOf(["true"]), None)
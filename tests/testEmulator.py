@@ -0,0 +1,250 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the emulated PR target, through the same
+ Initiator interface the other tests use, so it does not need root
+ access or a target. The read and write access it allows is checked
+ against the reservation type table (see matrix).
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import emulator
+from support.emulator import PrTarget, EmulatorTransport, \
+     EmulatorIoEngine, OracleTransport
+from support.fencing import measureFence
+from support.initiator import Initiator
+from support.matrix import Roles, AccessTable, expectedOutcome
+from support.reservation import ProutTypes
+from support.sense import ExitCat
+from support.sgio import PrInSa, PrOutSa
+from testSgIo import makeInitiator
+
+################################################################
+
+def makeEmulated(target, dev, key):
+    return Initiator(dev, key,
+                     transport=EmulatorTransport(dev, target),
+                     io=EmulatorIoEngine(dev, target=target))
+
+def makeTrio(target=None):
+    """initA, initB, and initC, on an emulated target"""
+    if target is None:
+        target = PrTarget()
+    return (target,
+            makeEmulated(target, "/dev/emuA", "0x123abc"),
+            makeEmulated(target, "/dev/emuB", "0x696969"),
+            makeEmulated(target, "/dev/emuC", None))
+
+WE = ProutTypes["WriteExclusive"]
+EA = ProutTypes["ExclusiveAccess"]
+WERO = ProutTypes["WriteExclusiveRegistrantsOnly"]
+EAAR = ProutTypes["ExclusiveAccessAllRegistrants"]
+
+################################################################
+
+class test01RegisterTestCase(unittest.TestCase):
+    """Test registering with the emulated target"""
+
+    def setUp(self):
+        (self.target, self.a, self.b, self.c) = makeTrio()
+
+    def testRegister(self):
+        self.assertEqual(self.a.register(), 0)
+        self.assertEqual(self.b.register(), 0)
+        self.assertEqual(self.c.getRegistrants(), ["0x123abc", "0x696969"])
+        self.assertEqual(self.target.generation, 2)
+
+    def testRegisterTwiceConflicts(self):
+        self.assertEqual(self.a.register(), 0)
+        self.assertEqual(self.a.register(), ExitCat["ResConflict"])
+
+    def testRegisterAndIgnore(self):
+        self.assertEqual(self.a.register(), 0)
+        self.assertEqual(self.a.registerAndIgnore("0x1"), 0)
+        self.assertEqual(self.b.getRegistrants(), ["0x1"])
+
+    def testUnregister(self):
+        self.a.register()
+        self.assertEqual(self.a.unregister(), 0)
+        self.assertEqual(self.a.getRegistrants(), [])
+
+    def testInquirySerialNumber(self):
+        self.assertEqual(self.a.getDiskInquirySn(), self.target.serial)
+
+################################################################
+
+class test02ReserveTestCase(unittest.TestCase):
+    """Test reserving, releasing, and preempting"""
+
+    def setUp(self):
+        (self.target, self.a, self.b, self.c) = makeTrio()
+        self.a.register()
+        self.b.register()
+
+    def testReserve(self):
+        self.assertEqual(self.a.reserve(WE), 0)
+        snap = self.c.snapshot()
+        self.assertEqual(snap.key, "0x123abc")
+        self.assertEqual(snap.getRtypeNum(), WE)
+        self.assertEqual(self.b.reserve(WE), ExitCat["ResConflict"])
+        self.assertEqual(self.c.reserve(WE), ExitCat["ResConflict"])
+
+    def testReserveAgain(self):
+        self.a.reserve(WE)
+        self.assertEqual(self.a.reserve(WE), 0)
+        self.assertEqual(self.a.reserve(EA), ExitCat["ResConflict"])
+
+    def testReleaseWrongType(self):
+        self.a.reserve(WE)
+        self.assertEqual(self.a.release(EA), ExitCat["IllegalRequest"])
+
+    def testReleaseRegistrantsOnly(self):
+        self.a.reserve(WERO)
+        self.assertEqual(self.a.release(WERO), 0)
+        self.assertEqual(self.b.runTur(), ExitCat["UnitAttention"])
+        self.assertEqual(self.b.runTur(), 0)
+        # the reserving nexus is not told
+        self.assertEqual(self.a.runTur(), 0)
+
+    def testAllRegistrants(self):
+        self.assertEqual(self.a.reserve(EAAR), 0)
+        self.assertEqual(self.b.reserve(EAAR), 0)
+        self.assertEqual(self.c.getReservation().key, "0x0")
+        # it stays until the last registrant goes
+        self.a.unregister()
+        self.assertEqual(self.c.getReservation().key, "0x0")
+        self.b.unregister()
+        self.assertEqual(self.c.getReservation().key, None)
+
+    def testHolderUnregisterReleases(self):
+        self.a.reserve(WE)
+        self.a.unregister()
+        self.assertEqual(self.c.getReservation().key, None)
+
+    def testPreempt(self):
+        self.a.reserve(WE)
+        self.assertEqual(self.b.preempt("0x123abc", EA), 0)
+        # the victim is told, then is no longer registered
+        self.assertEqual(self.a.runTur(), ExitCat["UnitAttention"])
+        self.assertEqual(self.a.reserve(WE), ExitCat["ResConflict"])
+        snap = self.c.snapshot()
+        self.assertEqual(snap.registrants, ("0x696969",))
+        self.assertEqual(snap.key, "0x696969")
+        self.assertEqual(snap.getRtypeNum(), EA)
+
+    def testPreemptUnknownKeyConflicts(self):
+        self.assertEqual(self.b.preempt("0x5", WE), ExitCat["ResConflict"])
+
+    def testClear(self):
+        self.a.reserve(WE)
+        self.assertEqual(self.b.clear(), 0)
+        self.assertEqual(self.a.runTur(), ExitCat["UnitAttention"])
+        self.assertEqual(self.c.getRegistrants(), [])
+        self.assertEqual(self.c.getReservation().key, None)
+
+    def testPowerCycle(self):
+        self.a.reserve(WE)
+        self.target.powerCycle()
+        self.assertEqual(self.b.runTur(), ExitCat["UnitAttention"])
+        self.assertEqual(self.c.getRegistrants(), [])
+
+    def testCapabilities(self):
+        (result, data) = self.a.transport.prIn(PrInSa["ReportCapabilities"])
+        self.assertEqual(result, 0)
+        self.assertEqual(len(data), 8)
+
+################################################################
+
+class test03AccessTestCase(unittest.TestCase):
+    """Test the emulated target allows what the type table says"""
+
+    def checkType(self, rtype):
+        (target, a, b, c) = makeTrio()
+        roles = {"holder" : a, "registrant" : b, "nonregistrant" : c}
+        a.register()
+        b.register()
+        self.assertEqual(a.reserve(rtype), 0)
+        for role in Roles:
+            for action in ("read", "write"):
+                init = roles[role]
+                if action == "read":
+                    ret = init.readFromTarget()
+                else:
+                    ret = init.writeToTarget()
+                allowed = expectedOutcome(rtype, role, action)
+                self.assertEqual(ret.result, not allowed and 1 or 0,
+                                 "type %s %s %s" % (rtype, role, action))
+
+    def testAllTypes(self):
+        for rtype in AccessTable:
+            self.checkType(rtype)
+
+    def testData(self):
+        (target, a, b, c) = makeTrio()
+        a.io.buf[:4] = "abcd"
+        self.assertEqual(a.io._transfer(True, 7, 1).result, 0)
+        self.assertEqual(b.io.read(7).result, 0)
+        self.assertEqual(str(b.io.buf[:4]), "abcd")
+
+################################################################
+
+class test04OracleTestCase(unittest.TestCase):
+    """Test comparing a device with the emulator"""
+
+    def setUp(self):
+        del emulator.divergences[:]
+        (self.real, self.fake) = makeInitiator()
+        self.target = PrTarget()
+        self.real.transport = OracleTransport("/dev/fake",
+                                              self.real.transport,
+                                              self.target)
+
+    def testAgrees(self):
+        self.fake.reply()
+        self.assertEqual(self.real.register(), 0)
+        self.assertEqual(emulator.divergences, [])
+        self.assertEqual(self.target.keys, {"/dev/fake" : 0x123abc})
+
+    def testDiffers(self):
+        self.fake.reply(status=0x18)
+        self.assertEqual(self.real.register(), ExitCat["ResConflict"])
+        self.assertEqual(len(emulator.divergences), 1)
+        (dev, what, real, emulated) = emulator.divergences[0]
+        self.assertEqual(what, "PR OUT 0x%x" % PrOutSa["Register"])
+        self.assertEqual((real, emulated), (ExitCat["ResConflict"], 0))
+
+################################################################
+
+class UnfencedTarget(PrTarget):
+    """A target that lets anyone write, whatever the reservation"""
+    def mayAccess(self, nexus, write):
+        return True
+
+
+class test05FencingTestCase(unittest.TestCase):
+    """Test measuring how soon a fenced initiator stops writing"""
+
+    def testFenced(self):
+        (target, a, b, c) = makeTrio()
+        sample = measureFence(b, a, "preempt", WE, window=1)
+        self.assertEqual(sample.result, 0)
+        self.assertTrue(sample.fenced())
+        self.assertEqual(sample.slipped, 0)
+
+    def testNeverFenced(self):
+        (target, a, b, c) = makeTrio(UnfencedTarget())
+        sample = measureFence(b, a, "reserve", EAAR, window=0.05)
+        self.assertEqual(sample.result, 0)
+        self.assertFalse(sample.fenced())
+        self.assertTrue(sample.slipped > 0)
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module measures how soon a fenced initiator stops writing:
+ initB streams writes while initA fences it, by PREEMPT or by
+ RESERVE, with each type of reservation (see support/fencing.py). No
+ write may succeed once the fencing command has completed. The
+ enforcement latency and any writes that slipped through are
+ reported, as percentiles, per reservation type.
+
+ Set PGR_FENCE_REPS to change how many times initB is fenced with
+ each type (the default is 10).
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.initiator import initA, initB, initC
+from support.reservation import ProutTypes
+from support.setup import set_up_module
+from support.fencing import runFencing
+
+################################################################
+
+all_types = [int(ProutTypes[name]) for name in
+             ("WriteExclusive", "ExclusiveAccess",
+              "WriteExclusiveRegistrantsOnly",
+              "ExclusiveAccessRegistrantsOnly",
+              "WriteExclusiveAllRegistrants",
+              "ExclusiveAccessAllRegistrants")]
+
+def setUpModule():
+    """Whole-module setup"""
+    set_up_module(initA, initB, initC)
+
+def my_fencing(method):
+    """initA fences initB, with every type of reservation"""
+    report = runFencing(initB, initA, method, all_types,
+                        inits=[initA, initB, initC])
+    print >>sys.stderr, "\n" + report.format()
+    return report
+
+################################################################
+
+class test01FencingTestCase(unittest.TestCase):
+    """Test how soon a fenced initiator's writes are rejected"""
+
+    def testFenceByPreempt(self):
+        report = my_fencing("preempt")
+        self.assertEqual(report.problems, [])
+
+    def testFenceByReserve(self):
+        report = my_fencing("reserve")
+        self.assertEqual(report.problems, [])
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the declarative PR state set up, using stand-in
+ initiators sharing a simple model of a target, so it does not need
+ root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.fixture import ensurePrState
+from support.reservation import PrSnapshot, ProutTypes, rtypeName
+from testParallel import FakeTransport
+
+################################################################
+
+class FakeTarget:
+    """Just enough PR state to set up tests with"""
+    def __init__(self):
+        self.registrants = []
+        self.key = None
+        self.rtype = None
+        self.generation = 0
+
+class FakeInitiator:
+    """Stands in for an Initiator, counting the commands sent"""
+    def __init__(self, target, key):
+        self.target = target
+        self.key = key
+        self.transport = FakeTransport()
+        self.sent = []
+
+    def snapshot(self):
+        t = self.target
+        rtype = None
+        if t.rtype is not None:
+            rtype = rtypeName(int(t.rtype))
+        return PrSnapshot(t.generation, tuple(t.registrants), t.key, rtype)
+
+    def register(self):
+        self.sent.append("register")
+        if self.key in self.target.registrants:
+            return 24
+        self.target.registrants.append(self.key)
+        return 0
+
+    def unregister(self):
+        self.sent.append("unregister")
+        if self.key not in self.target.registrants:
+            return 24
+        self.target.registrants.remove(self.key)
+        if self.target.key == self.key:
+            self.target.key = self.target.rtype = None
+        return 0
+
+    def reserve(self, rtype):
+        self.sent.append("reserve")
+        self.target.key = self.key
+        if int(rtype) in (7, 8):
+            self.target.key = "0x0"
+        self.target.rtype = rtype
+        return 0
+
+    def release(self, rtype):
+        self.sent.append("release")
+        self.target.key = self.target.rtype = None
+        return 0
+
+    def clear(self):
+        self.sent.append("clear")
+        if self.key not in self.target.registrants:
+            return 24
+        self.target.registrants = []
+        self.target.key = self.target.rtype = None
+        return 0
+
+    def runTur(self):
+        self.sent.append("tur")
+        return 0
+
+    def clearUa(self):
+        return self.runTur()
+
+def prOutSent(inits):
+    return sum([len([c for c in i.sent if c != "tur"]) for i in inits])
+
+################################################################
+
+class test01EnsurePrStateTestCase(unittest.TestCase):
+    """Test setting up PR state with as few commands as needed"""
+
+    def setUp(self):
+        self.target = FakeTarget()
+        self.a = FakeInitiator(self.target, "0x123abc")
+        self.b = FakeInitiator(self.target, "0x696969")
+        self.c = FakeInitiator(self.target, None)
+        self.inits = [self.a, self.b, self.c]
+
+    def testAlreadyThere(self):
+        self.target.registrants = ["0x123abc", "0x696969"]
+        sent = ensurePrState(self.inits, registered=[self.a, self.b])
+        self.assertEqual(sent, [])
+        self.assertEqual(prOutSent(self.inits), 0)
+        self.assertEqual(self.c.sent, [])
+
+    def testOnlyMissingRegistered(self):
+        self.target.registrants = ["0x123abc"]
+        ensurePrState(self.inits, registered=[self.a, self.b])
+        self.assertEqual(self.b.sent, ["register"])
+        self.assertEqual(prOutSent(self.inits), 1)
+
+    def testReleasesUnwantedReservation(self):
+        self.target.registrants = ["0x123abc", "0x696969"]
+        self.target.key = "0x696969"
+        self.target.rtype = ProutTypes["WriteExclusive"]
+        ensurePrState(self.inits, registered=[self.a, self.b])
+        self.assertEqual(self.b.sent[0], "release")
+        self.assertEqual(prOutSent(self.inits), 1)
+        self.assertEqual(self.target.key, None)
+        self.assertTrue("tur" in self.c.sent)
+
+    def testKeepsWantedReservation(self):
+        self.target.registrants = ["0x123abc", "0x696969"]
+        self.target.key = "0x0"
+        self.target.rtype = ProutTypes["ExclusiveAccessAllRegistrants"]
+        ensurePrState(self.inits, registered=[self.a, self.b],
+                      holder=self.a,
+                      rtype=ProutTypes["ExclusiveAccessAllRegistrants"])
+        self.assertEqual(prOutSent(self.inits), 0)
+
+    def testKeepsWantedReservationGivenAsInt(self):
+        self.target.registrants = ["0x123abc", "0x696969"]
+        self.target.key = "0x123abc"
+        self.target.rtype = ProutTypes["WriteExclusive"]
+        ensurePrState(self.inits, registered=[self.a, self.b],
+                      holder=self.a, rtype=int(ProutTypes["WriteExclusive"]))
+        self.assertEqual(prOutSent(self.inits), 0)
+
+    def testUnregistersOne(self):
+        self.target.registrants = ["0x123abc", "0x696969"]
+        ensurePrState(self.inits, registered=[self.a])
+        self.assertEqual(self.target.registrants, ["0x123abc"])
+        self.assertEqual(self.b.sent, ["unregister", "tur"])
+        self.assertEqual(prOutSent(self.inits), 1)
+
+    def testClearsWhenCheaper(self):
+        self.target.registrants = ["0x123abc", "0x696969"]
+        ensurePrState(self.inits)
+        self.assertEqual(self.target.registrants, [])
+        self.assertEqual(prOutSent(self.inits), 1)
+
+    def testForeignKeyNeedsClear(self):
+        self.target.registrants = ["0x1", "0x696969"]
+        ensurePrState(self.inits, registered=[self.a, self.b])
+        self.assertEqual(self.b.sent[0], "clear")
+        self.assertEqual(sorted(self.target.registrants),
+                         ["0x123abc", "0x696969"])
+
+    def testClearWhenNothingOfOursRegistered(self):
+        self.target.registrants = ["0x1"]
+        self.target.key = "0x1"
+        self.target.rtype = ProutTypes["ExclusiveAccess"]
+        ensurePrState(self.inits, registered=[self.a],
+                      holder=self.a, rtype=ProutTypes["WriteExclusive"])
+        self.assertEqual(self.target.registrants, ["0x123abc"])
+        self.assertEqual(self.target.key, "0x123abc")
+        self.assertEqual(self.target.rtype, ProutTypes["WriteExclusive"])
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests Registration and Reservations across every device
+ in PGR_DEVICES (a "fleet" of initiators), e.g. one iSCSI session per
+ cluster node, each with its own generated key. It also reports how
+ the command latency grows with the number of registrants.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.fleet import Fleet, fleetKey, measureScaling, formatScaling
+from support.initiator import Initiator
+from support.reservation import ProutTypes
+from support.setup import set_up_module
+from support.shard import SuiteModules
+
+fleet = Fleet()
+
+################################################################
+
+def setUpModule():
+    """Whole-module setup"""
+    set_up_module(*fleet.members)
+
+def my_fleet_setup():
+    """make sure no one is registered"""
+    fleet.reset()
+
+def fleetTrios(fleet):
+    """Yield (initA, initB, initC) for each ordered pair of members,
+    with the first other member as the unregistered initC"""
+    n = len(fleet)
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                continue
+            k = [x for x in range(n) if x not in (i, j)][0]
+            yield (Initiator(fleet[i].dev, fleetKey(i)),
+                   Initiator(fleet[j].dev, fleetKey(j)),
+                   Initiator(fleet[k].dev, None))
+
+def runSuitesWith(trio):
+    """Run the registration and reservation suites with initA, initB,
+    and initC replaced by the trio, returning their TestResult"""
+    modules = [__import__(name) for name in SuiteModules]
+    saved = [(m, m.initA, m.initB, m.initC) for m in modules]
+    for m in modules:
+        (m.initA, m.initB, m.initC) = trio
+    try:
+        suite = unittest.defaultTestLoader.loadTestsFromNames(SuiteModules)
+        result = unittest.TestResult()
+        suite.run(result)
+    finally:
+        for (m, a, b, c) in saved:
+            (m.initA, m.initB, m.initC) = (a, b, c)
+    return result
+
+################################################################
+
+class test01FleetRegisterTestCase(unittest.TestCase):
+    """Every member can register, and every member sees them all"""
+
+    def setUp(self):
+        my_fleet_setup()
+
+    def testAllCanRegister(self):
+        self.assertEqual(fleet.registerAll(), [0] * len(fleet))
+
+    def testAllSeeAllRegistrants(self):
+        fleet.registerAll()
+        for registrants in fleet.callEach("getRegistrants"):
+            self.assertEqual(sorted(registrants), sorted(fleet.keys()))
+
+    def testResetRemovesOtherKeys(self):
+        # the members' nexuses, registered under other keys
+        others = [Initiator(fleet[0].dev, "0x123abc"),
+                  Initiator(fleet[1].dev, "0x696969")]
+        fleet.reset()
+        self.assertEqual([o.register() for o in others], [0, 0])
+        self.assertEqual(others[1].reserve(
+            ProutTypes["WriteExclusive"]), 0)
+        fleet.reset()
+        for registrants in fleet.callEach("getRegistrants"):
+            self.assertEqual(registrants, [])
+        self.assertEqual(fleet[0].getReservation().key, None)
+
+    def testAllCanUnregister(self):
+        fleet.registerAll()
+        self.assertEqual(fleet.callEach("unregister"), [0] * len(fleet))
+        for registrants in fleet.callEach("getRegistrants"):
+            self.assertEqual(registrants, [])
+
+################################################################
+
+class test02FleetReserveTestCase(unittest.TestCase):
+    """Each member in turn can reserve, and every member agrees"""
+
+    def setUp(self):
+        my_fleet_setup()
+        fleet.registerAll()
+
+    def checkEachCanReserve(self, rtype):
+        for m in fleet:
+            self.assertEqual(m.reserve(rtype), 0)
+            others = [o for o in fleet if o is not m]
+            for res in fleet.callEach("reserve", rtype, members=others):
+                self.assertEqual(res, 24)
+            for snap in fleet.callEach("snapshot"):
+                self.assertEqual(snap.key, m.key)
+                self.assertEqual(snap.getRtypeNum(), rtype)
+            self.assertEqual(m.release(rtype), 0)
+            # releasing a Registrants Only type is a Unit Attention
+            # for the others
+            fleet.callEach("clearUa")
+
+    def testEachCanReserveWriteExclusive(self):
+        self.checkEachCanReserve(ProutTypes["WriteExclusive"])
+
+    def testEachCanReserveExclusiveAccess(self):
+        self.checkEachCanReserve(ProutTypes["ExclusiveAccess"])
+
+    def testEachCanReserveWriteExclusiveRegistrantsOnly(self):
+        self.checkEachCanReserve(
+            ProutTypes["WriteExclusiveRegistrantsOnly"])
+
+    def testEachCanReserveExclusiveAccessRegistrantsOnly(self):
+        self.checkEachCanReserve(
+            ProutTypes["ExclusiveAccessRegistrantsOnly"])
+
+    def testAllRegistrantsHoldReservation(self):
+        for name in ("WriteExclusiveAllRegistrants",
+                     "ExclusiveAccessAllRegistrants"):
+            rtype = ProutTypes[name]
+            self.assertEqual(fleet[0].reserve(rtype), 0)
+            for res in fleet.callEach("reserve", rtype):
+                self.assertEqual(res, 0)
+            for snap in fleet.callEach("snapshot"):
+                self.assertEqual(snap.key, "0x0")
+            self.assertEqual(fleet[-1].release(rtype), 0)
+            fleet.callEach("clearUa")
+
+################################################################
+
+class test03FleetSuitesTestCase(unittest.TestCase):
+    """The registration and reservation suites pass for every pair
+    of members"""
+
+    def setUp(self):
+        if len(fleet) < 3:
+            self.skipTest("needs at least 3 devices")
+
+    def testSuitesPassForEachPair(self):
+        for trio in fleetTrios(fleet):
+            fleet.reset()
+            result = runSuitesWith(trio)
+            problems = result.failures + result.errors
+            self.assertTrue(result.wasSuccessful(), "%s: %s" % (
+                ", ".join([i.dev for i in trio]),
+                "\n".join(["%s\n%s" % (t.id(), tb)
+                           for (t, tb) in problems])))
+        fleet.reset()
+
+################################################################
+
+class test04FleetScalingTestCase(unittest.TestCase):
+    """Report how latency grows with the number of registrants"""
+
+    def testScaling(self):
+        rows = measureScaling(fleet)
+        print >>sys.stderr, "\n" + formatScaling(rows)
+        self.assertEqual(len(rows), len(fleet))
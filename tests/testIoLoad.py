@@ -0,0 +1,173 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the I/O load engine, using a scratch file and an
+ emulated target, so it does not need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import config, emulator
+from support.load import IoLoad, LoadCounters, aioAvailable, runAlongside
+from support.emulator import resetTargets, getTarget
+from support.worker import WorkerError, getWorker, closeWorkers
+from testEmulator import makeTrio, WE
+
+################################################################
+
+INTERVAL = 0.05
+
+class LoadTests:
+    """Tests of a load on a scratch file, mixed in to a TestCase for
+    each load engine, with the I/O engine it uses pinned too"""
+    engine = None
+    io_engine = "direct"
+    # what starting a load on a missing device raises
+    start_errors = (OSError, IOError)
+
+    def setUp(self):
+        self.saved_io_engine = config.io_engine
+        config.io_engine = self.io_engine
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "lun")
+        f = open(self.path, "wb")
+        f.write("\xff" * (4 << 20))
+        f.close()
+
+    def tearDown(self):
+        config.io_engine = self.saved_io_engine
+        shutil.rmtree(self.tmpdir)
+
+    def runLoad(self, secs, **kwargs):
+        load = IoLoad([self.path], interval=INTERVAL, engine=self.engine,
+                      **kwargs)
+        load.start()
+        time.sleep(secs)
+        return load.stop()
+
+    def testReadsAndWrites(self):
+        report = self.runLoad(0.2, depth=4, writes=50)
+        totals = report.totals(self.path)
+        self.assertTrue(totals.reads > 0)
+        self.assertTrue(totals.writes > 0)
+        self.assertEqual(totals.errors(), 0)
+        self.assertEqual(totals.nbytes, totals.ios() * 64 * 1024)
+        # several intervals, and one for the rest
+        self.assertTrue(len(report.samples) >= 3)
+
+    def testWritesZeros(self):
+        self.runLoad(0.1, depth=2, writes=100)
+        f = open(self.path, "rb")
+        data = f.read()
+        f.close()
+        self.assertTrue("\0" * 4096 in data)
+        self.assertEqual(data.replace("\0", "").replace("\xff", ""), "")
+
+    def testNoSuchDevice(self):
+        load = IoLoad([os.path.join(self.tmpdir, "nonesuch")],
+                      engine=self.engine)
+        self.assertRaises(self.start_errors, load.start)
+
+    def testStartFailureStopsOthers(self):
+        load = IoLoad([self.path, os.path.join(self.tmpdir, "nonesuch")],
+                      depth=2, engine=self.engine)
+        self.assertRaises(self.start_errors, load.start)
+        self.assertTrue(load.queues[0].stopping.isSet())
+        for t in load.queues[0].threads:
+            self.assertFalse(t.isAlive())
+
+
+class test01AioLoadTestCase(LoadTests, unittest.TestCase):
+    """Test keeping I/O in flight with native AIO"""
+    engine = "aio"
+
+    def setUp(self):
+        if not aioAvailable():
+            self.skipTest("native AIO cannot be used here")
+        LoadTests.setUp(self)
+
+
+class test02ThreadLoadTestCase(LoadTests, unittest.TestCase):
+    """Test keeping I/O in flight from a pool of threads"""
+    engine = "threads"
+
+################################################################
+
+class test03CountersTestCase(unittest.TestCase):
+    """Test counting what a load does"""
+
+    def testTake(self):
+        c = LoadCounters()
+        c.add(False, 4096, 4096)
+        c.add(True, 0, 4096, 52)
+        c.add(True, 512, 4096)
+        taken = c.take()
+        self.assertEqual((taken.reads, taken.writes, taken.nbytes),
+                         (1, 2, 4096))
+        self.assertEqual((taken.read_errors, taken.write_errors), (0, 2))
+        self.assertEqual(taken.errnos, {52 : 1, 0 : 1})
+        self.assertEqual(c.take().ios(), 0)
+
+    def testEngine(self):
+        self.assertRaises(ValueError, IoLoad, ["/dev/null"], engine="uring")
+
+################################################################
+
+class test04AlongsideTestCase(unittest.TestCase):
+    """Test loading an emulated target while the reservation changes"""
+
+    def setUp(self):
+        self.saved = config.io_engine
+        config.io_engine = "emulator"
+        # other modules' initiators keep using the targets they have
+        self.saved_targets = dict(emulator.targets)
+        resetTargets()
+
+    def tearDown(self):
+        config.io_engine = self.saved
+        resetTargets()
+        emulator.targets.update(self.saved_targets)
+
+    def testWriteExclusive(self):
+        (target, a, b, c) = makeTrio(getTarget())
+        (report, results) = runAlongside([b, c], a, WE, 2, hold=0.02,
+                                         depth=2, interval=INTERVAL,
+                                         engine="auto")
+        self.assertEqual(report.engine, "threads")
+        self.assertEqual([r for r in results if r[1] != 0], [])
+        for init in (b, c):
+            totals = report.totals(init.dev)
+            self.assertEqual(totals.read_errors, 0)
+            self.assertTrue(totals.write_errors > 0)
+            self.assertTrue(totals.write_errors < totals.writes)
+        self.assertTrue("total /dev/emuB" in report.format())
+
+################################################################
+
+class test05WorkerThreadLoadTestCase(LoadTests, unittest.TestCase):
+    """Test keeping I/O in flight from a pool of threads, each with its
+    own worker process"""
+    engine = "threads"
+    io_engine = "worker"
+    start_errors = WorkerError
+
+    def testSharedWorkerKept(self):
+        worker = getWorker(self.path)
+        self.runLoad(0.1, depth=2)
+        self.assertTrue(worker.proc is not None)
+        self.assertEqual(worker.call("capacity"), 1024)
+        closeWorkers()
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests that reservations are enforced on I/O already in
+ flight: initB and initC keep PGR_LOAD_DEPTH reads and writes
+ outstanding (see support/load.py), while initA registers, reserves,
+ releases, and clears. The throughput, IOPS, and errors seen are
+ reported per interval and per initiator.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.initiator import initA, initB, initC
+from support.reservation import ProutTypes
+from support.setup import set_up_module
+from support.fixture import ensurePrState
+from support.load import runAlongside
+
+################################################################
+
+ROUNDS = 3
+
+def setUpModule():
+    """Whole-module setup"""
+    set_up_module(initA, initB, initC)
+
+def my_load(prout_type):
+    """Load initB and initC while initA changes the reservation"""
+    initA.clearUa()
+    (report, results) = runAlongside([initB, initC], initA,
+                                     ProutTypes[prout_type], ROUNDS)
+    print >>sys.stderr, "\n" + report.format()
+    return (report, results)
+
+################################################################
+
+class test01LoadDuringChangesTestCase(unittest.TestCase):
+    """Test reservation changes with I/O in flight from others"""
+
+    def setUp(self):
+        # no one registered
+        ensurePrState([initA, initB, initC])
+
+    def testWriteExclusive(self):
+        (report, results) = my_load("WriteExclusive")
+        self.assertEqual([r for r in results if r[1] != 0], [])
+        for init in (initB, initC):
+            totals = report.totals(init.dev)
+            self.assertTrue(totals.ios() > 0)
+            # reading is never stopped, but writing is while reserved
+            self.assertEqual(totals.read_errors, 0)
+            self.assertTrue(totals.write_errors > 0)
+
+    def testExclusiveAccess(self):
+        (report, results) = my_load("ExclusiveAccess")
+        self.assertEqual([r for r in results if r[1] != 0], [])
+        for init in (initB, initC):
+            totals = report.totals(init.dev)
+            self.assertTrue(totals.read_errors > 0)
+            self.assertTrue(totals.write_errors > 0)
+            # nor is any I/O stopped once released
+            self.assertTrue(totals.errors() < totals.ios())
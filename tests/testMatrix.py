@@ -0,0 +1,44 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests every reservation type in one pass, with the test
+ cases generated from one access table (see support/matrix.py): for
+ each type, what the reservation holder (initA), another registrant
+ (initB), and a non-registrant (initC) can read, write, release, and
+ unregister. It covers the same ground as the testReserve* modules,
+ with far fewer commands.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import unittest
+
+from support.initiator import initA, initB, initC
+from support.matrix import makeMatrixTestCases
+from support.reservation import ProutTypes
+from support.setup import set_up_module
+
+################################################################
+
+def setUpModule():
+    """Whole-module setup"""
+    set_up_module(initA, initB, initC)
+
+################################################################
+
+for (name, type_name) in [("WE", "WriteExclusive"),
+                          ("EA", "ExclusiveAccess"),
+                          ("WERO", "WriteExclusiveRegistrantsOnly"),
+                          ("EARO", "ExclusiveAccessRegistrantsOnly"),
+                          ("WEAR", "WriteExclusiveAllRegistrants"),
+                          ("EAAR", "ExclusiveAccessAllRegistrants")]:
+    for cls in makeMatrixTestCases(name, ProutTypes[type_name],
+                                   initA, initB, initC):
+        globals()[cls.__name__] = cls
+del cls
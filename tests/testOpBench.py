@@ -0,0 +1,120 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the PR operation micro-benchmarks, using stand-in
+ initiators, so it does not need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import time
+import json
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.opbench import benchOps, runOpBench, formatOpBench
+from support.stats import percentile, summarize
+
+################################################################
+
+class FakeInitiator:
+    """Stands in for an Initiator: RESERVE is slow to prepare for
+    (RELEASE), and CLEAR always fails"""
+    def __init__(self, dev, key):
+        self.dev = dev
+        self.key = key
+
+    def register(self):
+        return 0
+
+    def unregister(self):
+        return 0
+
+    def reserve(self, prout_type):
+        return 0
+
+    def release(self, prout_type):
+        time.sleep(0.01)
+        return 0
+
+    def clear(self):
+        return 24
+
+    def getRegistrants(self):
+        return [self.key]
+
+    def getReservation(self):
+        return None
+
+    def getDiskInquirySn(self):
+        return "SN1234"
+
+class FakeFleet(list):
+    def reset(self):
+        pass
+
+def makeFleet():
+    return FakeFleet([FakeInitiator("/dev/fake%d" % i, "0x%x" % (i + 1))
+                      for i in range(2)])
+
+################################################################
+
+class test01StatsTestCase(unittest.TestCase):
+    """Test latency statistics"""
+
+    def testPercentile(self):
+        values = range(1, 101)
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([], 50), None)
+
+    def testSummarize(self):
+        s = summarize([3, 1, 2])
+        self.assertEqual((s["count"], s["min"], s["max"]), (3, 1, 3))
+        self.assertEqual(s["p50"], 2)
+        self.assertEqual(summarize([]), {"count" : 0})
+
+################################################################
+
+class test02OpBenchTestCase(unittest.TestCase):
+    """Test running the PR operation benchmarks"""
+
+    def setUp(self):
+        self.results = runOpBench(makeFleet(), duration=0.02)
+
+    def testAllOpsPerInitiator(self):
+        self.assertEqual(sorted(self.results["ops"].keys()),
+                         sorted(benchOps.keys()))
+        for op in self.results["ops"].values():
+            self.assertEqual(sorted(op["initiators"].keys()), ["0x1", "0x2"])
+            self.assertEqual(op["all"]["count"],
+                             sum([s["count"]
+                                  for s in op["initiators"].values()]))
+
+    def testFailuresCounted(self):
+        ops = self.results["ops"]
+        self.assertEqual(ops["CLEAR"]["all"]["failures"],
+                         ops["CLEAR"]["all"]["count"])
+        self.assertEqual(ops["REGISTER"]["all"]["failures"], 0)
+        self.assertEqual(ops["READ RESERVATION"]["all"]["failures"],
+                         ops["READ RESERVATION"]["all"]["count"])
+
+    def testPreparationNotTimed(self):
+        s = self.results["ops"]["RESERVE"]["all"]
+        self.assertTrue(s["count"] <= 12)
+        self.assertTrue(s["ops_per_sec"] > 1000)
+        self.assertTrue(s["max"] < 5000000)
+
+    def testJsonAndFormat(self):
+        again = json.loads(json.dumps(self.results))
+        self.assertEqual(again["serial"], "SN1234")
+        self.assertEqual(again["devices"], ["/dev/fake0", "/dev/fake1"])
+        self.assertTrue("READ KEYS" in formatOpBench(self.results))
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests issuing commands from several initiators
+ concurrently, using stand-in initiators, so it does not need root
+ access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import time
+import threading
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.parallel import AsyncInitiator, spawn, gather, callEach
+
+################################################################
+
+class FakeTransport:
+    pass
+
+
+class SlowInitiator:
+    """Stands in for an Initiator whose commands take a while"""
+    def __init__(self, name, delay=0.2):
+        self.name = name
+        self.delay = delay
+        self.transport = FakeTransport()
+        self.active = 0
+        self.most_active = 0
+        self.lock = threading.Lock()
+
+    def getDiskInquirySn(self):
+        self.lock.acquire()
+        self.active += 1
+        self.most_active = max(self.most_active, self.active)
+        self.lock.release()
+        time.sleep(self.delay)
+        self.lock.acquire()
+        self.active -= 1
+        self.lock.release()
+        return "SN-" + self.name
+
+    def fail(self):
+        raise ValueError("failed on " + self.name)
+
+################################################################
+
+class test01ParallelTestCase(unittest.TestCase):
+    """Test running initiator commands concurrently"""
+
+    def testCallEachRunsConcurrently(self):
+        inits = [SlowInitiator(n) for n in ("A", "B", "C")]
+        start = time.time()
+        sns = callEach(inits, "getDiskInquirySn")
+        elapsed = time.time() - start
+        self.assertEqual(sns, ["SN-A", "SN-B", "SN-C"])
+        self.assertTrue(elapsed < 0.5)
+
+    def testSameInitiatorIsSerialised(self):
+        init = SlowInitiator("A", delay=0.05)
+        pendings = [AsyncInitiator(init).getDiskInquirySn()
+                    for i in range(4)]
+        self.assertEqual(gather(*pendings), ["SN-A"] * 4)
+        self.assertEqual(init.most_active, 1)
+
+    def testExceptionIsRaisedByResult(self):
+        p = AsyncInitiator(SlowInitiator("A")).fail()
+        self.assertRaises(ValueError, p.result)
+
+    def testSpawn(self):
+        p = spawn(lambda x, y: x + y, 1, y=2)
+        self.assertEqual(p.result(), 3)
+        self.assertTrue(p.done())
+
+    def testLockGoesWithTransport(self):
+        init = SlowInitiator("A")
+        AsyncInitiator(init)
+        self.assertTrue(init.transport in AsyncInitiator.locks)
+        count = len(AsyncInitiator.locks)
+        del init
+        self.assertEqual(len(AsyncInitiator.locks), count - 1)
+
+    def testAttributesPassThrough(self):
+        self.assertEqual(AsyncInitiator(SlowInitiator("A")).name, "A")
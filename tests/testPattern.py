@@ -0,0 +1,237 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests writing self-describing block patterns and
+ verifying them on read-back, using a scratch file and emulated
+ targets, so it does not need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import config, pattern, sweep
+from support.pattern import IntegrityError, makeBlock, checkBlock, \
+     writePattern, verifyPattern
+from support.probe import DirectIoEngine
+from support.emulator import PrTarget
+from testEmulator import makeTrio, WE, EA
+
+################################################################
+
+class LeakyTarget(PrTarget):
+    """A target that rejects writes as it should, but stores them"""
+    def access(self, nexus, write, lba, nblocks, data=None):
+        (ok, got) = PrTarget.access(self, nexus, write, lba, nblocks, data)
+        if write and not ok:
+            self.blocks[lba] = data[:self.block_size]
+        return (ok, got)
+
+
+class LossyTarget(PrTarget):
+    """A target that allows writes, but drops them"""
+    def access(self, nexus, write, lba, nblocks, data=None):
+        if write:
+            return (True, None)
+        return PrTarget.access(self, nexus, write, lba, nblocks, data)
+
+################################################################
+
+class test01BlockTestCase(unittest.TestCase):
+    """Test making and classifying blocks"""
+
+    def setUp(self):
+        self.buf = bytearray(makeBlock(7, 42, 100) + "\0" * 4096)
+
+    def testOk(self):
+        self.assertEqual(checkBlock(self.buf, 0, 100, 7, 42),
+                         (pattern.OK, 7, 42))
+        self.assertEqual(checkBlock(self.buf, 0, 100)[0], pattern.OK)
+
+    def testZeros(self):
+        self.assertEqual(checkBlock(self.buf, 4096, 101)[0], pattern.ZEROS)
+
+    def testOther(self):
+        self.assertEqual(checkBlock(self.buf, 0, 100, 7, 43),
+                         (pattern.OTHER, 7, 42))
+        self.assertEqual(checkBlock(self.buf, 0, 100, 8)[0], pattern.OTHER)
+
+    def testMisplaced(self):
+        self.assertEqual(checkBlock(self.buf, 0, 101)[0], pattern.MISPLACED)
+
+    def testGarbage(self):
+        self.buf[2000] ^= 1
+        self.assertEqual(checkBlock(self.buf, 0, 100)[0], pattern.GARBAGE)
+        self.buf[4100] = 1
+        self.assertEqual(checkBlock(self.buf, 4096, 101)[0], pattern.GARBAGE)
+
+################################################################
+
+class test02ReadBackTestCase(unittest.TestCase):
+    """Test writing patterns to, and verifying them from, a scratch
+    file"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "lun")
+        f = open(self.path, "wb")
+        f.write("\0" * (3 << 20))
+        f.close()
+        self.engine = DirectIoEngine(self.path)
+
+    def tearDown(self):
+        self.engine.close()
+        shutil.rmtree(self.tmpdir)
+
+    def testLarge(self):
+        # more than one chunk, through one buffer
+        results = writePattern(self.engine, 10, 600, 7, 1)
+        self.assertEqual([r.result for r in results], [0, 0, 0])
+        buf = self.engine.buf
+        res = verifyPattern(self.engine, 10, 600, 7, 1)
+        self.assertEqual(res.counts, {pattern.OK : 600})
+        self.assertTrue(self.engine.buf is buf)
+
+    def testFindsDamage(self):
+        writePattern(self.engine, 0, 8, 7, 1)
+        writePattern(self.engine, 3, 1, 7, 2)
+        f = open(self.path, "r+b")
+        f.seek(5 * 4096 + 100)
+        f.write("x")
+        f.close()
+        res = verifyPattern(self.engine, 0, 9, 7, 1)
+        self.assertEqual(res.counts, {pattern.OK : 6, pattern.OTHER : 1,
+                                      pattern.GARBAGE : 1,
+                                      pattern.ZEROS : 1})
+        self.assertEqual([b[:2] for b in res.bad],
+                         [(3, pattern.OTHER), (5, pattern.GARBAGE),
+                          (8, pattern.ZEROS)])
+
+    def testUnread(self):
+        res = verifyPattern(self.engine, 767, 2)
+        self.assertEqual(res.unread, 2)
+
+################################################################
+
+class test03VerifiedWritesTestCase(unittest.TestCase):
+    """Test initiators verifying their writes to emulated targets"""
+
+    def setUp(self):
+        self.saved = config.verify_writes
+        config.verify_writes = True
+
+    def tearDown(self):
+        config.verify_writes = self.saved
+
+    def reserve(self, target, rtype=WE):
+        (target, a, b, c) = makeTrio(target)
+        self.assertEqual(a.register(), 0)
+        self.assertEqual(a.reserve(rtype), 0)
+        return (a, b, c)
+
+    def testGoodTarget(self):
+        (a, b, c) = self.reserve(PrTarget())
+        self.assertEqual(a.writeToTarget().result, 0)
+        self.assertEqual(b.writeToTarget().result, 1)
+        self.assertEqual(a.writeToTarget().result, 0)
+
+    def testRejectedWriteLanded(self):
+        (a, b, c) = self.reserve(LeakyTarget())
+        self.assertRaises(IntegrityError, b.writeToTarget)
+
+    def testAllowedWriteLost(self):
+        (a, b, c) = self.reserve(LossyTarget())
+        self.assertRaises(IntegrityError, a.writeToTarget)
+
+    def testCannotReadBack(self):
+        (a, b, c) = self.reserve(LeakyTarget(), EA)
+        saved = pattern.counts["unverified"]
+        self.assertEqual(b.writeToTarget().result, 1)
+        self.assertEqual(pattern.counts["unverified"], saved + 1)
+
+################################################################
+
+class test04VerifiedSweepTestCase(unittest.TestCase):
+    """Test initiators verifying every region of an access sweep"""
+
+    def setUp(self):
+        self.saved = (config.verify_writes, config.access_sweep)
+        config.verify_writes = True
+        config.access_sweep = True
+
+    def tearDown(self):
+        (config.verify_writes, config.access_sweep) = self.saved
+        sweep.summary.clear()
+        sweep.mixed.clear()
+
+    def reserve(self, target):
+        (target, a, b, c) = makeTrio(target)
+        self.assertEqual(a.register(), 0)
+        self.assertEqual(a.reserve(WE), 0)
+        return (a, b, c)
+
+    def testGoodTarget(self):
+        (a, b, c) = self.reserve(PrTarget())
+        saved = pattern.counts["verified"]
+        self.assertEqual(a.writeToTarget().result, 0)
+        regions = a.sweepRegions()
+        self.assertEqual(pattern.counts["verified"], saved + len(regions))
+        last = regions[-1]
+        res = verifyPattern(a.io, last.lba, last.nblocks, a.pattern_id,
+                            a.write_seq)
+        self.assertEqual(res.counts, {pattern.OK : last.nblocks})
+        self.assertEqual(b.writeToTarget().result, 1)
+
+    def testRejectedWriteLanded(self):
+        (a, b, c) = self.reserve(LeakyTarget())
+        self.assertRaises(IntegrityError, b.writeToTarget)
+
+################################################################
+
+class test05SettingsTestCase(unittest.TestCase):
+    """Test that settings verified writes cannot work with are refused"""
+
+    def loadConfig(self, **settings):
+        """Run config.py with these PGR_* settings, returning whether
+        it was accepted, and its output"""
+        env = dict([(k, v) for (k, v) in os.environ.items()
+                    if not k.startswith("PGR_")])
+        for (name, value) in settings.items():
+            env["PGR_" + name.upper()] = value
+        proc = subprocess.Popen([sys.executable, "-c", "import config"],
+                                cwd=os.path.dirname(config.__file__),
+                                env=env, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        out = proc.communicate()[0]
+        return (proc.returncode == 0, out)
+
+    def testAccepted(self):
+        self.assertEqual(self.loadConfig(verify_writes="1"), (True, ""))
+        self.assertEqual(self.loadConfig(verify_writes="1",
+                                         transport="emulator"), (True, ""))
+
+    def testOtherEngines(self):
+        for engine in ("worker", "dd"):
+            (ok, out) = self.loadConfig(verify_writes="1", io_engine=engine)
+            self.assertFalse(ok)
+            self.assertTrue("PGR_VERIFY_WRITES needs" in out)
+
+    def testTranscripts(self):
+        for setting in ("record", "replay"):
+            (ok, out) = self.loadConfig(verify_writes="1",
+                                        **{setting : "/tmp/transcript"})
+            self.assertFalse(ok)
+        self.assertTrue(self.loadConfig(record="/tmp/transcript")[0])
+
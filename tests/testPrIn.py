@@ -0,0 +1,200 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests decoding PERSISTENT RESERVE IN parameter data,
+ using captured responses, so it does not need root access or a
+ target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import struct
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.prin import DecodeError, decodeReadKeys, \
+     decodeReadReservation, decodeReadFullStatus, transportIdName, \
+     hexDumpToBytes
+from support.transport import Transport
+
+################################################################
+# responses captured with "sg_persist -n --hex ..."
+
+read_keys_dump = [
+    " 00     00 00 00 06 00 00 00 10  00 00 00 00 00 12 3a bc   ..............:.",
+    " 10     00 00 00 00 00 69 69 69                            .....iii",
+    ]
+
+read_no_keys_dump = [
+    " 00     00 00 00 08 00 00 00 00                            ........",
+    ]
+
+read_reservation_dump = [
+    " 00     00 00 00 07 00 00 00 10  00 00 00 00 00 12 3a bc   ..............:.",
+    " 10     00 00 00 00 00 03 00 00                            ........",
+    ]
+
+read_full_status_dump = [
+    " 00     00 00 00 0c 00 00 00 80  00 00 00 00 00 12 3a bc   ..............:.",
+    " 10     00 00 00 00 01 03 00 00  00 00 00 01 00 00 00 28   ...............(",
+    " 20     05 00 00 24 69 71 6e 2e  32 30 30 33 2d 30 34 2e   ...$iqn.2003-04.",
+    " 30     6e 65 74 2e 67 6f 6e 7a  6f 6c 65 65 6d 61 6e 3a   net.gonzoleeman:",
+    " 40     74 65 73 74 31 31 00 00  00 00 00 00 00 69 69 69   test11.......iii",
+    " 50     00 00 00 00 00 00 00 00  00 00 00 01 00 00 00 28   ...............(",
+    " 60     05 00 00 24 69 71 6e 2e  32 30 30 33 2d 30 34 2e   ...$iqn.2003-04.",
+    " 70     6e 65 74 2e 67 6f 6e 7a  6f 6c 65 65 6d 61 6e 3a   net.gonzoleeman:",
+    " 80     74 65 73 74 31 32 00 00                            test12..",
+    ]
+
+def manyKeys(n):
+    """READ KEYS data with n registrants"""
+    return struct.pack(">II%dQ" % n, 1, n * 8, *range(1, n + 1))
+
+def manyStatusDescriptors(n):
+    """READ FULL STATUS data with n registrants (and no TransportIDs)"""
+    descs = "".join([struct.pack(">Q4xBB4xHI", k, 0, 0, 1, 0)
+                     for k in range(1, n + 1)])
+    return struct.pack(">II", 1, len(descs)) + descs
+
+################################################################
+
+class test01HexDumpTestCase(unittest.TestCase):
+    """Test converting sg_persist hex dumps back to bytes"""
+
+    def testReadKeysDump(self):
+        data = hexDumpToBytes(read_keys_dump)
+        self.assertEqual(len(data), 24)
+        self.assertEqual(data[-3:], "iii")
+
+    def testAsciiNotMistakenForData(self):
+        # the last line's ASCII would otherwise look like data
+        data = hexDumpToBytes([
+            " 00     00 00 00 01 00 00 00 0a  00 00 00 00 00 00 00 00   ................",
+            " 10     41 42                                              AB"])
+        self.assertEqual(len(data), 18)
+        self.assertEqual(data[-2:], "AB")
+
+    def testIgnoresOtherLines(self):
+        data = hexDumpToBytes(["PR in (Read keys):"] + read_keys_dump)
+        self.assertEqual(len(data), 24)
+
+################################################################
+
+class test02ReadKeysTestCase(unittest.TestCase):
+    """Test decoding READ KEYS data"""
+
+    def testReadKeys(self):
+        rk = decodeReadKeys(hexDumpToBytes(read_keys_dump))
+        self.assertEqual(rk.generation, 6)
+        self.assertEqual(rk.keys, (0x123abc, 0x696969))
+        self.assertEqual(rk.needed, 24)
+
+    def testReadNoKeys(self):
+        rk = decodeReadKeys(hexDumpToBytes(read_no_keys_dump))
+        self.assertEqual(rk.generation, 8)
+        self.assertEqual(rk.keys, ())
+
+    def testTruncated(self):
+        rk = decodeReadKeys(manyKeys(10)[:8 + 3 * 8 + 4])
+        self.assertEqual(rk.keys, (1, 2, 3))
+        self.assertEqual(rk.needed, 8 + 10 * 8)
+
+    def testThousandsOfKeys(self):
+        rk = decodeReadKeys(manyKeys(8000))
+        self.assertEqual(len(rk.keys), 8000)
+        self.assertEqual(rk.keys[-1], 8000)
+
+    def testTooShort(self):
+        self.assertRaises(DecodeError, decodeReadKeys, "\0\0\0")
+
+################################################################
+
+class test03ReadReservationTestCase(unittest.TestCase):
+    """Test decoding READ RESERVATION data"""
+
+    def testReadReservation(self):
+        rr = decodeReadReservation(hexDumpToBytes(read_reservation_dump))
+        self.assertEqual(rr.generation, 7)
+        self.assertEqual(rr.key, 0x123abc)
+        self.assertEqual(rr.scope, 0)
+        self.assertEqual(rr.rtype, 3)
+
+    def testReadNoReservation(self):
+        rr = decodeReadReservation(hexDumpToBytes(read_no_keys_dump))
+        self.assertEqual(rr.generation, 8)
+        self.assertEqual(rr.key, None)
+        self.assertEqual(rr.rtype, None)
+
+################################################################
+
+class test04ReadFullStatusTestCase(unittest.TestCase):
+    """Test decoding READ FULL STATUS data"""
+
+    def testReadFullStatus(self):
+        fs = decodeReadFullStatus(hexDumpToBytes(read_full_status_dump))
+        self.assertEqual(fs.generation, 0xc)
+        self.assertEqual(len(fs.descriptors), 2)
+        (a, b) = fs.descriptors
+        self.assertEqual(a.key, 0x123abc)
+        self.assertTrue(a.r_holder)
+        self.assertFalse(a.all_tg_pt)
+        self.assertEqual(a.rtype, 3)
+        self.assertEqual(a.rel_tgt_port, 1)
+        self.assertEqual(transportIdName(a.transport_id),
+                         "iqn.2003-04.net.gonzoleeman:test11")
+        self.assertEqual(b.key, 0x696969)
+        self.assertFalse(b.r_holder)
+        self.assertEqual(transportIdName(b.transport_id),
+                         "iqn.2003-04.net.gonzoleeman:test12")
+
+    def testTransportIdIsNotCopied(self):
+        fs = decodeReadFullStatus(hexDumpToBytes(read_full_status_dump))
+        self.assertTrue(isinstance(fs.descriptors[0].transport_id,
+                                   memoryview))
+
+    def testTruncatedDescriptor(self):
+        data = hexDumpToBytes(read_full_status_dump)
+        fs = decodeReadFullStatus(data[:-8])
+        self.assertEqual(len(fs.descriptors), 1)
+        self.assertEqual(fs.needed, len(data))
+
+    def testThousandsOfDescriptors(self):
+        fs = decodeReadFullStatus(manyStatusDescriptors(5000))
+        self.assertEqual(len(fs.descriptors), 5000)
+        self.assertEqual(fs.descriptors[-1].key, 5000)
+
+################################################################
+
+class CannedTransport(Transport):
+    """Returns canned PR IN data, truncated to the allocation length"""
+    def __init__(self, data):
+        Transport.__init__(self, "/dev/canned")
+        self.data = data
+        self.alloc_lens = []
+
+    def prIn(self, sa, alloc_len=0):
+        self.alloc_lens.append(alloc_len)
+        return (0, self.data[:alloc_len])
+
+class test05ReadPrInTestCase(unittest.TestCase):
+    """Test reissuing PR IN when the data is truncated"""
+
+    def testReissuesWithLargerAllocLen(self):
+        trans = CannedTransport(manyKeys(2000))
+        (result, rk) = trans.readKeys()
+        self.assertEqual(result, 0)
+        self.assertEqual(len(rk.keys), 2000)
+        self.assertEqual(trans.alloc_lens, [8192, 8 + 2000 * 8])
+
+    def testGivesUpAtMaxAllocLen(self):
+        trans = CannedTransport(manyKeys(9000))
+        (result, rk) = trans.readKeys()
+        self.assertEqual(result, 0)
+        self.assertEqual(len(rk.keys), (0xffff - 8) // 8)
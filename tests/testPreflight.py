@@ -0,0 +1,88 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests that the module setup (preflight) checks run once
+ per session, and are remembered in the cache file, using stand-in
+ initiators and scratch files, so it needs no target (but does need
+ root access, like the real setup).
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import config
+from support import setup
+from support.setup import set_up_module, preflightFingerprint
+from testParallel import FakeTransport
+
+################################################################
+
+class FakeInitiator:
+    """Stands in for an Initiator, counting INQUIRY commands"""
+    def __init__(self, dev):
+        self.dev = dev
+        self.transport = FakeTransport()
+        self.inquiries = 0
+
+    def getDiskInquirySn(self):
+        self.inquiries += 1
+        return "SN1234"
+
+################################################################
+
+@unittest.skipIf(os.geteuid() != 0, "needs root access")
+class test01PreflightTestCase(unittest.TestCase):
+    """Test running the preflight checks once"""
+
+    def setUp(self):
+        (fd, self.dev) = tempfile.mkstemp()
+        os.close(fd)
+        self.cache = self.dev + ".cache"
+        self.inits = [FakeInitiator(self.dev), FakeInitiator(self.dev)]
+        self.saved = (config.preflight_cache, dict(setup.preflight_done))
+        setup.preflight_done.clear()
+
+    def tearDown(self):
+        (config.preflight_cache, done) = self.saved
+        setup.preflight_done.clear()
+        setup.preflight_done.update(done)
+        for path in (self.dev, self.cache):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def inquiries(self):
+        return sum([i.inquiries for i in self.inits])
+
+    def testOncePerSession(self):
+        config.preflight_cache = ""
+        set_up_module(*self.inits)
+        set_up_module(*self.inits)
+        self.assertEqual(self.inquiries(), 2)
+        self.assertFalse(os.path.exists(self.cache))
+
+    def testCachedAcrossSessions(self):
+        config.preflight_cache = self.cache
+        set_up_module(*self.inits)
+        self.assertEqual(self.inquiries(), 2)
+        setup.preflight_done.clear()
+        set_up_module(*self.inits)
+        self.assertEqual(self.inquiries(), 2)
+
+    def testFingerprintFollowsDevice(self):
+        before = preflightFingerprint(self.inits)
+        self.assertEqual(before, preflightFingerprint(self.inits))
+        self.inits[1].dev = "/dev/null"
+        self.assertNotEqual(before, preflightFingerprint(self.inits))
+        self.inits[1].dev = self.dev + ".missing"
+        self.assertEqual(preflightFingerprint(self.inits), None)
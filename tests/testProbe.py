@@ -0,0 +1,109 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the in-process direct I/O probe engine (and the dd
+ one), using a scratch file in place of the target, so it does not
+ need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import errno
+import shutil
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.probe import DirectIoEngine, DdIoEngine, ProbeResult
+
+################################################################
+
+class test01DirectIoTestCase(unittest.TestCase):
+    """Test probing with O_DIRECT I/O"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "lun")
+        f = open(self.path, "wb")
+        f.write("\xff" * 4 * 4096)
+        f.close()
+        self.engine = DirectIoEngine(self.path)
+
+    def tearDown(self):
+        self.engine.close()
+        shutil.rmtree(self.tmpdir)
+
+    def testCanRead(self):
+        ret = self.engine.read()
+        self.assertEqual(ret.result, 0)
+        self.assertEqual(ret.errno, 0)
+        self.assertEqual(ret.nbytes, 4096)
+        self.assertTrue(ret.elapsed_ns >= 0)
+        self.assertEqual(self.engine.buf[:4096], "\xff" * 4096)
+
+    def testCanWrite(self):
+        ret = self.engine.write()
+        self.assertEqual(ret.result, 0)
+        self.assertEqual(ret.nbytes, 4096)
+        f = open(self.path, "rb")
+        data = f.read()
+        f.close()
+        self.assertEqual(data[:4096], "\xff" * 4096)
+        self.assertEqual(data[4096:8192], "\0" * 4096)
+
+    def testReusesDescriptor(self):
+        self.engine.read()
+        fd = self.engine.fd
+        self.engine.write()
+        self.assertEqual(self.engine.fd, fd)
+
+    def testShortReadFails(self):
+        ret = self.engine.read(lba=4)
+        self.assertEqual(ret.result, 1)
+        self.assertEqual(ret.nbytes, 0)
+
+    def testOpenFailureFails(self):
+        engine = DirectIoEngine(os.path.join(self.tmpdir, "nonesuch"))
+        ret = engine.read()
+        self.assertEqual(ret.result, 1)
+        self.assertEqual(ret.errno, errno.ENOENT)
+
+    def testConflictStatus(self):
+        self.assertTrue(ProbeResult(errno=errno.EBADE).isConflict())
+        self.assertEqual(ProbeResult().status, 0)
+        self.assertEqual(ProbeResult(errno=errno.EIO).status, None)
+        self.assertTrue(ProbeResult(errno=errno.ETIMEDOUT).isTimeout())
+
+################################################################
+
+class test02DdTestCase(unittest.TestCase):
+    """Test probing by running dd"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "lun")
+        f = open(self.path, "wb")
+        f.write("\xff" * 4 * 4096)
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testCanRead(self):
+        ret = DdIoEngine(self.path).read()
+        self.assertEqual(ret.result, 0)
+        self.assertEqual(ret.nbytes, 4096)
+
+    def testErrnoFromMessage(self):
+        ret = DdIoEngine(os.path.join(self.tmpdir, "nonesuch")).read()
+        self.assertEqual(ret.result, 1)
+        self.assertEqual(ret.errno, errno.ENOENT)
+        self.assertTrue(ret.elapsed_ns > 0)
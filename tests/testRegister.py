@@ -18,6 +18,7 @@ if sys.version_info < (2, 7):
 else:
     import unittest
 
+from support.fixture import ensurePrState
 from support.initiator import initA, initB, initC
 from support.setup import set_up_module
 
@@ -31,11 +32,7 @@ def setUpModule():
 
 def my_reg_setup():
     """make sure we are all setup to test reservations"""
-    if initA.unregister() != 0:
-        initA.unregister()
-    if initB.unregister() != 0:
-        initB.unregister()
-    initC.runTur()
+    ensurePrState([initA, initB, initC])
 
 ################################################################
 
@@ -12,12 +12,13 @@ __author__ = "Lee Duncan <leeman.duncan@gmail.com>"
 
 import sys
 import os
-import time
 import unittest
 
+from support.fixture import ensurePrState
 from support.initiator import initA, initB, initC
 from support.reservation import ProutTypes
 from support.setup import set_up_module
+from support.visibility import waitForReservation, waitForNoReservation
 
 my_rtype = ProutTypes["ExclusiveAccess"]
 
@@ -31,13 +32,7 @@ def setUpModule():
 
 def my_resvn_setup():
     """make sure we are all setup to test reservations"""
-    initA.clear()
-    initA.runTur()
-    initB.clear()
-    initB.runTur()
-    initA.register()
-    initB.register()
-    initC.runTur()
+    ensurePrState([initA, initB, initC], registered=[initA, initB])
 
 ################################################################
 
@@ -83,25 +78,25 @@ class test03CanReleaseReservationTestCase(unittest.TestCase):
     def setUp(self):
         my_resvn_setup()
         initA.reserve(my_rtype)
-        time.sleep(2)                   # give I/O time to sync up
+        waitForReservation([initA, initB, initC], initA.key, my_rtype)
 
     def testCanReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
     
     def testCannotReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
 
@@ -116,25 +111,27 @@ class test04UnregisterHandlingTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testUnregisterReleasesReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.unregister()
         self.assertEqual(res, 0)
-        time.sleep(1)                   # for stgt
-        resvnA = initA.getReservation()
+        waitForNoReservation([initA, initB, initC])
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
+        self.assertFalse(resvnA.isRegistered(initA.key))
 
     def testUnregisterDoesNotReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
+        self.assertFalse(resvnA.isRegistered(initB.key))
 
 ################################################################
 
@@ -145,10 +142,10 @@ class test05ReservationAccessTestCase(unittest.TestCase):
     def setUp(self):
         my_resvn_setup()
         initA.reserve(my_rtype)
-        time.sleep(2)                   # give I/O time to sync up
+        waitForReservation([initA, initB, initC], initA.key, my_rtype)
 
     def testReservationHolderHasReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA read from disk to /dev/null
@@ -156,7 +153,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
         
     def testReservationHolderHasWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA can write from /dev/zero to 2nd 512-byte block on disc
@@ -165,36 +162,40 @@ class test05ReservationAccessTestCase(unittest.TestCase):
     
     def testNonReservationHolderDoesNotHaveReadAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't read from disk to /dev/null
         ret = initB.readFromTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
 
     def testNonReservationHolderDoesNotHaveWriteAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't write from /dev/zero to 2nd 512-byte block on disc
         ret = initB.writeToTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
 
     def testNonRegistrantDoesNotHaveReadAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't read from disk to /dev/null
         ret = initC.readFromTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
 
     def testNonRegistrantDoesNotHaveWriteAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't write from /dev/zero to 2nd 512-byte block on disc
         ret = initC.writeToTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
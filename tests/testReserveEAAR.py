@@ -14,6 +14,7 @@ import sys
 import os
 import unittest
 
+from support.fixture import ensurePrState
 from support.initiator import initA, initB, initC
 from support.reservation import ProutTypes
 from support.setup import set_up_module
@@ -31,13 +32,7 @@ def setUpModule():
 
 def my_resvn_setup():
     """make sure we are all setup to test reservations"""
-    initA.clear()
-    initA.runTur()
-    initB.clear()
-    initB.runTur()
-    initA.register()
-    initB.register()
-    initC.runTur()
+    ensurePrState([initA, initB, initC], registered=[initA, initB])
 
 ################################################################
 
@@ -85,22 +80,22 @@ class test03CanReleaseReservationTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testMainHolderCanReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
     
     def testAltHolderCanReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
 
@@ -115,36 +110,40 @@ class test04UnregisterHandlingTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testMainHolderUnregisterDoesNotReleasesReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
+        self.assertFalse(resvnA.isRegistered(initA.key))
 
     def testAltHolderUnregisterDoesNotReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
+        self.assertFalse(resvnA.isRegistered(initB.key))
 
     def testAllUnregisterReleasesReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.unregister()
         self.assertEqual(res, 0)
         res = initB.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
+        self.assertFalse(resvnA.isRegistered(initA.key))
+        self.assertFalse(resvnA.isRegistered(initB.key))
 
 ################################################################
 
@@ -157,7 +156,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testReservationHolderHasReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA read from disk to /dev/null
@@ -165,7 +164,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
         
     def testReservationHolderHasWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA can write from /dev/zero to 2nd 512-byte block on disc
@@ -174,7 +173,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
     
     def testAltReservationHolderDoesHaveReadAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't read from disk to /dev/null
@@ -183,7 +182,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
 
     def testAltReservationHolderDoesHaveWriteAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't write from /dev/zero to 2nd 512-byte block on disc
@@ -192,18 +191,20 @@ class test05ReservationAccessTestCase(unittest.TestCase):
 
     def testNonRegistrantDoesNotHaveReadAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't read from disk to /dev/null
         ret = initC.readFromTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
 
     def testNonRegistrantDoesNotHaveWriteAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't write from /dev/zero to 2nd 512-byte block on disc
         ret = initC.writeToTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
@@ -17,12 +17,13 @@ __author__ = "Lee Duncan <leeman.duncan@gmail.com>"
 
 import sys
 import os
-import time
 import unittest
 
+from support.fixture import ensurePrState
 from support.initiator import initA, initB, initC
 from support.reservation import ProutTypes
 from support.setup import set_up_module
+from support.visibility import waitForReservation
 
 my_rtype = ProutTypes["ExclusiveAccessRegistrantsOnly"]
 
@@ -36,13 +37,7 @@ def setUpModule():
 
 def my_resvn_setup():
     """make sure we are all setup to test reservations"""
-    initA.clear()
-    initA.runTur()
-    initB.clear()
-    initB.runTur()
-    initA.register()
-    initB.register()
-    initC.runTur()
+    ensurePrState([initA, initB, initC], registered=[initA, initB])
 
 ################################################################
 
@@ -88,25 +83,25 @@ class test03CanReleaseReservationTestCase(unittest.TestCase):
     def setUp(self):
         my_resvn_setup()
         initA.reserve(my_rtype)
-        time.sleep(2)                   # give I/O time to sync up
+        waitForReservation([initA, initB, initC], initA.key, my_rtype)
 
     def testCanReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
     
     def testCannotReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
 
@@ -121,24 +116,26 @@ class test04UnregisterHandlingTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testUnregisterReleasesReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
+        self.assertFalse(resvnA.isRegistered(initA.key))
 
     def testUnregisterDoesNotReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
+        self.assertFalse(resvnA.isRegistered(initB.key))
 
 ################################################################
 
@@ -149,10 +146,10 @@ class test05ReservationAccessTestCase(unittest.TestCase):
     def setUp(self):
         my_resvn_setup()
         initA.reserve(my_rtype)
-        time.sleep(2)                   # give I/O time to sync up
+        waitForReservation([initA, initB, initC], initA.key, my_rtype)
 
     def testReservationHolderHasReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA read from disk to /dev/null
@@ -160,7 +157,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
         
     def testReservationHolderHasWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA can write from /dev/zero to 2nd 512-byte block on disc
@@ -169,7 +166,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
     
     def testAltReservationHolderDoesHaveReadAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't read from disk to /dev/null
@@ -178,7 +175,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
 
     def testAltReservationHolderDoesHaveWriteAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't write from /dev/zero to 2nd 512-byte block on disc
@@ -187,18 +184,20 @@ class test05ReservationAccessTestCase(unittest.TestCase):
 
     def testNonRegistrantDoesNotHaveReadAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't read from disk to /dev/null
         ret = initC.readFromTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
 
     def testNonRegistrantDoesNotHaveWriteAccess(self):
         # initA get reservation
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't write from /dev/zero to 2nd 512-byte block on disc
         ret = initC.writeToTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
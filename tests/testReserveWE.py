@@ -17,12 +17,13 @@ __author__ = "Lee Duncan <leeman.duncan@gmail.com>"
 
 import sys
 import os
-import time
 import unittest
 
+from support.fixture import ensurePrState
 from support.initiator import initA, initB, initC
 from support.reservation import ProutTypes
 from support.setup import set_up_module
+from support.visibility import waitForReservation
 
 my_rtype = ProutTypes["WriteExclusive"]
 
@@ -36,13 +37,7 @@ def setUpModule():
 
 def my_resvn_setup():
     """make sure we are all setup to test reservations"""
-    initA.clear()
-    initA.runTur()
-    initB.clear()
-    initB.runTur()
-    initA.register()
-    initB.register()
-    initC.runTur()
+    ensurePrState([initA, initB, initC], registered=[initA, initB])
 
 ################################################################
 
@@ -90,23 +85,23 @@ class test03CanReleaseReservationTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testReservationHolderCanReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.release(my_rtype)
         self.assertEqual(res, 0)
-        initA.runTur()
-        resvnA = initA.getReservation()
+        initA.clearUa()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
 
     def testNonReservationHolderCannotReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
 
@@ -121,24 +116,26 @@ class test04UnregisterHandlingTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testReservationHolderUnregisterReleasesReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
+        self.assertFalse(resvnA.isRegistered(initA.key))
 
     def testNonReservationHolderUnregisterDoesNotReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
+        self.assertFalse(resvnA.isRegistered(initB.key))
 
 ################################################################
 
@@ -149,10 +146,10 @@ class test05ReservationAccessTestCase(unittest.TestCase):
     def setUp(self):
         my_resvn_setup()
         initA.reserve(my_rtype)
-        time.sleep(2)                   # give I/O time to sync up
+        waitForReservation([initA, initB, initC], initA.key, my_rtype)
 
     def testReservationHolderHasReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA read from disk to /dev/null
@@ -160,7 +157,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
 
     def testReservationHolderHasWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA write from /dev/zero to 2nd 512-byte block on disc
@@ -168,7 +165,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
     
     def testNonReservationHolderDoesHaveReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can read from disk to /dev/null
@@ -176,15 +173,16 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
         
     def testNonReservationHolderDoesNotHaveWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't write from /dev/zero to 2nd 512-byte block on disc
         ret = initB.writeToTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
 
     def testNonRegistrantDoesHaveReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can read from disk to /dev/null
@@ -192,9 +190,10 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
         
     def testNonRegistrantDoesNotHaveWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, initA.key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't write from /dev/zero to 2nd 512-byte block on disc
         ret = initC.writeToTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
@@ -14,6 +14,7 @@ import sys
 import os
 import unittest
 
+from support.fixture import ensurePrState
 from support.initiator import initA, initB, initC
 from support.reservation import ProutTypes
 from support.setup import set_up_module
@@ -31,15 +32,7 @@ def setUpModule():
 
 def my_resvn_setup():
     """make sure we are all setup to test reservations"""
-    initA.clear()
-    if initA.runTur() == 6:
-        initA.runTur()
-    initB.clear()
-    if initB.runTur() == 6:
-        initB.runTur()
-    initA.register()
-    initB.register()
-    initC.runTur()
+    ensurePrState([initA, initB, initC], registered=[initA, initB])
 
 ################################################################
 
@@ -87,23 +80,23 @@ class test03CanReleaseReservationTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testMainReservationHolderCanReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.release(my_rtype)
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
 
     def testAltReservationHolderCanReleaseReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.release(my_rtype)
         self.assertEqual(res, 0)
-        initA.runTur()                  # alt release causes UA for devA
-        resvnA = initA.getReservation()
+        initA.clearUa()                 # alt release causes UA for devA
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
 
@@ -118,36 +111,40 @@ class test04UnregisterHandlingTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testMainReservationHolderUnregisterDoesNotReleasReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
+        self.assertFalse(resvnA.isRegistered(initA.key))
 
     def testAltReservationHolderUnregisterDoesNotReleasReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initB.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
+        self.assertFalse(resvnA.isRegistered(initB.key))
 
     def testAllUnregisterReleasesReservation(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         res = initA.unregister()
         self.assertEqual(res, 0)
         res = initB.unregister()
         self.assertEqual(res, 0)
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, None)
         self.assertEqual(resvnA.rtype, None)
+        self.assertFalse(resvnA.isRegistered(initA.key))
+        self.assertFalse(resvnA.isRegistered(initB.key))
 
 ################################################################
 
@@ -160,7 +157,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         initA.reserve(my_rtype)
 
     def testMainReservationHolderHasReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA read from disk to /dev/null
@@ -168,7 +165,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
 
     def testMainReservationHolderHasWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initA write from /dev/zero to 2nd 512-byte block on disc
@@ -176,7 +173,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
     
     def testAltReservationHolderDoesHaveReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can read from disk to /dev/null
@@ -184,7 +181,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
         
     def testAltReservationHolderDoesHaveWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initB can't write from /dev/zero to 2nd 512-byte block on disc
@@ -192,7 +189,7 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
 
     def testNonRegistrantDoesHaveReadAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can read from disk to /dev/null
@@ -200,9 +197,10 @@ class test05ReservationAccessTestCase(unittest.TestCase):
         self.assertEqual(ret.result, 0)
         
     def testNonRegistrantDoesNotHaveWriteAccess(self):
-        resvnA = initA.getReservation()
+        resvnA = initA.snapshot()
         self.assertEqual(resvnA.key, ar_key)
         self.assertEqual(resvnA.getRtypeNum(), my_rtype)
         # initC can't write from /dev/zero to 2nd 512-byte block on disc
         ret = initC.writeToTarget()
         self.assertEqual(ret.result, 1)
+        self.assertTrue(ret.isConflict())
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the retry policy, against a fake ioctl layer, so
+ it does not need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import retry
+from support.retry import RetryPolicy, parsePolicy
+from support.sense import ExitCat, CmdResult, Sense, SenseKeys
+from testSgIo import makeInitiator, fixedSense
+
+################################################################
+
+class test01PolicyTestCase(unittest.TestCase):
+    """Test classifying failures, and the backoff for each"""
+
+    def setUp(self):
+        self.policy = RetryPolicy()
+
+    def testClassifyBySense(self):
+        cls = self.policy.classify(ExitCat["NotReady"],
+                                   Sense(SenseKeys["NotReady"], 0x04, 0x01))
+        self.assertEqual(cls.name, "not-ready")
+        # not ready, but not becoming ready
+        self.assertEqual(self.policy.classify(
+            ExitCat["NotReady"], Sense(SenseKeys["NotReady"], 0x3a, 0)),
+                         None)
+
+    def testClassifyByCarriedSense(self):
+        # the sense data the result itself carries
+        res = CmdResult(ExitCat["NotReady"], 0x2,
+                        Sense(SenseKeys["NotReady"], 0x04, 0x0a))
+        self.assertEqual(self.policy.classify(res).name, "not-ready")
+        res = CmdResult(ExitCat["NotReady"], 0x2,
+                        Sense(SenseKeys["NotReady"], 0x3a, 0))
+        self.assertEqual(self.policy.classify(res), None)
+
+    def testClassifyByResult(self):
+        self.assertEqual(self.policy.classify(ExitCat["Busy"]).name, "busy")
+        self.assertEqual(self.policy.classify(ExitCat["UnitAttention"]).name,
+                         "unit-attention")
+
+    def testNeverRetried(self):
+        for result in (ExitCat["Clean"], ExitCat["ResConflict"],
+                       ExitCat["IllegalRequest"], ExitCat["Other"]):
+            self.assertEqual(self.policy.delay(result, None, 0), None)
+
+    def testBackoff(self):
+        delays = [self.policy.delay(ExitCat["Busy"], None, n)
+                  for n in range(6)]
+        self.assertEqual(delays, [0.001, 0.002, 0.004, 0.008, 0.016, None])
+        delays = [self.policy.delay(ExitCat["NotReady"],
+                                    Sense(SenseKeys["NotReady"], 4, 1), n)
+                  for n in range(5)]
+        self.assertEqual(delays[-1], 0.16)
+
+    def testCapped(self):
+        policy = parsePolicy("busy=20:1:50")
+        self.assertEqual(policy.delay(ExitCat["Busy"], None, 10), 0.05)
+
+    def testNotIdempotent(self):
+        self.assertEqual(self.policy.delay(ExitCat["AbortedCommand"], None,
+                                           0, idempotent=False), None)
+        self.assertEqual(self.policy.delay(ExitCat["Busy"], None,
+                                           0, idempotent=False), 0.001)
+
+    def testParse(self):
+        policy = parsePolicy("unit-attention=0, busy=1")
+        self.assertEqual(policy.delay(ExitCat["UnitAttention"], None, 0),
+                         None)
+        self.assertEqual(policy.classes["busy"].retries, 1)
+        self.assertEqual(policy.classes["busy"].max_ms, 100)
+        none = parsePolicy("none")
+        self.assertEqual(none.delay(ExitCat["Busy"], None, 0), None)
+        self.assertRaises(ValueError, parsePolicy, "flaky=3")
+
+################################################################
+
+class test02InitiatorRetryTestCase(unittest.TestCase):
+    """Test Initiator operations following the policy"""
+
+    def setUp(self):
+        (self.init, self.fake) = makeInitiator()
+        self.saved = retry.policy
+
+    def tearDown(self):
+        retry.policy = self.saved
+
+    def testBusyRetried(self):
+        self.fake.reply(status=0x8)
+        self.fake.reply(status=0x28)
+        self.fake.reply()
+        self.assertEqual(self.init.register(), 0)
+        self.assertEqual(self.init.retries, 2)
+        self.assertTrue(self.init.retry_ns >= 3000000)
+
+    def testGivesUp(self):
+        retry.policy = parsePolicy("busy=2:0")
+        for i in range(3):
+            self.fake.reply(status=0x8)
+        self.assertEqual(self.init.register(), ExitCat["Busy"])
+        self.assertEqual(len(self.fake.requests), 3)
+
+    def testAbortedProutNotRetried(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0xb, 0x47, 0x00))
+        self.assertEqual(self.init.clear(), ExitCat["AbortedCommand"])
+        self.assertEqual(len(self.fake.requests), 1)
+
+    def testAbortedPrinRetried(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0xb, 0x47, 0x00))
+        self.fake.reply(data="\0\0\0\1\0\0\0\0")
+        self.assertEqual(self.init.getRegistrants(), [])
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def testOnlyBecomingReadyRetried(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0x2, 0x04, 0x01))
+        self.fake.reply()
+        self.assertEqual(self.init.register(), 0)
+        self.assertEqual(len(self.fake.requests), 2)
+        # medium not present: it would only fail again
+        self.fake.reply(status=0x2, sense=fixedSense(0x2, 0x3a, 0x00))
+        res = self.init.register()
+        self.assertEqual(res, ExitCat["NotReady"])
+        self.assertTrue(res.senseIs(SenseKeys["NotReady"], 0x3a))
+        self.assertEqual(len(self.fake.requests), 3)
+
+    def testConflictNotRetried(self):
+        self.fake.reply(status=0x18)
+        self.assertEqual(self.init.reserve("1"), ExitCat["ResConflict"])
+        self.assertEqual(len(self.fake.requests), 1)
@@ -0,0 +1,262 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the native SG_IO transport against a fake ioctl
+ layer, so it does not need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import ctypes
+import errno
+import struct
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.initiator import Initiator
+from support.reservation import ProutTypes
+from support.sense import CmdResult, Sense, ScsiStatus, resultFromExit, \
+     resultToWire, resultFromWire
+from support.sgio import SG_IO, SG_DXFER_NONE, SG_DXFER_TO_DEV, \
+     SG_DXFER_FROM_DEV, PrInSa, PrOutSa, prInCdb, prOutCdb, prOutParams
+from support.transport import SgIoTransport
+
+################################################################
+
+class FakeIoctl:
+    """Stands in for fcntl.ioctl(fd, SG_IO, hdr), recording each
+    request and answering it with the next queued reply"""
+    def __init__(self):
+        self.requests = []
+        self.replies = []
+
+    def reply(self, status=0, data=None, sense=None):
+        self.replies.append((status, data, sense))
+
+    def __call__(self, fd, req, hdr):
+        assert req == SG_IO
+        cdb = ctypes.string_at(hdr.cmdp, hdr.cmd_len)
+        data_out = None
+        if hdr.dxfer_direction == SG_DXFER_TO_DEV:
+            data_out = ctypes.string_at(hdr.dxferp, hdr.dxfer_len)
+        self.requests.append((cdb, hdr.dxfer_direction, data_out))
+        if not self.replies:
+            raise IOError(errno.EIO, "no reply queued")
+        (status, data, sense) = self.replies.pop(0)
+        hdr.status = status
+        if data is not None:
+            n = min(len(data), hdr.dxfer_len)
+            ctypes.memmove(hdr.dxferp, data, n)
+            hdr.resid = hdr.dxfer_len - n
+        if sense is not None:
+            ctypes.memmove(hdr.sbp, sense, len(sense))
+            hdr.sb_len_wr = len(sense)
+            hdr.driver_status = 0x8
+
+def fixedSense(key, asc, ascq):
+    """Build fixed format sense data"""
+    return struct.pack(">BxBxxxxBxxxxBB4x", 0x70, key, 10, asc, ascq)
+
+def makeInitiator(key="0x123abc"):
+    fake = FakeIoctl()
+    init = Initiator("/dev/fake", key,
+                     transport=SgIoTransport("/dev/fake", ioctl=fake))
+    init.transport.sg.fd = 99
+    return (init, fake)
+
+################################################################
+
+class test01CdbTestCase(unittest.TestCase):
+    """Test building CDBs and parameter data"""
+
+    def testPrInCdb(self):
+        cdb = prInCdb(PrInSa["ReadReservation"], 0x2000)
+        self.assertEqual(cdb, "\x5e\x01\x00\x00\x00\x00\x00\x20\x00\x00")
+
+    def testPrOutCdb(self):
+        cdb = prOutCdb(PrOutSa["Reserve"], 3)
+        self.assertEqual(cdb, "\x5f\x01\x03\x00\x00\x00\x00\x00\x18\x00")
+
+    def testPrOutParams(self):
+        params = prOutParams(0x123abc, 0x696969, aptpl=True)
+        self.assertEqual(len(params), 24)
+        self.assertEqual(struct.unpack(">QQ", params[:16]),
+                         (0x123abc, 0x696969))
+        self.assertEqual(ord(params[20]), 1)
+
+################################################################
+
+class test02PrOutTestCase(unittest.TestCase):
+    """Test sending PR OUT commands over SG_IO"""
+
+    def setUp(self):
+        (self.init, self.fake) = makeInitiator()
+
+    def testRegister(self):
+        self.fake.reply()
+        self.assertEqual(self.init.register(), 0)
+        (cdb, direction, data_out) = self.fake.requests[0]
+        self.assertEqual(cdb, prOutCdb(PrOutSa["Register"]))
+        self.assertEqual(direction, SG_DXFER_TO_DEV)
+        self.assertEqual(data_out, prOutParams(0, 0x123abc))
+
+    def testReserve(self):
+        self.fake.reply()
+        res = self.init.reserve(ProutTypes["WriteExclusive"])
+        self.assertEqual(res, 0)
+        (cdb, direction, data_out) = self.fake.requests[0]
+        self.assertEqual(cdb, prOutCdb(PrOutSa["Reserve"], 1))
+        self.assertEqual(data_out, prOutParams(0x123abc, 0))
+
+    def testReservationConflict(self):
+        self.fake.reply(status=0x18)
+        res = self.init.clear()
+        self.assertEqual(res, 24)
+        self.assertTrue(res.isConflict())
+        self.assertEqual((res.status, res.sense), (0x18, None))
+        self.assertTrue(res.elapsed_ns >= 0)
+
+    def testUnitAttentionRetried(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0x6, 0x2a, 0x03))
+        self.fake.reply()
+        self.assertEqual(self.init.unregister(), 0)
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def testTurReportsUnitAttention(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0x6, 0x2a, 0x03))
+        res = self.init.runTur()
+        self.assertEqual(res, 6)
+        self.assertEqual(res.status, ScsiStatus["CheckCondition"])
+        self.assertTrue(res.senseIs(0x6, 0x2a, 0x03))
+        self.assertFalse(res.senseIs(0x6, 0x29))
+        self.assertTrue(self.init.last_result is res)
+
+    def testIoctlFails(self):
+        res = self.init.runTur()
+        self.assertEqual(res, 99)
+        self.assertEqual(self.fake.requests[0][1], SG_DXFER_NONE)
+        self.assertEqual((res.status, res.errno), (None, errno.EIO))
+        self.assertTrue(res.isTransportError())
+        self.assertFalse(res.isConflict())
+
+    def testResultFromExit(self):
+        self.assertTrue(resultFromExit(24).isConflict())
+        self.assertEqual(resultFromExit(6).status,
+                         ScsiStatus["CheckCondition"])
+        self.assertEqual(resultFromExit(99).status, None)
+        self.assertTrue(resultFromExit(33).isTimeout())
+
+    def testResultOverTheWire(self):
+        res = CmdResult(6, 0x2, Sense(0x6, 0x2a, 0x03), driver_status=0x8,
+                        elapsed_ns=1000)
+        wire = resultFromWire(resultToWire(res))
+        self.assertEqual(repr(wire), repr(res))
+        self.assertEqual(wire.result, 6)
+        # as older transcripts have it
+        self.assertTrue(resultFromWire(24).isConflict())
+
+################################################################
+
+class test03PrInTestCase(unittest.TestCase):
+    """Test reading PR IN data over SG_IO"""
+
+    def setUp(self):
+        (self.init, self.fake) = makeInitiator()
+
+    def testReadNoKeys(self):
+        self.fake.reply(data=struct.pack(">II", 4, 0))
+        self.assertEqual(self.init.getRegistrants(), [])
+        (cdb, direction, data_out) = self.fake.requests[0]
+        self.assertEqual(ord(cdb[1]), PrInSa["ReadKeys"])
+        self.assertEqual(direction, SG_DXFER_FROM_DEV)
+
+    def testReadKeys(self):
+        self.fake.reply(data=struct.pack(">IIQQ", 4, 16, 0x123abc, 0x696969))
+        self.assertEqual(self.init.getRegistrants(), ["0x123abc", "0x696969"])
+
+    def testReadReservation(self):
+        self.fake.reply(data=struct.pack(">IIQ4xBBxx", 4, 16, 0x123abc, 0, 3))
+        rr = self.init.getReservation()
+        self.assertEqual(rr.key, "0x123abc")
+        self.assertEqual(rr.getRtypeNum(), ProutTypes["ExclusiveAccess"])
+
+    def testReadNoReservation(self):
+        self.fake.reply(data=struct.pack(">II", 4, 0))
+        rr = self.init.getReservation()
+        self.assertEqual(rr.key, None)
+        self.assertEqual(rr.rtype, None)
+
+    def testReadReservationRetriesUnitAttention(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0x6, 0x2a, 0x04))
+        self.fake.reply(data=struct.pack(">IIQ4xBBxx", 5, 16, 0, 0, 8))
+        rr = self.init.getReservation()
+        self.assertEqual(rr.key, "0x0")
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def testInquirySerialNumber(self):
+        self.fake.reply(data="\x00\x80\x00\x08 SN1234\0")
+        self.assertEqual(self.init.getDiskInquirySn(), "SN1234")
+
+################################################################
+
+def statusDescriptor(key, holder=False, rtype=0):
+    """Build a READ FULL STATUS descriptor (without a TransportID)"""
+    return struct.pack(">Q4xBB4xHI", key, holder and 1 or 0, rtype, 1, 0)
+
+def fullStatus(gen, *descs):
+    """Build READ FULL STATUS data"""
+    data = "".join(descs)
+    return struct.pack(">II", gen, len(data)) + data
+
+class test04SnapshotTestCase(unittest.TestCase):
+    """Test getting a PR state snapshot"""
+
+    def setUp(self):
+        (self.init, self.fake) = makeInitiator()
+
+    def testSnapshot(self):
+        self.fake.reply(data=fullStatus(9,
+                                        statusDescriptor(0x123abc, True, 1),
+                                        statusDescriptor(0x696969)))
+        snap = self.init.snapshot()
+        self.assertEqual(len(self.fake.requests), 1)
+        self.assertEqual(ord(self.fake.requests[0][0][1]),
+                         PrInSa["ReadFullStatus"])
+        self.assertEqual(snap.generation, 9)
+        self.assertEqual(snap.registrants, ("0x123abc", "0x696969"))
+        self.assertEqual(snap.key, "0x123abc")
+        self.assertEqual(snap.getRtypeNum(), ProutTypes["WriteExclusive"])
+        self.assertTrue(snap.isRegistered("0x696969"))
+        self.assertRaises(AttributeError, setattr, snap, "key", None)
+
+    def testSnapshotNoReservation(self):
+        self.fake.reply(data=fullStatus(2, statusDescriptor(0x123abc)))
+        snap = self.init.snapshot()
+        self.assertEqual(snap.key, None)
+        self.assertEqual(snap.rtype, None)
+
+    def testSnapshotAllRegistrants(self):
+        self.fake.reply(data=fullStatus(3,
+                                        statusDescriptor(0x123abc, True, 8),
+                                        statusDescriptor(0x696969, True, 8)))
+        snap = self.init.snapshot()
+        self.assertEqual(snap.key, "0x0")
+        self.assertEqual(snap.getRtypeNum(),
+                         ProutTypes["ExclusiveAccessAllRegistrants"])
+
+    def testSnapshotWithoutReadFullStatus(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0x5, 0x24, 0x00))
+        self.fake.reply(data=struct.pack(">IIQ", 4, 8, 0x123abc))
+        self.fake.reply(data=struct.pack(">IIQ4xBBxx", 4, 16, 0x123abc, 0, 3))
+        snap = self.init.snapshot()
+        self.assertEqual(len(self.fake.requests), 3)
+        self.assertEqual(snap.registrants, ("0x123abc",))
+        self.assertEqual(snap.key, "0x123abc")
+        self.assertEqual(snap.getRtypeNum(), ProutTypes["ExclusiveAccess"])
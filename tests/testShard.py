@@ -0,0 +1,95 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests running test modules in parallel across a pool of
+ LUNs, using scratch test modules, so it does not need root access or
+ a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import time
+import shutil
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.shard import parsePool, runShards, formatShardReport
+
+################################################################
+
+# a scratch module: its test passes only on the LUN it expects
+scratch_module = '''
+import os
+import time
+import unittest
+
+class testLunTestCase(unittest.TestCase):
+    def testOnLun(self):
+        time.sleep(0.3)
+        self.assertTrue(os.environ["PGR_DEVICES"].startswith("%s"))
+'''
+
+crash_module = '''
+import sys
+import unittest
+
+def setUpModule():
+    sys.stderr.write("Fatal: no devices")
+    sys.exit(1)
+
+class testNeverTestCase(unittest.TestCase):
+    def testNever(self):
+        pass
+'''
+
+################################################################
+
+class test01ShardTestCase(unittest.TestCase):
+    """Test running modules across a pool of LUNs"""
+
+    def setUp(self):
+        self.testdir = tempfile.mkdtemp()
+        for (name, text) in (("testA", scratch_module % "/dev/a"),
+                             ("testB", scratch_module % "/dev/"),
+                             ("testWrong", scratch_module % "/dev/x"),
+                             ("testCrash", crash_module)):
+            f = open(os.path.join(self.testdir, name + ".py"), "w")
+            f.write(text)
+            f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.testdir)
+
+    def testParsePool(self):
+        self.assertEqual(parsePool("/dev/a,/dev/b; /dev/c /dev/d;"),
+                         [["/dev/a", "/dev/b"], ["/dev/c", "/dev/d"]])
+
+    def testRunsInParallel(self):
+        start = time.time()
+        summaries = runShards([["/dev/a1", "/dev/a2"], ["/dev/b1"]],
+                              ["testB", "testB", "testB", "testB"],
+                              testdir=self.testdir)
+        self.assertTrue(time.time() - start < 1.0)
+        self.assertEqual([s["ran"] for s in summaries], [1, 1, 1, 1])
+        self.assertTrue("OK" in formatShardReport(summaries, 0.7))
+
+    def testMergedFailures(self):
+        summaries = runShards([["/dev/a"]],
+                              ["testA", "testWrong", "testCrash"],
+                              testdir=self.testdir)
+        (a, wrong, crash) = summaries
+        self.assertEqual((a["ran"], a["failures"]), (1, []))
+        self.assertEqual(wrong["failures"][0][0],
+                         "testWrong.testLunTestCase.testOnLun")
+        self.assertEqual(crash["ran"], 0)
+        self.assertTrue("no devices" in crash["errors"][0][1])
+        self.assertTrue("FAILED" in formatShardReport(summaries, 1.0))
@@ -0,0 +1,215 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests access sweeps across a LUN, using a scratch file
+ and an emulated target, so it does not need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import errno
+import shutil
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import config, sweep
+from support.sweep import Region, SweepResult, parseLbas, sweepPlan
+from support.probe import DirectIoEngine, ProbeResult, SWEEP_CHUNK
+from support.worker import Worker, WorkerIoEngine
+from support.emulator import PrTarget
+from testEmulator import makeTrio, WE
+
+################################################################
+
+LUN_BLOCKS = 768                        # 3 MiB
+
+class LeakyTarget(PrTarget):
+    """A target that lets anyone write to the first block"""
+    def mayAccess(self, nexus, write):
+        return PrTarget.mayAccess(self, nexus, write) or self.first
+
+    def access(self, nexus, write, lba, nblocks, data=None):
+        self.first = lba == 0
+        return PrTarget.access(self, nexus, write, lba, nblocks, data)
+
+################################################################
+
+class test01PlanTestCase(unittest.TestCase):
+    """Test choosing the regions to sweep"""
+
+    def testCoversLun(self):
+        plan = sweepPlan(1 << 20, nrandom=4, plan_seed=1, lbas=[])
+        byname = dict([(r.name, r) for r in plan])
+        self.assertEqual(byname["first"], Region("first", 0, 1))
+        self.assertEqual(byname["last"], Region("last", (1 << 20) - 1, 1))
+        self.assertEqual(byname["large-end"].lba + byname["large-end"].nblocks,
+                         1 << 20)
+        self.assertEqual(byname["large-middle"].nblocks * 4096, 4 << 20)
+        self.assertEqual(len(plan), 8)
+        for r in plan:
+            self.assertTrue(0 <= r.lba and r.lba + r.nblocks <= 1 << 20)
+
+    def testSmallLun(self):
+        for r in sweepPlan(100, nrandom=20, plan_seed=2, lbas=[(500, 8)]):
+            self.assertTrue(0 <= r.lba and r.lba + r.nblocks <= 100)
+
+    def testSameSeedSamePlan(self):
+        self.assertEqual(sweepPlan(1 << 20, nrandom=8, plan_seed=3),
+                         sweepPlan(1 << 20, nrandom=8, plan_seed=3))
+
+    def testGivenLbas(self):
+        self.assertEqual(parseLbas("0, 1000:256,-1"),
+                         [(0, 1), (1000, 256), (-1, 1)])
+        plan = sweepPlan(1000, nrandom=0, lbas=[(-8, 8)])
+        self.assertEqual(plan[-1], Region("lba-992", 992, 8))
+        self.assertRaises(ValueError, parseLbas, "10:many")
+
+    def testResult(self):
+        regions = [Region("a", 0, 1), Region("b", 1, 1)]
+        ok = ProbeResult()
+        bad = ProbeResult(errno=5)
+        self.assertEqual(SweepResult(regions, [ok, ok]).result, 0)
+        self.assertEqual(SweepResult(regions, [bad, bad]).result, 1)
+        res = SweepResult(regions, [ok, bad])
+        self.assertEqual(res.result, 2)
+        self.assertEqual(res.denied(), [regions[1]])
+
+    def testStatus(self):
+        regions = [Region("a", 0, 1), Region("b", 1, 1)]
+        ok = ProbeResult()
+        conflict = ProbeResult(errno=errno.EBADE)
+        timeout = ProbeResult(errno=errno.ETIMEDOUT)
+        res = SweepResult(regions, [conflict, conflict])
+        self.assertTrue(res.isConflict())
+        self.assertEqual(res.status, 0x18)
+        self.assertEqual(res.sense, None)
+        res = SweepResult(regions, [ok, conflict])
+        self.assertFalse(res.isConflict())
+        self.assertEqual(res.status, 0x18)
+        self.assertEqual(SweepResult(regions, [ok, ok]).status, 0)
+        res = SweepResult(regions, [conflict, timeout])
+        self.assertFalse(res.isConflict())
+        self.assertTrue(res.isTimeout())
+        self.assertFalse(SweepResult(regions, [ok, conflict]).isTimeout())
+
+################################################################
+
+class test02VectoredTestCase(unittest.TestCase):
+    """Test sweeping a scratch file with vectored I/O"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "lun")
+        f = open(self.path, "wb")
+        f.write("\xff" * LUN_BLOCKS * 4096)
+        f.close()
+        self.engine = DirectIoEngine(self.path)
+
+    def tearDown(self):
+        self.engine.close()
+        shutil.rmtree(self.tmpdir)
+
+    def contents(self):
+        f = open(self.path, "rb")
+        data = f.read()
+        f.close()
+        return data
+
+    def testCapacity(self):
+        self.assertEqual(self.engine.capacity(), LUN_BLOCKS)
+
+    def testLargeRead(self):
+        # larger than the buffer, so done with several iovecs
+        nblocks = 2 * SWEEP_CHUNK / 4096 + 3
+        (res,) = self.engine.sweep([(10, nblocks)])
+        self.assertEqual(res.result, 0)
+        self.assertEqual(res.nbytes, nblocks * 4096)
+
+    def testWrite(self):
+        results = self.engine.sweep([(0, 1), (300, 300), (LUN_BLOCKS - 1, 1)],
+                                    write=True)
+        self.assertEqual([r.result for r in results], [0, 0, 0])
+        data = self.contents()
+        self.assertEqual(data[:4096], "\0" * 4096)
+        self.assertEqual(data[4096:8192], "\xff" * 4096)
+        self.assertEqual(data[300 * 4096:600 * 4096], "\0" * 300 * 4096)
+        self.assertEqual(data[-4096:], "\0" * 4096)
+
+    def testWritesZerosAfterRead(self):
+        self.engine.sweep([(0, 1)])
+        self.engine.sweep([(5, 1)], write=True)
+        self.assertEqual(self.contents()[5 * 4096:6 * 4096], "\0" * 4096)
+
+    def testPastEnd(self):
+        results = self.engine.sweep([(0, 1), (LUN_BLOCKS - 1, 2)])
+        self.assertEqual([r.result for r in results], [0, 1])
+
+    def testOneDescriptor(self):
+        self.engine.sweep([(0, 1)])
+        fd = self.engine.fd
+        self.engine.sweep([(1, 1)], write=True)
+        self.assertEqual(self.engine.fd, fd)
+
+    def testWorker(self):
+        worker = Worker(self.path)
+        try:
+            io = WorkerIoEngine(self.path, worker=worker)
+            self.assertEqual(io.capacity(), LUN_BLOCKS)
+            results = io.sweep([(0, 1), (LUN_BLOCKS, 1)])
+            self.assertEqual([r.result for r in results], [0, 1])
+        finally:
+            worker.close()
+
+################################################################
+
+class test03InitiatorSweepTestCase(unittest.TestCase):
+    """Test initiators sweeping an emulated target"""
+
+    def setUp(self):
+        self.saved = config.access_sweep
+        config.access_sweep = True
+        sweep.summary.clear()
+        sweep.mixed.clear()
+
+    def tearDown(self):
+        config.access_sweep = self.saved
+        sweep.summary.clear()
+        sweep.mixed.clear()
+
+    def reserve(self, target=None):
+        (target, a, b, c) = makeTrio(target)
+        self.assertEqual(a.register(), 0)
+        self.assertEqual(a.reserve(WE), 0)
+        return (a, b, c)
+
+    def testEnforced(self):
+        (a, b, c) = self.reserve()
+        self.assertEqual(a.writeToTarget().result, 0)
+        self.assertEqual(b.readFromTarget().result, 0)
+        res = b.writeToTarget()
+        self.assertEqual(res.result, 1)
+        self.assertTrue(res.isConflict())
+        self.assertEqual(len(res.denied()), len(b.sweepRegions()))
+        self.assertEqual(sweep.mixed, {})
+
+    def testPartlyEnforced(self):
+        (a, b, c) = self.reserve(LeakyTarget())
+        res = c.writeToTarget()
+        self.assertEqual(res.result, 2)
+        self.assertEqual([r.name for r in res.allowed()], ["first"])
+        self.assertEqual(sweep.mixed, {(c.dev, "write") : 1})
+        self.assertTrue("first (lba 0+1): allowed 1, denied 0" in
+                        sweep.formatSummary())
+
+    def testSameRegions(self):
+        (a, b, c) = self.reserve()
+        self.assertEqual(a.sweepRegions(), c.sweepRegions())
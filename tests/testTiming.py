@@ -0,0 +1,86 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests per-command timing instrumentation, against a fake
+ ioctl layer, so it does not need root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import timing
+from support.cmd import runCmdWithOutput
+from testSgIo import makeInitiator, fixedSense
+
+################################################################
+
+class test01TimingTestCase(unittest.TestCase):
+    """Test recording command timing"""
+
+    def setUp(self):
+        timing.reset()
+        timing.enable()
+        (self.init, self.fake) = makeInitiator()
+
+    def tearDown(self):
+        timing.enable(False)
+        timing.setTest(None)
+        timing.reset()
+        del timing.hooks[:]
+
+    def testRecordsOperation(self):
+        timing.setTest("testA")
+        self.fake.reply(status=0x18)
+        self.assertEqual(self.init.reserve("1"), 24)
+        rec = timing.records[-1]
+        self.assertEqual((rec.test, rec.kind, rec.op), ("testA", "op",
+                                                        "RESERVE"))
+        self.assertEqual((rec.dev, rec.key), ("/dev/fake", "0x123abc"))
+        self.assertEqual(rec.result, 24)
+        self.assertTrue(rec.end >= rec.start)
+
+    def testRecordsRetries(self):
+        self.fake.reply(status=0x2, sense=fixedSense(0x6, 0x2a, 0x03))
+        self.fake.reply(data="\0\0\0\x04\0\0\0\0")
+        self.init.getReservation()
+        rec = timing.records[-1]
+        self.assertEqual((rec.op, rec.retries, rec.result),
+                         ("READ RESERVATION", 1, None))
+
+    def testRecordsChildProcess(self):
+        timing.setTest("testB")
+        runCmdWithOutput(["true", "/dev/fake"])
+        rec = timing.records[-1]
+        self.assertEqual((rec.kind, rec.op, rec.dev, rec.result),
+                         ("cmd", "true", "/dev/fake", 0))
+
+    def testHook(self):
+        seen = []
+        timing.addHook(seen.append)
+        self.fake.reply()
+        self.init.runTur()
+        self.assertEqual([r.op for r in seen], ["TEST UNIT READY"])
+
+    def testReport(self):
+        timing.setTest("testC")
+        self.fake.reply()
+        self.init.clear()
+        timing.setTest(None, 5000000)
+        report = timing.formatReport()
+        self.assertTrue("testC: wall 5.000ms" in report)
+        self.assertTrue("CLEAR" in report)
+
+    def testDisabled(self):
+        timing.enable(False)
+        self.fake.reply()
+        self.init.register()
+        self.assertEqual(timing.records, [])
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests recording commands to a transcript and replaying
+ them, using the emulated target, so it does not need root access or
+ a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import config, sweep
+from support.clock import monotonicNs
+from support.emulator import PrTarget, EmulatorTransport, EmulatorIoEngine
+from support.initiator import Initiator
+from support.reservation import ProutTypes
+from support.transcript import ReplayMismatch, TranscriptWriter, \
+     TranscriptReader, RecordingTransport, RecordingIoEngine, \
+     ReplayTransport, ReplayIoEngine
+
+################################################################
+
+WE = ProutTypes["WriteExclusive"]
+
+def recordingInitiator(target, writer, dev, key):
+    return Initiator(dev, key,
+                     transport=RecordingTransport(
+                         EmulatorTransport(dev, target), writer),
+                     io=RecordingIoEngine(
+                         EmulatorIoEngine(dev, target=target), writer))
+
+def replayInitiator(reader, dev, key):
+    return Initiator(dev, key,
+                     transport=ReplayTransport(dev, reader),
+                     io=ReplayIoEngine(dev, reader))
+
+def session(a, b):
+    """Some commands to record and replay"""
+    return [a.register(), b.register(), a.reserve(WE),
+            b.writeToTarget().result, b.readFromTarget().result,
+            b.getReservation().key, a.snapshot().registrants,
+            a.getDiskInquirySn()]
+
+################################################################
+
+class test01TranscriptTestCase(unittest.TestCase):
+    """Test recording and replaying a transcript"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "transcript")
+        self.saved_timing = config.replay_timing
+
+    def tearDown(self):
+        config.replay_timing = self.saved_timing
+        shutil.rmtree(self.dir)
+
+    def record(self):
+        writer = TranscriptWriter(self.path)
+        target = PrTarget()
+        a = recordingInitiator(target, writer, "/dev/emuA", "0x123abc")
+        b = recordingInitiator(target, writer, "/dev/emuB", "0x696969")
+        outcome = session(a, b)
+        writer.close()
+        return outcome
+
+    def testReplay(self):
+        recorded = self.record()
+        self.assertEqual(recorded[3], 1)        # the write conflicted
+        reader = TranscriptReader(self.path)
+        a = replayInitiator(reader, "/dev/emuA", "0x123abc")
+        b = replayInitiator(reader, "/dev/emuB", "0x696969")
+        self.assertEqual(session(a, b), recorded)
+        self.assertEqual(reader.remaining(),
+                         {"/dev/emuA" : 0, "/dev/emuB" : 0})
+
+    def testResultsKeepStatus(self):
+        writer = TranscriptWriter(self.path)
+        a = recordingInitiator(PrTarget(), writer, "/dev/emuA", "0x123abc")
+        self.assertTrue(a.reserve(WE).isConflict())
+        writer.close()
+        a = replayInitiator(TranscriptReader(self.path), "/dev/emuA",
+                            "0x123abc")
+        res = a.reserve(WE)
+        self.assertEqual(res, 24)
+        self.assertTrue(res.isConflict())
+
+    def readLines(self):
+        f = open(self.path)
+        try:
+            return [json.loads(l) for l in f]
+        finally:
+            f.close()
+
+    def testAppends(self):
+        self.record()
+        first = len(self.readLines())
+        self.record()
+        lines = self.readLines()
+        self.assertEqual(len(lines), 2 * first)
+        self.assertEqual(len([l for l in lines if isinstance(l, dict)]), 2)
+
+    def testSweepSeedReused(self):
+        self.record()
+        self.assertEqual(TranscriptReader(self.path).header("sweep_seed"),
+                         sweep.seed)
+        saved = (config.replay, config.sweep_seed)
+        (config.replay, config.sweep_seed) = (self.path, "")
+        try:
+            self.assertEqual(sweep.chooseSeed(), sweep.seed)
+        finally:
+            (config.replay, config.sweep_seed) = saved
+
+    def testMismatch(self):
+        self.record()
+        reader = TranscriptReader(self.path)
+        a = replayInitiator(reader, "/dev/emuA", "0x123abc")
+        self.assertRaises(ReplayMismatch, a.reserve, WE)
+
+    def testNotRecorded(self):
+        self.record()
+        reader = TranscriptReader(self.path)
+        c = replayInitiator(reader, "/dev/emuC", None)
+        self.assertRaises(ReplayMismatch, c.runTur)
+
+    def testTiming(self):
+        f = open(self.path, "w")
+        f.write('["/dev/emuA","tur",[],0,50000000]\n')
+        f.close()
+        config.replay_timing = True
+        reader = TranscriptReader(self.path)
+        trans = ReplayTransport("/dev/emuA", reader)
+        start = monotonicNs()
+        self.assertEqual(trans.tur(), 0)
+        self.assertTrue(monotonicNs() - start >= 40000000)
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests tracking which initiators may have a Unit
+ Attention pending, using the emulated target, so it does not need
+ root access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.reservation import ProutTypes
+from support.sense import ExitCat
+from support.ua import tracker
+from testEmulator import makeTrio
+
+################################################################
+
+WE = ProutTypes["WriteExclusive"]
+WERO = ProutTypes["WriteExclusiveRegistrantsOnly"]
+
+class test01UaTrackerTestCase(unittest.TestCase):
+    """Test sending TURs only when a Unit Attention is expected"""
+
+    def setUp(self):
+        (self.target, self.a, self.b, self.c) = makeTrio()
+        tracker.reset()
+        self.a.register()
+        self.b.register()
+
+    def testNothingExpected(self):
+        self.assertEqual(self.b.clearUa(), 0)
+        self.assertEqual(tracker.turs_saved, 1)
+        self.assertEqual(tracker.turs_sent, 0)
+
+    def testPreempt(self):
+        self.a.reserve(WE)
+        self.b.preempt(self.a.key, WE)
+        self.assertTrue(tracker.isExpected(self.a.dev))
+        self.assertFalse(tracker.isExpected(self.b.dev))
+        self.assertEqual(self.a.clearUa(), 0)
+        self.assertEqual(tracker.seen, 1)
+        self.assertFalse(tracker.isExpected(self.a.dev))
+
+    def testClear(self):
+        self.a.clear()
+        self.assertTrue(tracker.isExpected(self.b.dev))
+        self.b.clearUa()
+        # the UA was there, and the TUR after it found no more
+        self.assertEqual(tracker.seen, 1)
+        self.assertEqual(tracker.turs_sent, 2)
+
+    def testReleaseOnlyTellsForRegistrantsOnly(self):
+        self.a.reserve(WE)
+        self.a.release(WE)
+        self.assertFalse(tracker.isExpected(self.b.dev))
+        self.a.reserve(WERO)
+        self.a.release(WERO)
+        self.assertTrue(tracker.isExpected(self.b.dev))
+
+    def testHolderUnregisters(self):
+        self.a.reserve(WERO)
+        self.a.unregister()
+        self.assertTrue(tracker.isExpected(self.b.dev))
+        self.assertEqual(self.b.clearUa(), 0)
+        self.assertEqual(self.target.uas.get(self.b.dev), [])
+
+    def testSeenFromCommand(self):
+        self.a.clear()
+        tracker.reset()
+        self.assertEqual(self.b.runTur(), ExitCat["UnitAttention"])
+        self.assertTrue(tracker.isExpected(self.b.dev))
+
+    def testSeenFromSense(self):
+        self.a.clear()
+        tracker.reset()
+        self.b.runTur()
+        self.assertEqual(tracker.causes, {(0x2a, 0x03): 1})
+
+    def testIoConsumes(self):
+        self.a.clear()
+        self.b.readFromTarget()
+        self.assertFalse(tracker.isExpected(self.b.dev))
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests waiting for PR state to be seen from every
+ initiator, against a fake ioctl layer, so it does not need root
+ access or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import struct
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support import visibility
+from support.reservation import ProutTypes
+from support.visibility import VisibilityTimeout, waitForReservation, \
+     waitForNoReservation
+from testSgIo import makeInitiator, fixedSense
+
+################################################################
+
+def noReservation(gen=1):
+    return struct.pack(">II", gen, 0)
+
+def reservation(key, rtype, gen=2):
+    return struct.pack(">IIQ4xBBxx", gen, 16, key, 0, rtype)
+
+################################################################
+
+class test01VisibilityTestCase(unittest.TestCase):
+    """Test polling for PR state"""
+
+    def setUp(self):
+        (self.initA, self.fakeA) = makeInitiator("0x123abc")
+        (self.initB, self.fakeB) = makeInitiator("0x696969")
+
+    def testSeenAtOnce(self):
+        self.fakeA.reply(data=reservation(0x123abc, 1))
+        self.fakeB.reply(data=reservation(0x123abc, 1))
+        elapsed = waitForReservation([self.initA, self.initB], "0x123abc",
+                                     ProutTypes["WriteExclusive"])
+        self.assertEqual(len(self.fakeA.requests), 1)
+        self.assertEqual(len(self.fakeB.requests), 1)
+        self.assertEqual(visibility.propagation[-1][1], elapsed)
+
+    def testPollsUntilSeen(self):
+        self.fakeA.reply(data=reservation(0x123abc, 1))
+        self.fakeB.reply(data=noReservation())
+        self.fakeB.reply(status=0x2, sense=fixedSense(0x6, 0x2a, 0x03))
+        self.fakeB.reply(data=reservation(0x123abc, 1))
+        waitForReservation([self.initA, self.initB], "0x123abc",
+                           ProutTypes["WriteExclusive"])
+        # only the initiator that had not seen it is polled again
+        self.assertEqual(len(self.fakeA.requests), 1)
+        self.assertEqual(len(self.fakeB.requests), 3)
+
+    def testWrongTypeNotSeen(self):
+        self.fakeA.reply(data=reservation(0x123abc, 3))
+        self.assertRaises(VisibilityTimeout, waitForReservation,
+                          [self.initA], "0x123abc",
+                          ProutTypes["WriteExclusive"], 0.05)
+
+    def testNoReservation(self):
+        self.fakeA.reply(data=noReservation())
+        waitForNoReservation([self.initA])
+        self.assertEqual(len(self.fakeA.requests), 1)
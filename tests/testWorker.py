@@ -0,0 +1,81 @@
+#!/usr/bin/python
+"""
+Python tests for SCSI-3 Persistent Group Reservations
+
+Description:
+ This module tests the long-lived per-device command worker, using a
+ scratch file in place of the target, so it does not need root access
+ or a target.
+"""
+
+
+__author__ = "Lee Duncan <leeman.duncan@gmail.com>"
+
+
+import sys
+import os
+import errno
+import shutil
+import tempfile
+if sys.version_info < (2, 7):
+    import unittest2 as unittest
+else:
+    import unittest
+
+from support.worker import Worker, WorkerError, WorkerTransport, \
+     WorkerIoEngine
+
+################################################################
+
+class test01WorkerTestCase(unittest.TestCase):
+    """Test running commands in a worker process"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "lun")
+        f = open(self.path, "wb")
+        f.write("\0" * 4 * 4096)
+        f.close()
+        self.worker = Worker(self.path)
+
+    def tearDown(self):
+        self.worker.close()
+        shutil.rmtree(self.tmpdir)
+
+    def testCanReadAndWrite(self):
+        io = WorkerIoEngine(self.path, worker=self.worker)
+        ret = io.write()
+        self.assertEqual(ret.result, 0)
+        self.assertEqual(ret.nbytes, 4096)
+        ret = io.read(lba=3)
+        self.assertEqual(ret.result, 0)
+        ret = io.read(lba=4)
+        self.assertEqual(ret.result, 1)
+
+    def testScsiCommandsFailOnFile(self):
+        # a plain file does not support SG_IO
+        trans = WorkerTransport(self.path, worker=self.worker)
+        res = trans.tur()
+        self.assertNotEqual(res, 0)
+        self.assertEqual(res.errno, errno.ENOTTY)
+        self.assertTrue(res.isTransportError())
+        self.assertEqual(trans.readReservation(), (99, None))
+
+    def testQueuedRequests(self):
+        for i in range(200):
+            self.worker.submit("read", i % 4, 1)
+        results = self.worker.collect()
+        self.assertEqual(len(results), 200)
+        self.assertEqual([r[0] for r in results], [0] * 200)
+
+    def testRestartedAfterDying(self):
+        self.worker.kill()
+        self.worker.proc.wait()
+        self.assertRaises(WorkerError, self.worker.call, "read", 0, 1)
+        # another worker takes its place
+        self.assertEqual(self.worker.call("read", 0, 1)[0], 0)
+
+    def testBadRequest(self):
+        self.assertRaises(WorkerError, self.worker.call, "nonesuch")
+        # the worker survives
+        self.assertEqual(self.worker.call("read", 0, 1)[0], 0)